@@ -0,0 +1,93 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Compares the makespan of a graph with a long chain of tasks and many
+short side branches, once with the ready tasks dispatched in tick order
+and once ordered by their critical-path priority::
+
+    python benchmarks/bench_critical_path.py [workers]
+
+The evaluation is simulated with the `eval_time` property of each task
+as its duration. No workers are started.
+"""
+
+import sys
+import heapq
+import logging
+
+from pydron.dataflow import graph
+from pydron.interpreter import scheduler
+
+
+def make_graph(side_tasks, chain_length):
+    """
+    Returns a graph with `side_tasks` independent tasks followed by
+    a chain of `chain_length` tasks. The side tasks have the lower ticks.
+    """
+    g = graph.Graph()
+    for i in range(1, side_tasks + 1):
+        tick = graph.START_TICK + i
+        g.add_task(tick, "side", {"eval_time": 1.0})
+        g.connect(graph.Endpoint(tick, "out"), graph.Endpoint(graph.FINAL_TICK, "side%s" % i))
+
+    previous = None
+    for i in range(side_tasks + 1, side_tasks + chain_length + 1):
+        tick = graph.START_TICK + i
+        g.add_task(tick, "chain", {"eval_time": 1.0})
+        if previous is not None:
+            g.connect(graph.Endpoint(previous, "out"), graph.Endpoint(tick, "in"))
+        previous = tick
+    g.connect(graph.Endpoint(previous, "out"), graph.Endpoint(graph.FINAL_TICK, "chain"))
+    return g
+
+
+def eval_time(g, tick):
+    return g.get_task_properties(tick)["eval_time"]
+
+
+def tick_order(g, ready):
+    return sorted(ready)
+
+
+def critical_path_order(g, ready):
+    priorities = scheduler.critical_path_priorities(g, ready, eval_time)
+    return sorted(ready, key=lambda tick: (-priorities[tick], tick))
+
+
+def simulate(g, workers, order):
+    """
+    Returns the makespan if the tasks of `g` are evaluated on `workers`
+    workers, starting the ready tasks in the sequence returned by `order`.
+    """
+    missing_inputs = {}
+    for tick in g.get_all_ticks():
+        missing_inputs[tick] = len(g.get_in_connections(tick))
+    ready = [tick for tick, count in missing_inputs.iteritems() if count == 0]
+
+    now = 0.0
+    running = []
+    while ready or running:
+        for tick in order(g, ready)[:workers - len(running)]:
+            ready.remove(tick)
+            heapq.heappush(running, (now + eval_time(g, tick), tick))
+
+        now, tick = heapq.heappop(running)
+        for _, dest in g.get_out_connections(tick):
+            if dest.tick == graph.FINAL_TICK:
+                continue
+            missing_inputs[dest.tick] -= 1
+            if missing_inputs[dest.tick] == 0:
+                ready.append(dest.tick)
+    return now
+
+
+def run(workers):
+    g = make_graph(side_tasks=40, chain_length=20)
+    return simulate(g, workers, tick_order), simulate(g, workers, critical_path_order)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARN)
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    by_tick, by_priority = run(workers)
+    print "makespan on %s workers: %.1f in tick order, %.1f in critical-path order" % (workers, by_tick, by_priority)
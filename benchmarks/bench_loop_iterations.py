@@ -0,0 +1,73 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Measures how long it takes to unroll the iterations of a `for` loop
+with a small body in the execution graph used by the traverser::
+
+    python benchmarks/bench_loop_iterations.py [iterations]
+
+The body corresponds to `s = s + x`. The tasks are not evaluated,
+only the refinements are measured.
+"""
+
+import ast
+import sys
+import time
+import logging
+
+from pydron.dataflow import graph, tasks
+from pydron.interpreter import executiongraph
+
+
+def make_body():
+    """
+    Returns the body graph of the loop.
+    """
+    body = graph.Graph()
+    add_tick = graph.START_TICK + 1
+    tail_tick = graph.START_TICK + 2
+    body.add_task(add_tick, tasks.BinOpTask(ast.Add()))
+    body.connect(graph.Endpoint(graph.START_TICK, "s"), graph.Endpoint(add_tick, "left"))
+    body.connect(graph.Endpoint(graph.START_TICK, "$target"), graph.Endpoint(add_tick, "right"))
+
+    body.add_task(tail_tick, tasks.ForTask(True, False, body, graph.Graph()))
+    body.connect(graph.Endpoint(graph.START_TICK, "$iterator"), graph.Endpoint(tail_tick, "$iterator"))
+    body.connect(graph.Endpoint(add_tick, "value"), graph.Endpoint(tail_tick, "s"))
+    body.connect(graph.Endpoint(tail_tick, "s"), graph.Endpoint(graph.FINAL_TICK, "s"))
+    return body
+
+
+def make_graph(body):
+    """
+    Returns the execution graph with the loop at `START_TICK + 1`.
+    """
+    g = executiongraph.ExecutionGraph()
+    loop_tick = graph.START_TICK + 1
+    g.add_task(loop_tick, tasks.ForTask(False, False, body, graph.Graph()))
+    g.connect(graph.Endpoint(graph.START_TICK, "$iterator"), graph.Endpoint(loop_tick, "$iterator"))
+    g.connect(graph.Endpoint(graph.START_TICK, "s"), graph.Endpoint(loop_tick, "s"))
+    g.connect(graph.Endpoint(loop_tick, "s"), graph.Endpoint(graph.FINAL_TICK, "retval"))
+    return g
+
+
+def run(iterations):
+    g = make_graph(make_body())
+    iterator = iter(xrange(iterations))
+    known_inputs = {"$iterator": iterator}
+
+    start = time.time()
+    loop_tick = graph.START_TICK + 1
+    tick = loop_tick
+    for i in xrange(1, iterations + 1):
+        g.get_task(tick).refine(g, tick, known_inputs)
+        tick = graph.START_TICK + 2 << (graph.START_TICK + 2 << (graph.START_TICK + i << loop_tick))
+    duration = time.time() - start
+
+    return duration
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARN)
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    duration = run(iterations)
+    print "%s loop iterations: %.2f s (%.0f iterations/s)" % (iterations, duration, iterations / duration)
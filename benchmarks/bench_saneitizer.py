@@ -0,0 +1,58 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Measures how long :class:`saneitizer.Saneitizer` takes for a large
+synthetic function::
+
+    python benchmarks/bench_saneitizer.py [lines]
+"""
+
+import ast
+import sys
+import time
+import logging
+
+from pydron.translation import saneitizer, naming
+
+
+def make_source(lines):
+    """
+    Returns the source of a function with roughly `lines` lines,
+    mixing the statements the saneitizer has to deal with.
+    """
+    body = ["def big(a, b):",
+            "    x = 0"]
+    i = 0
+    while len(body) < lines:
+        body.extend([
+            "    v%s = a * %s + b[%s].real" % (i, i, i % 3),
+            "    if v%s > x:" % i,
+            "        x = v%s - 1" % i,
+            "    else:",
+            "        x = x + abs(v%s)" % i,
+            "    for j%s in range(3):" % i,
+            "        x += j%s * v%s" % (i, i),
+            "    while x > %s:" % (1000 + i),
+            "        x = x // 2",
+        ])
+        i += 1
+    body.append("    return x")
+    return "\n".join(body) + "\n"
+
+
+def run(lines):
+    source = make_source(lines)
+    node = ast.parse(source)
+    
+    start = time.time()
+    saneitizer.Saneitizer().process(node, naming.UniqueIdentifierFactory())
+    duration = time.time() - start
+    
+    return len(source.splitlines()), duration
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARN)
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count, duration = run(lines)
+    print "Saneitizer on a %s line function: %.2f s" % (count, duration)
@@ -0,0 +1,53 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Measures the throughput of `set_output_data` on the execution graph
+used by the traverser, for a chain of tasks where each task consumes
+the output of the previous one::
+
+    python benchmarks/bench_set_output_data.py [tasks]
+"""
+
+import sys
+import time
+import logging
+
+from pydron.dataflow import graph
+from pydron.interpreter import executiongraph
+
+
+def make_graph(count):
+    """
+    Returns the execution graph with a chain of `count` tasks.
+    """
+    g = executiongraph.ExecutionGraph()
+    previous = graph.START_TICK
+    for i in range(1, count + 1):
+        tick = graph.START_TICK + i
+        g.add_task(tick, None)
+        if previous != graph.START_TICK:
+            g.connect(graph.Endpoint(previous, "out"), graph.Endpoint(tick, "in"))
+        previous = tick
+    g.connect(graph.Endpoint(previous, "out"), graph.Endpoint(graph.FINAL_TICK, "retval"))
+    return g
+
+
+def run(count):
+    g = make_graph(count)
+    g.collect_ready_tasks()
+
+    start = time.time()
+    for i in range(1, count + 1):
+        tick = graph.START_TICK + i
+        g.set_output_data(tick, {"out": i})
+        g.collect_ready_tasks()
+    duration = time.time() - start
+
+    return duration
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARN)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    duration = run(count)
+    print "set_output_data on %s tasks: %.2f s (%.0f tasks/s)" % (count, duration, count / duration)
@@ -1,5 +1,8 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
+__version__ = '0.1.4'
+
 from decorators import schedule, functional
 from whitelist import functional_whitelist
-from config.config import preload_packages
\ No newline at end of file
+from config.config import preload_packages
+from translation.cache import translation_cache
\ No newline at end of file
@@ -47,6 +47,21 @@ class TestWorker(unittest.TestCase):
         d = self.target.get_value("x")
         self.assertRaises(KeyError, extract, d)
         
+    def test_free_many(self):
+        self.target.set_value("x", 123)
+        self.target.set_value("y", 456)
+        self.target.set_value("z", 789)
+        extract(self.target.free_many(["x", "y", "unknown"]))
+        self.assertRaises(KeyError, extract, self.target.get_value("x"))
+        self.assertRaises(KeyError, extract, self.target.get_value("y"))
+        self.assertEqual(789, extract(self.target.get_value("z")))
+        
+    def test_store_stats(self):
+        self.target.set_value("x", 123)
+        self.target.set_value("y", 456)
+        self.target.free("x")
+        self.assertEqual({"values": 1, "freed": 1}, self.target.get_store_stats())
+        
     @utwist.with_reactor
     @twistit.yieldefer
     def test_evaluate_present(self):
@@ -86,6 +101,75 @@ class TestWorker(unittest.TestCase):
         actual_value = yield self.target.get_value(actual.result["out"])
         self.assertEqual("Hello", actual_value)
         
+    @utwist.with_reactor
+    @twistit.yieldefer
+    def test_evaluate_reducers(self):
+        self.target.set_value("x", 123)
+        actual = yield self.target.evaluate(TICK1, self.task, {"in": ("x", self.other)},
+                                            reducers={"out": [len, bool]})
+        self.assertEqual({("out", len): 5, ("out", bool): True}, actual.reduced)
+        
+    @utwist.with_reactor
+    @twistit.yieldefer
+    def test_evaluate_reducer_fails(self):
+        self.target.set_value("x", 123)
+        actual = yield self.target.evaluate(TICK1, self.task, {"in": ("x", self.other)},
+                                            reducers={"out": [int]})
+        self.assertEqual({}, actual.reduced)
+        
+    @utwist.with_reactor
+    @twistit.yieldefer
+    def test_evaluate_taskref(self):
+        self.target.set_value("x", 123)
+        yield self.target.evaluate(TICK1, worker.TaskRef("abc", self.task), {"in": ("x", self.other)})
+        self.task.inputs = None
+        yield self.target.evaluate(TICK1, worker.TaskRef("abc"), {"in": ("x", self.other)})
+        self.assertEqual({"in": 123}, self.task.inputs)
+        
+    @utwist.with_reactor
+    @twistit.yieldefer
+    def test_evaluate_unknown_taskref(self):
+        self.target.set_value("x", 123)
+        d = self.target.evaluate(TICK1, worker.TaskRef("abc"), {"in": ("x", self.other)})
+        try:
+            yield d
+            self.fail("Expected UnknownTaskError")
+        except worker.UnknownTaskError:
+            pass
+        
+    def test_task_digest(self):
+        self.assertEqual(worker.task_digest(MockTask()), worker.task_digest(MockTask()))
+        other = MockTask()
+        other.inputs = {"in": 1}
+        self.assertNotEqual(worker.task_digest(MockTask()), worker.task_digest(other))
+        
+        
+class TestTaskRegistry(unittest.TestCase):
+    
+    def setUp(self):
+        self.target = worker.TaskRegistry(capacity=2)
+        
+    def test_get(self):
+        self.target.add("a", 1)
+        self.assertEqual(1, self.target.get("a"))
+        self.assertIsNone(self.target.get("b"))
+        
+    def test_evict(self):
+        self.target.add("a", 1)
+        self.target.add("b", 2)
+        self.target.add("c", 3)
+        self.assertNotIn("a", self.target)
+        self.assertEqual(2, len(self.target))
+        
+    def test_evict_least_recently_used(self):
+        self.target.add("a", 1)
+        self.target.add("b", 2)
+        self.target.get("a")
+        self.target.add("c", 3)
+        self.assertIn("a", self.target)
+        self.assertNotIn("b", self.target)
+        
+        
 class TestValueHolder(unittest.TestCase):
     
     def test_setget(self):
@@ -1,7 +1,9 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
 from twisted.internet import defer, task, threads
+import collections
 import enum
+import hashlib
 import uuid
 import twistit
 import anycall
@@ -32,6 +34,75 @@ class NoPickleError(Exception):
     def __str__(self):
         return repr(self)
         
+class UnknownTaskError(Exception):
+    """
+    The task referred to by a :class:`TaskRef` is not in the task registry
+    of the worker, either because it was never sent, or because it was evicted.
+    """
+    pass
+
+class TaskRef(object):
+    """
+    Refers to a task in the :class:`TaskRegistry` of a worker.
+    
+    The first time a task is sent to a worker the task itself is
+    included so that the worker can register it. Afterwards only the
+    digest is sent.
+    """
+    
+    def __init__(self, digest, task=None):
+        #: Hex-digest of the pickled task, see :func:`task_digest`.
+        self.digest = digest
+        
+        #: The task or `None` if the worker should have it already.
+        self.task = task
+        
+    def __repr__(self):
+        return "TaskRef(%r)" % self.digest
+
+def task_digest(task):
+    """
+    Returns the hex-digest of the pickled `task`. 
+    Equal tasks have the same digest.
+    """
+    return hashlib.sha1(pickle.dumps(task, pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+class TaskRegistry(object):
+    """
+    Bounded mapping that only keeps the `capacity` most recently used entries.
+    """
+    
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+        
+    def add(self, key, value):
+        """
+        Adds or replaces an entry. Evicts the least recently used entry
+        if there are more than `capacity`.
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            
+    def get(self, key, default=None):
+        """
+        Returns the value of an entry and marks it as recently used.
+        """
+        if key not in self._entries:
+            return default
+        value = self._entries.pop(key)
+        self._entries[key] = value
+        return value
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+    
+
 class ValueId(object):
     """
     Unique identifier for a value passed through the data-flow graph.
@@ -81,6 +152,10 @@ class ValueRef(object):
         self.datasize = None
         self.pickle_support = pickle_support
         
+        #: Maps refiner reducers to the reduced value, if
+        #: the worker reduced the value right after producing it.
+        self.reduced = {}
+        
     def get_workers(self):
         return self._workers
     
@@ -329,6 +404,22 @@ class RemoteWorker(object):
         """
         raise NotImplementedError("abstract")
     
+    def free_many(self, valueids):
+        """
+        Delete several values on the worker with a single call.
+        Returned deferred callsback with `None` once completed.
+        """
+        raise NotImplementedError("abstract")
+    
+    def get_store_stats(self):
+        """
+        Returns a `dict` with counters about the value store of the worker:
+        
+        * `values`: Number of values currently stored.
+        * `freed`: Number of values freed since the worker started.
+        """
+        raise NotImplementedError("abstract")
+    
     def copy(self, source_valueid, dest_valueid):
         """
         Creates a copy of a value. The `to_valueid` must not yet
@@ -336,14 +427,20 @@ class RemoteWorker(object):
         """
         raise NotImplementedError("abstract")
     
-    def evaluate(self, tick, task, inputs, nosend_ports=None):
+    def evaluate(self, tick, task, inputs, nosend_ports=None, reducers=None):
         """
         Evaluate the given task with the given inputs. The inputs is a dict
         with port -> (value-id, worker) mapping. The worker is the source where
         the value should be fetched from if it isn't already available.
         
+        :param task: The task or a :class:`TaskRef`. Fails with :class:`UnknownTaskError`
+          if the reference does not include the task and the worker doesn't know it.
+        
         :param nosend_ports: Output ports that should never be pickled.
         
+        :param reducers: Maps output ports to a list of refiner reducers to apply 
+          to the value of the port. The results are returned in :attr:`EvalResult.reduced`.
+        
         Returns a deferred for a :class:`EvalResult`.
         """
         raise NotImplementedError("abstract")
@@ -359,6 +456,12 @@ class Worker(RemoteWorker):
 
         #: maps valueids to values or deferred that will callback once the value is loaded
         self._values = {}
+        
+        #: Tasks received with a :class:`TaskRef`, by digest.
+        self._tasks = TaskRegistry()
+        
+        #: Number of values freed, see :meth:`get_store_stats`.
+        self._freed_count = 0
 
     def copy(self, source_valueid, dest_valueid):
         """
@@ -519,6 +622,7 @@ class Worker(RemoteWorker):
             
             def success(value):
                 del self._values[valueid]
+                self._freed_count += 1
                 return value
             
             d.addCallback(success)
@@ -526,6 +630,15 @@ class Worker(RemoteWorker):
         else:
             return defer.succeed(None)
         
+    def free_many(self, valueids):
+        ds = [defer.maybeDeferred(self.free, valueid) for valueid in valueids]
+        d = defer.DeferredList(ds, fireOnOneErrback=True, consumeErrors=True)
+        d.addCallback(lambda _:None)
+        return d
+    
+    def get_store_stats(self):
+        return {"values": len(self._values), "freed": self._freed_count}
+        
     def reduce(self, valueid, reducer):
         """
         Returns `reducer(input)` where `input` is the value of the given valueid.
@@ -548,18 +661,35 @@ class Worker(RemoteWorker):
         d.addCallback(success)
         return d
     
-    def evaluate(self, tick, task, inputs, nosend_ports=None, fail_on_unexpected_nosend=False):
+    def evaluate(self, tick, task, inputs, nosend_ports=None, fail_on_unexpected_nosend=False, reducers=None):
         """
         Evaluate the given task with the given inputs. The inputs are a dict
         with port -> (value-id, worker) mapping.
         
+        :param task: The task or a :class:`TaskRef`. Tasks sent with a reference
+            are registered, so that later evaluations only need the digest.
+        
         :param nosend_ports: Set of output ports which must not be pickled.
         
+        :param reducers: Maps output ports to a list of refiner reducers. They are
+            applied right after the evaluation so that refinements don't need
+            an additional call to :meth:`reduce`. Reducers that fail or
+            whose result cannot be pickled are skipped.
+        
         :param fail_on_unexpected_nosend: Action if output ports that are not in `nosend_ports`
             fail to pickle. If `True`, the evaluation is aborted with a :class:`NoPickleError`,
             if `False` the operation proceeds as if the ports where in `nosend_ports`.
         """
 
+        if isinstance(task, TaskRef):
+            if task.task is not None:
+                self._tasks.add(task.digest, task.task)
+                task = task.task
+            elif task.digest in self._tasks:
+                task = self._tasks.get(task.digest)
+            else:
+                return defer.fail(UnknownTaskError("Unknown task %r for job %s." % (task, tick)))
+
         logger.debug("Transfers for job %s" % tick)
 
         ports = []
@@ -602,7 +732,12 @@ class Worker(RemoteWorker):
                 
             #duration = end - start
             duration = (end - start).total_seconds()
-            return traverser.EvalResult(result, duration)
+            
+            if reducers and isinstance(result, dict):
+                reduced = _apply_reducers(tick, result, reducers)
+            else:
+                reduced = None
+            return traverser.EvalResult(result, duration, reduced=reduced)
             
         @twistit.yieldefer
         def got_all(results):
@@ -675,6 +810,8 @@ class Worker(RemoteWorker):
         stub.fetch_from = rpcsystem.create_local_function_stub(self.fetch_from)
         stub.get_cucumber = rpcsystem.create_local_function_stub(self.get_cucumber)
         stub.free = rpcsystem.create_local_function_stub(self.free)
+        stub.free_many = rpcsystem.create_local_function_stub(self.free_many)
+        stub.get_store_stats = rpcsystem.create_local_function_stub(self.get_store_stats)
         stub.reduce = rpcsystem.create_local_function_stub(self.reduce)
         stub.evaluate = rpcsystem.create_local_function_stub(self.evaluate)
         stub.copy = rpcsystem.create_local_function_stub(self.copy)
@@ -684,6 +821,25 @@ class Worker(RemoteWorker):
     def __repr__(self):
         return "Worker(%s)" % repr(self.nicename)
 
+def _apply_reducers(tick, outputs, reducers):
+    """
+    Returns a `dict` that maps `(port, reducer)` to `reducer(outputs[port])`.
+    """
+    reduced = {}
+    for port, port_reducers in reducers.iteritems():
+        if port not in outputs:
+            continue
+        for reducer in port_reducers:
+            try:
+                value = reducer(outputs[port])
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.debug("Cannot reduce %r.%r with %r: %s" % (tick, port, reducer, e))
+                continue
+            reduced[(port, reducer)] = value
+    return reduced
+
+
 class ValueHolder(object):
     """
     Contains a value object with proper handling of transmission and freeing.
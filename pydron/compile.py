@@ -0,0 +1,85 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Translates all `@schedule` functions of a module ahead of time and stores
+the result in the on-disk translation cache::
+
+    python -m pydron.compile [--cache-dir DIR] module [module ...]
+    
+The cache is only used at runtime if the environment variable
+`PYDRON_TRANSLATION_CACHE` points to the same directory.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+from pydron import decorators
+from pydron.interpreter import blocking
+from pydron.translation import cache
+
+logger = logging.getLogger(__name__)
+
+
+def find_scheduled_functions(module):
+    """
+    Returns the functions decorated with `@schedule` that are defined in the
+    given module.
+    """
+    functions = []
+    for name in sorted(vars(module)):
+        obj = getattr(module, name)
+        function = getattr(obj, "scheduled_function", None)
+        if function is None:
+            continue
+        if getattr(function, "__module__", None) != module.__name__:
+            continue # imported from somewhere else.
+        functions.append(function)
+    return functions
+
+
+def compile_module(module_name, disk_cache):
+    """
+    Translates the `@schedule` functions in the given module and stores them
+    in `disk_cache`. Returns the number of translated functions.
+    """
+    module = importlib.import_module(module_name)
+    functions = find_scheduled_functions(module)
+    for function in functions:
+        logger.info("Translating %s.%s" % (module_name, function.__name__))
+        disk_cache.translate_function_def(function, blocking.BlockingScheduler(),
+                                          **decorators.translation_options)
+    return len(functions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pydron.compile", 
+                                     description="Pre-translates @schedule functions.")
+    parser.add_argument("--cache-dir", 
+                        default=os.environ.get(cache.CACHE_DIRECTORY_ENV, cache.DEFAULT_CACHE_DIRECTORY),
+                        help="Directory of the translation cache.")
+    parser.add_argument("modules", nargs="+", metavar="module")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.WARN)
+    
+    # Allow modules in the current directory, as `python -m` would.
+    if "" not in sys.path:
+        sys.path.insert(0, "")
+    
+    disk_cache = cache.DiskCache(args.cache_dir)
+    for module_name in args.modules:
+        count = compile_module(module_name, disk_cache)
+        print "%s: %s function(s)" % (module_name, count)
+        
+    print "Translations stored in %s (%s new, %s already cached)." % (disk_cache.directory, 
+                                                                   disk_cache.misses, 
+                                                                   disk_cache.hits)
+    if os.environ.get(cache.CACHE_DIRECTORY_ENV, None) is None:
+        print "Set %s=%s to use them." % (cache.CACHE_DIRECTORY_ENV, disk_cache.directory)
+
+
+if __name__ == "__main__":
+    main()
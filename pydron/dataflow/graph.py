@@ -1,28 +1,42 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
+import collections
+import contextlib
 import threading
-from frozendict import frozendict
+import weakref
 
 class Tick(object):
     """
     Tick objects represent a 'time' during sequential execution of the
     corresponding python code.
     
-    Tick instances can be compared and are immutable.
+    Tick instances can be compared and are immutable. Instances are
+    interned, creating a tick that already exists returns the existing
+    instance.
     """
     
-    def __init__(self, elements, loopmask):
+    __slots__ = ("_elements", "_loopmask", "_hash", "__weakref__")
+    
+    #: Interned instances by `(elements, loopmask)`.
+    _interned = weakref.WeakValueDictionary()
+    
+    def __new__(cls, elements, loopmask):
         """
         Do not use. Instead derive from other tick, such as `START_TICK`.
         """
+        if not isinstance(elements, tuple) or not isinstance(loopmask, tuple):
+            raise TypeError()
+        key = (elements, loopmask)
+        tick = cls._interned.get(key)
+        if tick is not None:
+            return tick
+        
         if len(elements) < 2:
             raise ValueError()
         if elements[0] > 1:
             raise ValueError("cannot have tick after FINAL_TICK")
         if elements[0] == 1 and elements != (1,0):
             raise ValueError("cannot have tick after FINAL_TICK")
-        if not isinstance(elements, tuple) or not isinstance(loopmask, tuple):
-            raise TypeError()
         if len(loopmask) != len(elements):
             raise ValueError("Loopmask does not match elements")
         for e in elements:
@@ -30,8 +44,16 @@ class Tick(object):
                 raise TypeError()
             if e < 0:
                 raise ValueError("elements must be non-negative.")
-        self._elements = elements
-        self._loopmask = loopmask
+            
+        tick = object.__new__(cls)
+        tick._elements = elements
+        tick._loopmask = loopmask
+        tick._hash = hash(elements)
+        cls._interned[key] = tick
+        return tick
+    
+    def __reduce__(self):
+        return (Tick, (self._elements, self._loopmask))
     
     def mark_loop_iteration(self):
         """
@@ -84,8 +106,34 @@ class Tick(object):
     def __cmp__(self, other):
         return cmp(self._elements, other._elements)
     
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Tick):
+            return NotImplemented
+        return self._elements == other._elements
+    
+    def __ne__(self, other):
+        if self is other:
+            return False
+        if not isinstance(other, Tick):
+            return NotImplemented
+        return self._elements != other._elements
+    
+    def __lt__(self, other):
+        return self._elements < other._elements
+    
+    def __le__(self, other):
+        return self._elements <= other._elements
+    
+    def __gt__(self, other):
+        return self._elements > other._elements
+    
+    def __ge__(self, other):
+        return self._elements >= other._elements
+    
     def __hash__(self):
-        return hash(self._elements)
+        return self._hash
     
     def __repr__(self):
         if self == START_TICK:
@@ -186,26 +234,53 @@ class Endpoint(object):
         return hash(self.tick) + 7*hash(self.port)
 
 
+#: Task properties that are read often during traversal. They have a
+#: dedicated slot in the task node instead of an entry in the property dict.
+HOT_PROPERTIES = ("out_data",)
+
+_HOT_PROPERTIES = frozenset(HOT_PROPERTIES)
+
 class _TaskNode(object):
     """
     Used internally by :class:`Graph`.
+    
+    Properties in :data:`HOT_PROPERTIES` are stored in slots of the same
+    name, which are unset while the task doesn't have the property.
+    All other properties are in `properties`.
     """
     
+    __slots__ = ("task", "properties", "in_connections", "out_connections", "view") + HOT_PROPERTIES
+    
     def __init__(self, task, properties):
         self.task = task
-        self.properties = frozendict(properties)
+        self.properties = {}
         self.in_connections = {}
         self.out_connections = set()
+        self.view = TaskProperties(self)
+        for key, value in properties.iteritems():
+            self.set_property(key, value)
         
     def set_property(self, key, value):
-        self.properties = self.properties.copy(**{key:value})
+        if key in _HOT_PROPERTIES:
+            setattr(self, key, value)
+        else:
+            self.properties[key] = value
+            
+    def __getstate__(self):
+        return (self.task, dict(self.view), self.in_connections, self.out_connections)
+    
+    def __setstate__(self, state):
+        task, properties, in_connections, out_connections = state
+        self.__init__(task, properties)
+        self.in_connections = in_connections
+        self.out_connections = out_connections
         
     def __eq__(self, other):
         if self.task != other.task:
             return False
         
-        myproperties = {k:v for k,v in self.properties.iteritems() if not k.startswith("_")}
-        otherproperties = {k:v for k,v in other.properties.iteritems() if not k.startswith("_")}
+        myproperties = {k:v for k,v in self.view.iteritems() if not k.startswith("_")}
+        otherproperties = {k:v for k,v in other.view.iteritems() if not k.startswith("_")}
         
         if myproperties != otherproperties:
             return False
@@ -223,6 +298,49 @@ class _TaskNode(object):
 
     def __hash__(self):
         raise NotImplementedError()   
+    
+
+class TaskProperties(collections.Mapping):
+    """
+    Read-only view of the properties of a task, as returned by 
+    :meth:`Graph.get_task_properties`. The view reflects later
+    changes of the properties.
+    """
+    
+    def __init__(self, node):
+        self._node = node
+        
+    def __getitem__(self, key):
+        if key in _HOT_PROPERTIES:
+            try:
+                return getattr(self._node, key)
+            except AttributeError:
+                raise KeyError(key)
+        return self._node.properties[key]
+    
+    def get(self, key, default=None):
+        if key in _HOT_PROPERTIES:
+            return getattr(self._node, key, default)
+        return self._node.properties.get(key, default)
+    
+    def __contains__(self, key):
+        if key in _HOT_PROPERTIES:
+            return hasattr(self._node, key)
+        return key in self._node.properties
+    
+    def __iter__(self):
+        for key in HOT_PROPERTIES:
+            if hasattr(self._node, key):
+                yield key
+        for key in self._node.properties:
+            yield key
+            
+    def __len__(self):
+        return len(self._node.properties) + sum(1 for key in HOT_PROPERTIES if hasattr(self._node, key))
+    
+    def __repr__(self):
+        return repr(dict(self))
+    
         
 class _Connection(object):
     """
@@ -283,15 +401,44 @@ class Graph(object):
     The methods are called *after* the graph has been changed. During those calls
     the graph may *not* be changed with the exception of task properties. Exceptions
     thrown in those methods leave the graph in an undefined state. Changes to
-    task properties are not reported.
+    task properties are not reported. Within a :meth:`batch` the calls are delayed
+    until the batch ends.
     """
     
-
+    #: Number of nested :meth:`batch` blocks we are in.
+    _batch_depth = 0
 
     def __init__(self):
         self._ticks = {START_TICK:_TaskNode(None, {}),
                        FINAL_TICK:_TaskNode(None, {})}
         self._observers = []
+        
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager to group several changes to the graph::
+        
+            with g.batch():
+                g.disconnect(a, b)
+                g.connect(a, c)
+                
+        Observers are notified once the outermost batch ends, in the order 
+        of the changes. Decorators use this to update their state only once
+        per affected task. The graph itself is changed right away, so it
+        can be queried within the batch.
+        """
+        if self._batch_depth == 0:
+            self._batch_events = []
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                events = self._batch_events
+                del self._batch_events
+                for method, args in events:
+                    self._fire(method, *args)
 
     def add_task(self, tick, task, properties={}):
         """
@@ -409,8 +556,10 @@ class Graph(object):
     def get_task_properties(self, tick):
         """
         Returns the properties for the task executed at `tick`.
+        
+        :returns: Read-only :class:`TaskProperties` view.
         """
-        return self._ticks[tick].properties
+        return self._ticks[tick].view
         
     def set_task_property(self, tick, key, value):
         """
@@ -455,25 +604,27 @@ class Graph(object):
         """
         self._observers.remove(observer)
     
+    def _fire(self, method, *args):
+        if self._batch_depth:
+            self._batch_events.append((method, args))
+        else:
+            for obs in self._observers:
+                getattr(obs, method)(*args)
+    
     def _fire_task_added(self, tick, task, properties):
-        for obs in self._observers:
-            obs.task_added(tick, task, properties)
+        self._fire("task_added", tick, task, properties)
             
     def _fire_task_removed(self, tick):
-        for obs in self._observers:
-            obs.task_removed(tick)
+        self._fire("task_removed", tick)
             
     def _fire_connected(self, source, dest):
-        for obs in self._observers:
-            obs.connected(source, dest)
+        self._fire("connected", source, dest)
             
     def _fire_disconnected(self, source, dest):
-        for obs in self._observers:
-            obs.disconnected(source, dest)
+        self._fire("disconnected", source, dest)
             
     def _fire_task_property_changed(self, tick, key, value):
-        for obs in self._observers:
-            obs.task_property_changed(tick, key, value)  
+        self._fire("task_property_changed", tick, key, value)
               
     def __repr__(self):
         stack = getattr(Graph, "_repr_stack", [])
@@ -496,8 +647,8 @@ class Graph(object):
                 
                 if tick == FINAL_TICK:
                     continue
-                if tasknode.properties:
-                    yield repr(tick) + ": " + indent(repr(tasknode.task)) + " " + indent(repr(dict(tasknode.properties))) 
+                if tasknode.view:
+                    yield repr(tick) + ": " + indent(repr(tasknode.task)) + " " + indent(repr(dict(tasknode.view))) 
                 else:
                     yield repr(tick) + ": " + indent(repr(tasknode.task))
         
@@ -0,0 +1,615 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Optimizations on the graphs produced by the translator.
+
+The passes change the graph in-place. They also process the graphs
+of nested tasks, such as the body of loops or of nested functions.
+"""
+
+import __builtin__
+import bisect
+import logging
+import sys
+
+from pydron.dataflow import graph, refine, tasks, utils
+
+logger = logging.getLogger(__name__)
+
+#: Folded sequences (strings, tuples) with more elements than this are not
+#: stored as constants. Same limit as CPython's peephole optimizer.
+MAX_FOLDED_LENGTH = 20
+
+#: Tasks whose results can be shared between several consumers. They
+#: have no side-effects and don't create new mutable objects, so 
+#: evaluating them once instead of several times makes no difference.
+SHAREABLE_TASKS = (tasks.ConstTask, tasks.TupleTask, tasks.ReadGlobal, 
+                   tasks.AttributeTask, tasks.SubscriptTask)
+
+#: Shareable tasks which read state that syncpoints might change.
+STATE_READING_TASKS = (tasks.ReadGlobal, tasks.AttributeTask, tasks.SubscriptTask)
+
+#: Tasks which cannot raise an exception. Only those are removed if their
+#: result is not used. :class:`tasks.ReadGlobal` can raise a `NameError`,
+#: it is only removed if the global is known to be bound.
+INFALLIBLE_TASKS = (tasks.ConstTask, tasks.TupleTask, tasks.GuardTask)
+
+
+def optimize(g):
+    """
+    Runs all optimization passes on `g`.
+    """
+    fold_constants(g)
+    eliminate_dead_tasks(g)
+    eliminate_common_subexpressions(g)
+    hoist_loop_invariants(g)
+    fuse_tasks(g)
+
+
+def fold_constants(g):
+    """
+    Replaces :class:`tasks.BinOpTask`, :class:`tasks.UnaryOpTask`, and
+    :class:`tasks.TupleTask` tasks whose inputs all come from
+    :class:`tasks.ConstTask` tasks with a single :class:`tasks.ConstTask`.
+
+    Operations that raise an exception are not folded, so that the
+    exception is raised when the function runs.
+
+    :returns: Number of folded tasks.
+    """
+    count = 0
+    for subgraph in all_graphs(g):
+        count += _fold_constants(subgraph)
+    logger.debug("Folded %s constant expressions." % count)
+    return count
+
+
+def _fold_constants(g):
+    count = 0
+
+    # Ticks are in causal order, so the inputs of a task
+    # have been folded before we get to the task.
+    for tick in sorted(g.get_all_ticks()):
+        task = g.get_task(tick)
+        if not isinstance(task, (tasks.BinOpTask, tasks.UnaryOpTask, tasks.TupleTask)):
+            continue
+
+        in_connections = g.get_in_connections(tick)
+        if len(in_connections) != len(task.input_ports()):
+            continue
+        if not all(_is_const(g, source.tick) for source, _ in in_connections):
+            continue
+
+        inputs = {dest.port: g.get_task(source.tick).value for source, dest in in_connections}
+        try:
+            value = task.evaluate(inputs)["value"]
+        except Exception:
+            continue
+
+        if isinstance(value, (basestring, tuple)) and len(value) > MAX_FOLDED_LENGTH:
+            continue
+
+        replace_task(g, tick, tasks.ConstTask(value))
+        for source, _ in in_connections:
+            remove_if_unused(g, source.tick)
+        count += 1
+
+    return count
+
+
+def eliminate_dead_tasks(g):
+    """
+    Removes tasks whose outputs are not used, that are not syncpoints,
+    and that cannot raise an exception (see :data:`INFALLIBLE_TASKS`).
+    
+    Tasks without output ports are kept, they exist for their effect
+    (such as :class:`tasks.RaiseTask`). So are tasks such as 
+    :class:`tasks.SubscriptTask`, since `d['missing']` has to raise
+    a `KeyError` even if the value is not used.
+    
+    :returns: Number of removed tasks.
+    """
+    count = 0
+    for subgraph in all_graphs(g):
+        count += _eliminate_dead_tasks(subgraph)
+    logger.debug("Removed %s dead tasks." % count)
+    return count
+
+
+def _eliminate_dead_tasks(g):
+    count = 0
+    
+    # Consumers have larger ticks than producers, so
+    # removing a task may make the tasks we visit later dead.
+    for tick in sorted(g.get_all_ticks(), reverse=True):
+        if not g.get_task(tick).output_ports():
+            continue
+        if g.get_out_connections(tick):
+            continue
+        if g.get_task_properties(tick).get("syncpoint", False):
+            continue
+        if not _is_infallible(g, tick):
+            continue
+        for source, dest in g.get_in_connections(tick):
+            g.disconnect(source, dest)
+        g.remove_task(tick)
+        count += 1
+    return count
+
+
+def _is_infallible(g, tick):
+    task = g.get_task(tick)
+    if isinstance(task, INFALLIBLE_TASKS):
+        return True
+    name = tasks.read_global_name(g, graph.Endpoint(tick, "value"))
+    if name is not None:
+        module_name, var = name
+        module = sys.modules.get(module_name)
+        return hasattr(module, var) or hasattr(__builtin__, var)
+    return False
+
+
+def eliminate_common_subexpressions(g):
+    """
+    Merges tasks listed in :data:`SHAREABLE_TASKS` that are equal and
+    have the same inputs. The task with the lower tick is kept.
+    
+    Tasks in :data:`STATE_READING_TASKS` are only merged if there
+    is no syncpoint between them, since the syncpoint might change what
+    they read.
+    
+    :returns: Number of removed tasks.
+    """
+    count = 0
+    for subgraph in all_graphs(g):
+        count += _eliminate_common_subexpressions(subgraph)
+    logger.debug("Merged %s common subexpressions." % count)
+    return count
+
+
+def _eliminate_common_subexpressions(g):
+    count = 0
+    
+    # maps `(epoch, task key, inputs)` to the tick of the first such task.
+    known = {}
+    
+    # number of syncpoints before the current tick.
+    epoch = 0
+    
+    for tick in sorted(g.get_all_ticks()):
+        if g.get_task_properties(tick).get("syncpoint", False):
+            epoch += 1
+            continue
+        if not _is_shareable(g, tick):
+            continue
+        
+        task = g.get_task(tick)
+        inputs = frozenset((dest.port, source) for source, dest in g.get_in_connections(tick))
+        if isinstance(_unguarded(task), STATE_READING_TASKS):
+            key = (epoch, _task_key(task), inputs)
+        else:
+            key = (None, _task_key(task), inputs)
+            
+        if key in known:
+            _redirect_outputs(g, tick, known[key])
+            remove_if_unused(g, tick)
+            count += 1
+        else:
+            known[key] = tick
+    return count
+
+
+def _is_shareable(g, tick):
+    properties = g.get_task_properties(tick)
+    if properties.get("syncpoint", False) or properties.get("nosend_ports", None):
+        return False
+    return isinstance(_unguarded(g.get_task(tick)), SHAREABLE_TASKS)
+
+
+def _unguarded(task):
+    """
+    Returns the task wrapped by a :class:`tasks.GuardTask`.
+    """
+    if isinstance(task, tasks.GuardTask):
+        return task.task
+    else:
+        return task
+
+
+def _task_key(task):
+    """
+    Returns a hashable object that is equal for tasks that do the same.
+    """
+    if isinstance(task, tasks.ConstTask):
+        # `1`, `1.0` and `True` are equal but not the same.
+        return (tasks.ConstTask, type(task.value), repr(task.value))
+    else:
+        return (type(task), tuple(sorted(task.__dict__.items())))
+
+
+def _redirect_outputs(g, tick, new_tick):
+    """
+    Connects the consumers of the task at `tick` to the same ports of
+    the task at `new_tick`.
+    """
+    for source, dest in g.get_out_connections(tick):
+        g.disconnect(source, dest)
+        g.connect(graph.Endpoint(new_tick, source.port), dest)
+
+
+def hoist_loop_invariants(g):
+    """
+    Moves tasks listed in :data:`SHAREABLE_TASKS` out of loop bodies if
+    they have the same inputs in every iteration. They are evaluated
+    once before the loop and their outputs are passed to the body graph
+    as additional inputs named `$invariant_<n>`.
+    
+    Tasks in :data:`STATE_READING_TASKS` are only moved if the body has
+    no side-effects. 
+    
+    The moved tasks are evaluated even if the loop body is never
+    executed. Except for constants, they are wrapped in a 
+    :class:`tasks.GuardTask` and the loop raises their exception 
+    only once the body is executed (see :func:`tasks.guard_loop_inputs`).
+    
+    Nested loops are processed first, so that tasks can move out
+    of several loops.
+    
+    :returns: Number of moved tasks.
+    """
+    count = 0
+    for subgraph in reversed(all_graphs(g)):
+        for tick in sorted(subgraph.get_all_ticks()):
+            task = subgraph.get_task(tick)
+            if isinstance(task, (tasks.ForTask, tasks.WhileTask)) and not task.is_tail:
+                count += _hoist_loop_invariants(subgraph, tick, task)
+    logger.debug("Moved %s tasks out of loops." % count)
+    return count
+
+
+def _hoist_loop_invariants(g, tick, looptask):
+    body = looptask.body_graph
+    
+    tail_tick = None
+    for body_tick in body.get_all_ticks():
+        body_task = body.get_task(body_tick)
+        if isinstance(body_task, type(looptask)) and body_task.is_tail and body_task.body_graph is body:
+            tail_tick = body_tick
+    if tail_tick is None:
+        return 0
+    
+    # The moved tasks get ticks right after the task before the loop.
+    # They must not end up before tasks that might replace that task
+    # when it is refined, if those could be syncpoints.
+    previous = max([t for t in g.get_all_ticks() if t < tick] or [graph.START_TICK])
+    if previous != graph.START_TICK:
+        previous_task = g.get_task(previous)
+        syncpoint = g.get_task_properties(previous).get("syncpoint", False)
+        if syncpoint and hasattr(previous_task, "refiner_ports"):
+            return 0
+    
+    pure = not utils.contains_sideeffects(body)
+    
+    # Body inputs that are passed on to the next iteration unchanged.
+    loop_inputs = {dest.port: source for source, dest in g.get_in_connections(tick)}
+    
+    # Maps endpoints in the body to the endpoints in `g` with the same value.
+    invariants = {}
+    for source, dest in body.get_in_connections(tail_tick):
+        if source.tick == graph.START_TICK and source.port == dest.port and not source.port.startswith("$"):
+            if source.port in loop_inputs:
+                invariants[source] = loop_inputs[source.port]
+    
+    # Outputs of moved tasks whose exception the loop has to raise.
+    guarded = set()
+    
+    moved = []
+    for body_tick in sorted(body.get_all_ticks()):
+        if not _is_shareable(body, body_tick):
+            continue
+        body_task = body.get_task(body_tick)
+        if isinstance(_unguarded(body_task), STATE_READING_TASKS) and not pure:
+            continue
+        in_connections = body.get_in_connections(body_tick)
+        if not all(source in invariants for source, _ in in_connections):
+            continue
+        
+        # Guards moved out of an inner loop are raised by that loop.
+        raises = isinstance(body_task, STATE_READING_TASKS)
+        raises |= any(invariants[source] in guarded for source, _ in in_connections)
+        if raises or any(_is_guard(g, invariants[source]) for source, _ in in_connections):
+            if not isinstance(body_task, tasks.GuardTask):
+                body_task = tasks.GuardTask(body_task)
+        
+        new_tick = _free_tick(g, graph.START_TICK + 1 << (graph.START_TICK << previous))
+        g.add_task(new_tick, body_task, body.get_task_properties(body_tick))
+        for source, dest in in_connections:
+            g.connect(invariants[source], graph.Endpoint(new_tick, dest.port))
+        for port in body_task.output_ports():
+            invariants[graph.Endpoint(body_tick, port)] = graph.Endpoint(new_tick, port)
+            if raises:
+                guarded.add(graph.Endpoint(new_tick, port))
+        moved.append(body_tick)
+        
+    # Pass the values into the body for the tasks that remain there.
+    used_ports = {source.port for source, _ in body.get_out_connections(graph.START_TICK)}
+    ports = {}
+    guarded_ports = set()
+    for body_tick in moved:
+        for source, dest in body.get_out_connections(body_tick):
+            if dest.tick in moved:
+                continue
+            if source not in ports:
+                port = _free_port(used_ports, "$invariant_")
+                used_ports.add(port)
+                ports[source] = port
+                body.connect(graph.Endpoint(graph.START_TICK, port), graph.Endpoint(tail_tick, port))
+                g.connect(invariants[source], graph.Endpoint(tick, port))
+                if invariants[source] in guarded:
+                    guarded_ports.add(port)
+            body.disconnect(source, dest)
+            body.connect(graph.Endpoint(graph.START_TICK, ports[source]), dest)
+    
+    if guarded_ports:
+        tasks.guard_loop_inputs(looptask, guarded_ports)
+        tasks.guard_loop_inputs(body.get_task(tail_tick), guarded_ports)
+            
+    for body_tick in moved:
+        for source, dest in body.get_in_connections(body_tick) + body.get_out_connections(body_tick):
+            body.disconnect(source, dest)
+    for body_tick in moved:
+        body.remove_task(body_tick)
+        
+    return len(moved)
+
+
+def _is_guard(g, source):
+    if source.tick == graph.START_TICK:
+        return False
+    return isinstance(g.get_task(source.tick), tasks.GuardTask)
+
+
+def _free_tick(g, tick):
+    """
+    Returns the first tick starting at `tick` that is not used in `g`.
+    """
+    ticks = set(g.get_all_ticks())
+    while tick in ticks:
+        tick = tick + 1
+    return tick
+
+
+def _free_port(used_ports, prefix):
+    i = 0
+    while "%s%s" % (prefix, i) in used_ports:
+        i += 1
+    return "%s%s" % (prefix, i)
+
+
+def fuse_tasks(g):
+    """
+    Replaces trees of quick tasks with a :class:`tasks.FusedTask`.
+    
+    A task is added to the tree of its consumers if all its outputs
+    go to that tree. Only the outputs of the tree's root are visible
+    outside of the fused task, so the intermediate values are never
+    stored.
+    
+    Tasks that are syncpoints, need refinement, have subgraphs, or
+    have outputs that must not be sent are not fused. Since the fused
+    task runs at the tick of the root, a task is only added to a tree
+    if there is no syncpoint between it and the root. Otherwise it
+    might see state that the syncpoint changed.
+    
+    :returns: Number of removed tasks.
+    """
+    count = 0
+    for subgraph in all_graphs(g):
+        count += _fuse_tasks(subgraph)
+    logger.debug("Fused %s tasks." % count)
+    return count
+
+
+def _fuse_tasks(g):
+    
+    # maps tick to the tick of the root of the tree it belongs to.
+    roots = {}
+    
+    syncpoints = sorted(tick for tick in g.get_all_ticks() 
+                        if g.get_task_properties(tick).get("syncpoint", False))
+    
+    # Consumers have larger ticks than producers, so
+    # the consumers have been assigned to a tree already.
+    for tick in sorted(g.get_all_ticks(), reverse=True):
+        if not _is_fusable(g, tick):
+            continue
+        consumer_roots = {roots.get(dest.tick) for _, dest in g.get_out_connections(tick)}
+        if len(consumer_roots) == 1 and None not in consumer_roots:
+            root = consumer_roots.pop()
+            index = bisect.bisect_right(syncpoints, tick)
+            if index < len(syncpoints) and syncpoints[index] < root:
+                # The task would move past a syncpoint.
+                roots[tick] = tick
+            else:
+                roots[tick] = root
+        else:
+            roots[tick] = tick
+            
+    trees = {}
+    for tick, root in roots.iteritems():
+        trees.setdefault(root, []).append(tick)
+    
+    count = 0
+    for root, ticks in trees.iteritems():
+        if len(ticks) > 1:
+            _fuse_tree(g, root, sorted(ticks))
+            count += len(ticks) - 1
+    return count
+
+
+def _is_fusable(g, tick):
+    task = g.get_task(tick)
+    properties = g.get_task_properties(tick)
+    if not properties.get("quick", False):
+        return False
+    if properties.get("syncpoint", False) or properties.get("masteronly", False):
+        return False
+    if properties.get("nosend_ports", None):
+        return False
+    if hasattr(task, "refiner_ports") or task.subgraphs():
+        return False
+    # constants are provided by the scheduler without evaluation.
+    return not isinstance(task, (tasks.ConstTask, tasks.FusedTask))
+
+
+def _fuse_tree(g, root, ticks):
+    """
+    Replaces the tasks at `ticks` with a :class:`tasks.FusedTask` at `root`.
+    `ticks` are sorted and end with `root`.
+    """
+    indices = {tick:i for i, tick in enumerate(ticks)}
+    
+    # maps endpoints outside of the tree to the in-port of the fused task.
+    external_ports = {}
+    external_connections = []
+    
+    members = []
+    for tick in ticks:
+        inputs = {}
+        for source, dest in g.get_in_connections(tick):
+            if source.tick in indices:
+                inputs[dest.port] = (indices[source.tick], source.port)
+            else:
+                if source not in external_ports:
+                    port = "in_%s" % len(external_ports)
+                    external_ports[source] = port
+                    external_connections.append((source, graph.Endpoint(root, port)))
+                inputs[dest.port] = (None, external_ports[source])
+        members.append((g.get_task(tick), inputs))
+        
+    properties = g.get_task_properties(root)
+    out_connections = g.get_out_connections(root)
+    
+    for tick in ticks:
+        for source, dest in g.get_in_connections(tick):
+            g.disconnect(source, dest)
+    for source, dest in out_connections:
+        g.disconnect(source, dest)
+    for tick in ticks:
+        g.remove_task(tick)
+        
+    g.add_task(root, tasks.FusedTask(members), properties)
+    for source, dest in external_connections + out_connections:
+        g.connect(source, dest)
+    
+    
+def speculate_branches(g):
+    """
+    Replaces each :class:`tasks.IfTask` whose branches have no side-effects 
+    with its :meth:`tasks.IfTask.speculative_graph`. Both branches 
+    then start as soon as their inputs are available instead of waiting
+    for the condition. The branch that is not taken is discarded.
+    
+    This is not part of :func:`optimize` since it trades worker time
+    for latency.
+    
+    :returns: Number of replaced tasks.
+    """
+    count = 0
+    
+    # Inner-most graphs first, so that the branches
+    # are processed before the `if` they belong to.
+    for subgraph in reversed(all_graphs(g)):
+        count += _speculate_branches(subgraph)
+    logger.debug("Speculating on %s if statements." % count)
+    return count
+
+
+def _speculate_branches(g):
+    count = 0
+    for tick in g.get_all_ticks():
+        task = g.get_task(tick)
+        if not isinstance(task, tasks.IfTask):
+            continue
+        if any(utils.contains_sideeffects(branch) for branch in task.subgraphs()):
+            continue
+        refine.replace_task(g, tick, task.speculative_graph())
+        count += 1
+    return count
+
+
+def count_tasks(g):
+    """
+    Returns the number of tasks in `g` including those in nested graphs.
+    """
+    return sum(len(subgraph.get_all_ticks()) for subgraph in all_graphs(g))
+
+
+def _is_const(g, tick):
+    return tick != graph.START_TICK and isinstance(g.get_task(tick), tasks.ConstTask)
+
+
+def replace_task(g, tick, task):
+    """
+    Replaces the task at `tick` with `task` with the same ports. The
+    properties and connections of the old task are kept.
+    """
+    properties = g.get_task_properties(tick)
+    in_connections = g.get_in_connections(tick)
+    out_connections = g.get_out_connections(tick)
+
+    for source, dest in in_connections + out_connections:
+        g.disconnect(source, dest)
+    g.remove_task(tick)
+
+    g.add_task(tick, task, properties)
+    for source, dest in in_connections:
+        if dest.port in task.input_ports():
+            g.connect(source, dest)
+    for source, dest in out_connections:
+        g.connect(source, dest)
+
+
+def remove_if_unused(g, tick):
+    """
+    Removes the task at `tick` if it has no outgoing connections and no
+    side-effects.
+    """
+    if tick == graph.START_TICK:
+        return
+    try:
+        g.get_task(tick)
+    except KeyError:
+        return # already removed
+    if g.get_out_connections(tick):
+        return
+    if g.get_task_properties(tick).get("syncpoint", False):
+        return
+    for source, dest in g.get_in_connections(tick):
+        g.disconnect(source, dest)
+    g.remove_task(tick)
+
+
+def all_graphs(g):
+    """
+    Returns `g` and all graphs nested within tasks of `g`, each only once.
+    This includes the graphs of :class:`tasks.FunctionDefTask`.
+    """
+    found = []
+    visited = set()
+
+    def visit(g):
+        # loop bodies contain themselves.
+        if id(g) in visited:
+            return
+        visited.add(id(g))
+        found.append(g)
+
+        for tick in g.get_all_ticks():
+            task = g.get_task(tick)
+            for subgraph in task.subgraphs():
+                visit(subgraph)
+            if isinstance(task, tasks.FunctionDefTask):
+                visit(task.graph)
+    visit(g)
+    return found
@@ -4,7 +4,96 @@
 Methods that help with changeing the graph.
 """
 
+import weakref
+
 from pydron.dataflow import graph
+
+
+class SubgraphTemplate(object):
+    """
+    A subgraph in a form that is quick to insert into other graphs
+    several times, such as the body of a loop.
+    
+    The template does not follow changes made to the subgraph
+    after it was created.
+    """
+    
+    def __init__(self, subgraph):
+        #: `(tick, task, properties)` for each task of the subgraph.
+        self.tasks = []
+        
+        #: `(source_tick, source_port, dest_tick, dest_port)` for each
+        #: connection between two tasks of the subgraph.
+        self.edges = []
+        
+        #: `(port, dest_tick, dest_port)` for each connection from an input
+        #: of the subgraph to a task.
+        self.inputs = []
+        
+        #: Maps the outputs of the subgraph to their source endpoint. The source
+        #: is on `START_TICK` if an input is passed through.
+        self.outputs = {}
+        
+        for tick in sorted(subgraph.get_all_ticks()):
+            self.tasks.append((tick, subgraph.get_task(tick), dict(subgraph.get_task_properties(tick))))
+            for source, dest in subgraph.get_in_connections(tick):
+                if source.tick == graph.START_TICK:
+                    self.inputs.append((source.port, dest.tick, dest.port))
+                else:
+                    self.edges.append((source.tick, source.port, dest.tick, dest.port))
+        for source, dest in subgraph.get_in_connections(graph.FINAL_TICK):
+            self.outputs[dest.port] = source
+            
+    def input_ports(self):
+        """
+        Returns the names of the inputs of the subgraph, including those
+        which are passed through to an output.
+        """
+        ports = {port for port, _, _ in self.inputs}
+        ports.update(source.port for source in self.outputs.itervalues() if source.tick == graph.START_TICK)
+        return ports
+            
+    def insert(self, g, supertick):
+        """
+        Adds the tasks and the connections between them to `g`, 
+        all ticks shifted by `supertick`.
+        
+        :returns: `dict` that maps the ticks of the subgraph to the ticks in `g`.
+        """
+        shifted = {}
+        with g.batch():
+            for tick, task, properties in self.tasks:
+                newtick = tick << supertick
+                shifted[tick] = newtick
+                g.add_task(newtick, task, properties)
+            for source_tick, source_port, dest_tick, dest_port in self.edges:
+                g.connect(graph.Endpoint(shifted[source_tick], source_port),
+                          graph.Endpoint(shifted[dest_tick], dest_port))
+        return shifted
+    
+    
+#: `id(subgraph)` -> `(weakref to subgraph, template)`.
+_templates = {}
+
+def cached_template(subgraph):
+    """
+    Returns the :class:`SubgraphTemplate` of `subgraph`. The template is 
+    only created the first time, so `subgraph` must not change afterwards.
+    This is meant for graphs that are inserted over and over, such as loop bodies.
+    """
+    key = id(subgraph)
+    entry = _templates.get(key, None)
+    if entry is not None and entry[0]() is subgraph:
+        return entry[1]
+    
+    def forget(ref):
+        if key in _templates and _templates[key][0] is ref:
+            del _templates[key]
+            
+    template = SubgraphTemplate(subgraph)
+    _templates[key] = (weakref.ref(subgraph, forget), template)
+    return template
+
     
 def replace_task(g, tick, subgraph, subgraph_tick=None, additional_inputs={}):
     """
@@ -32,27 +121,24 @@ def replace_task(g, tick, subgraph, subgraph_tick=None, additional_inputs={}):
       the rules above for inputs of the subgraph.
       
     * use the rules for inputs to find the source. This will fail if there is none to be found.
-
+    
+    `subgraph` may also be a :class:`SubgraphTemplate`.
     """
     
     if subgraph_tick is None:
         subgraph_tick = tick
+        
+    if not isinstance(subgraph, SubgraphTemplate):
+        subgraph = SubgraphTemplate(subgraph)
     
     task_input_map = {dest.port: source for source, dest in g.get_in_connections(tick)}
     task_input_map.update(additional_inputs)
     
-    subgraph_output_map = {dest.port: source for source, dest in subgraph.get_in_connections(graph.FINAL_TICK)}
+    subgraph_output_map = subgraph.outputs
     
-
-    # Prepare the connections to hook up the subgraph's inputs.
-    input_connections = []
-    for source, dest in subgraph.get_out_connections(graph.START_TICK):
-        task_input = task_input_map[source.port]
-        if dest.tick == graph.FINAL_TICK:
-            continue # direct connection are treated as output connecions.
-        else:
-            subgraph_dest = graph.Endpoint(dest.tick << subgraph_tick, dest.port)
-            input_connections.append((task_input, subgraph_dest))
+    # Check that we have all the inputs.
+    for port in subgraph.input_ports():
+        task_input_map[port]
         
     # Prepare the connections to replace the ones of the removed task.
     output_connections = []
@@ -74,19 +160,20 @@ def replace_task(g, tick, subgraph, subgraph_tick=None, additional_inputs={}):
             raise ValueError("No input on the replaced task for output %s" % `source.port`)
         output_connections.append((source, dest))
     
-    # Remove the task
-    for source, dest in g.get_in_connections(tick):
-        g.disconnect(source, dest)
-    for source, dest in g.get_out_connections(tick):
-        g.disconnect(source, dest)
-    g.remove_task(tick)
-    
-    # Insert subgraph, make connections
-    insert_subgraph(g, subgraph, subgraph_tick)
-    for source, dest in input_connections:
-        g.connect(source, dest)
-    for source, dest in output_connections:
-        g.connect(source, dest)
+    with g.batch():
+        # Remove the task
+        for source, dest in g.get_in_connections(tick):
+            g.disconnect(source, dest)
+        for source, dest in g.get_out_connections(tick):
+            g.disconnect(source, dest)
+        g.remove_task(tick)
+        
+        # Insert subgraph, make connections
+        shifted = subgraph.insert(g, subgraph_tick)
+        for port, dest_tick, dest_port in subgraph.inputs:
+            g.connect(task_input_map[port], graph.Endpoint(shifted[dest_tick], dest_port))
+        for source, dest in output_connections:
+            g.connect(source, dest)
     
 
 def insert_subgraph(g, subgraph, supertick):
@@ -94,19 +181,30 @@ def insert_subgraph(g, subgraph, supertick):
     Inserts all tasks and connections between them from `subgraph` into `g`.
     All ticks are shifted by `supertick`. The connections to START_TICK and FINAL_TICK
     are NOT copied.
-    """
-    
-    for tick in subgraph.get_all_ticks():
-        newtick = tick << supertick
-        g.add_task(newtick, subgraph.get_task(tick), subgraph.get_task_properties(tick))
-        
     
-    for tick in list(subgraph.get_all_ticks()) + [graph.FINAL_TICK]:
+    `subgraph` may also be a :class:`SubgraphTemplate`.
+    """
+    if not isinstance(subgraph, SubgraphTemplate):
+        subgraph = SubgraphTemplate(subgraph)
+    subgraph.insert(g, supertick)
         
-        for source, dest in subgraph.get_in_connections(tick):
-            if source.tick == graph.START_TICK or dest.tick == graph.FINAL_TICK:
-                continue
-            g.connect(graph.Endpoint(source.tick << supertick, source.port),
-                      graph.Endpoint(dest.tick << supertick, dest.port))
         
-        
\ No newline at end of file
+def remove_subtree(g, tick):
+    """
+    Removes the task at `tick` (if there is one) and all tasks with ticks 
+    that were shifted by `tick`, together with all their connections.
+    
+    :returns: Ticks of the removed tasks.
+    """
+    end = tick + 1
+    ticks = [t for t in g.get_all_ticks() if tick <= t < end]
+    
+    with g.batch():
+        for t in ticks:
+            for source, dest in g.get_in_connections(t):
+                g.disconnect(source, dest)
+            for source, dest in g.get_out_connections(t):
+                g.disconnect(source, dest)
+        for t in ticks:
+            g.remove_task(t)
+    return ticks
@@ -1,12 +1,19 @@
 # Copyright (C) 2015 Stefan C. Mueller
 import importlib
+import itertools
 import logging
+import operator
 import __builtin__
-from pydron import whitelist
+from pydron import purity
 from pydron.dataflow import graph, refine, utils
 from pydron.translation import builtins
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 logger = logging.getLogger(__name__)
 
 class ScheduledCallable(object):
@@ -32,93 +39,100 @@ class ScheduledCallable(object):
         self.func_defaults = default_values
         
     
-    def __call__(self, *args, **kwargs):
+    def calling_convention(self, call_args, call_kwargs, default_values=None):
         """
-        Execute the call by letting the scheduler run the graph.
+        Takes the positional and keyword arguments of the call
+        and maps them to the parameters of the called method.
+        This is a bit complicated because the callee might
+        have `*args` and `**kwargs` as well as default values for
+        parameters.
+        
+        Returns `args`, `vararg`, and `kwarg` for the callee.
+        The first has the same length as `self.args`.
+        The later two are `None` if `self.vararg` or `self.kwarg`
+        are `None`
+        
+        The arguments are not inspected, so this can also be used to bind
+        placeholders for the values, for example endpoints of a graph.
+        
+        :param default_values: Values to use for parameters with default
+          value. If `None`, `self.default_values` is used.
         """
+        if default_values is None:
+            default_values = self.default_values
         
-        def calling_convention(call_args, call_kwargs):
-            """
-            Takes the positional and keyword arguments of the call
-            and maps them to the parameters of the called method.
-            This is a bit complicated because the callee might
-            have `*args` and `**kwargs` as well as default values for
-            parameters.
-            
-            Returns `args`, `vararg`, and `kwarg` for the callee.
-            The first has the same length as `self.args`.
-            The later two are `None` if `self.vararg` or `self.kwarg`
-            are `None`
-            """
-            
-            # Positional arguments of the callee.
-            # Keep track for which we know the value already.
-            # We use a separate list since `None` is a valid argument.
-            callee_args = [None] * len(self.args)
-            callee_args_marker = [False] * len(self.args)
-            
-            # Match positional arguments of the call to positional
-            # parameters of the callee.
-            formal_matches = min(len(call_args), len(self.args))
-            for i in range(formal_matches):
-                callee_args[i] = args[i]
-                callee_args_marker[i] = True
+        # Positional arguments of the callee.
+        # Keep track for which we know the value already.
+        # We use a separate list since `None` is a valid argument.
+        callee_args = [None] * len(self.args)
+        callee_args_marker = [False] * len(self.args)
+        
+        # Match positional arguments of the call to positional
+        # parameters of the callee.
+        formal_matches = min(len(call_args), len(self.args))
+        for i in range(formal_matches):
+            callee_args[i] = call_args[i]
+            callee_args_marker[i] = True
+            
+        # Any positional arguments of the call that doesn't
+        # match a positional parameter o the callee goes
+        # into `*args` if the callee has that.
+        remaining_args = len(call_args) - formal_matches
+        if self.vararg:
+            if remaining_args:
+                callee_vararg = tuple(call_args[-remaining_args:])
+            else:
+                callee_vararg = tuple()
+        else:
+            if remaining_args:
+                raise TypeError("Passed %s arguments, callee expects %s" % (len(call_args), len(self.args)))
+            else:
+                callee_vararg = None
                 
-            # Any positional arguments of the call that doesn't
-            # match a positional parameter o the callee goes
-            # into `*args` if the callee has that.
-            remaining_args = len(call_args) - formal_matches
-            if self.vararg:
-                if remaining_args:
-                    callee_vararg = tuple(call_args[-remaining_args:])
-                else:
-                    callee_vararg = tuple()
+        # Fill keyword arguments of the call to positional arguments
+        # of the callee.
+        # All that we don't find an argument for are going into `**kwargs`
+        # of the callee...
+        callee_kwarg = {}
+        for key, val in call_kwargs.iteritems():
+            try:
+                i = self.args.index(key)
+            except ValueError:
+                callee_kwarg[key] = val
             else:
-                if remaining_args:
-                    raise TypeError("Passed %s arguments, callee expects %s" % (len(call_args), len(self.args)))
+                if callee_args_marker[i]:
+                    raise TypeError("Parameter %s already assigned." % key)
                 else:
-                    callee_vararg = None
+                    callee_args[i] = val
+                    callee_args_marker[i] = True
                     
-            # Fill keyword arguments of the call to positional arguments
-            # of the callee.
-            # All that we don't find an argument for are going into `**kwargs`
-            # of the callee...
-            callee_kwarg = {}
-            for key, val in call_kwargs.iteritems():
-                try:
-                    i = self.args.index(key)
-                except ValueError:
-                    callee_kwarg[key] = val
-                else:
-                    if callee_args_marker[i]:
-                        raise TypeError("Parameter %s already assigned." % key)
-                    else:
-                        callee_args[i] = val
-                        callee_args_marker[i] = True
-                        
-            # ... if callee has `**kwargs`.
-            if not self.kwarg:
-                if callee_kwarg:
-                    raise TypeError("No parameter named %s" % next(iter(callee_kwarg)))
+        # ... if callee has `**kwargs`.
+        if not self.kwarg:
+            if callee_kwarg:
+                raise TypeError("No parameter named %s" % next(iter(callee_kwarg)))
+            else:
+                callee_kwarg = None
+        
+        # Positional arguments of the callee for which we still miss
+        # the value are filled with the default value (if one exists).
+        num_args_without_default = len(self.args) - len(default_values)
+        for i in range(len(self.args)):
+            if not callee_args_marker[i]:
+                if i >= num_args_without_default:
+                    val = default_values[i - num_args_without_default]
+                    callee_args[i] = val
+                    callee_args_marker[i] = True
                 else:
-                    callee_kwarg = None
-            
-            # Positional arguments of the callee for which we still miss
-            # the value are filled with the default value (if one exists).
-            num_args_without_default = len(self.args) - len(self.default_values)
-            for i in range(len(self.args)):
-                if not callee_args_marker[i]:
-                    if i >= num_args_without_default:
-                        val = self.default_values[num_args_without_default + i]
-                        callee_args[i] = val
-                        callee_args_marker[i] = True
-                    else:
-                        raise TypeError("Passed %s arguments, callee expects %s" % (len(call_args), num_args_without_default))
-                    
-            
-            return callee_args, callee_vararg, callee_kwarg
-    
-        callee_args, callee_vararg, callee_kwarg = calling_convention(args, kwargs)
+                    raise TypeError("Passed %s arguments, callee expects %s" % (len(call_args), num_args_without_default))
+                
+        
+        return callee_args, callee_vararg, callee_kwarg
+
+    def __call__(self, *args, **kwargs):
+        """
+        Execute the call by letting the scheduler run the graph.
+        """
+        callee_args, callee_vararg, callee_kwarg = self.calling_convention(args, kwargs)
         
         inputs = {}
         for i in range(len(self.args)):
@@ -152,6 +166,13 @@ class AbstractTask(object):
     # to the scheduler for refinement.
     #refiner_reducer = {}
     
+    # Refiner ports whose reduced value only depends
+    # on which global callable is connected to them.
+    # If the port is connected to a `ReadGlobal` task,
+    # the scheduler may reuse the reduced value of
+    # an earlier refinement that read the same global.
+    #refiner_cacheable = set()
+    
     def input_ports(self):
         raise NotImplementedError("abstract")
     
@@ -281,10 +302,123 @@ class IfTask(AbstractTask):
             subgraph = self.orelse_graph
             
         refine.replace_task(g, tick, subgraph)
+        
+    def speculative_graph(self):
+        """
+        Returns a graph that can replace this task and which evaluates both
+        branches without waiting for `$test`. A :class:`BranchSelectTask`
+        decides which outputs to use once `$test` is known and discards
+        the other branch.
+        
+        Only use this if neither branch has side-effects.
+        """
+        ports = self.output_ports()
+        select_tick = graph.START_TICK + BranchSelectTask.SELECT_OFFSET
+        
+        subgraph = graph.Graph()
+        subgraph.add_task(select_tick, BranchSelectTask(ports), {})
+        subgraph.connect(graph.Endpoint(graph.START_TICK, "$test"), 
+                         graph.Endpoint(select_tick, "$test"))
+        
+        for name, branch in (("body", self.body_graph), ("orelse", self.orelse_graph)):
+            branch_tick = graph.START_TICK + BranchSelectTask.BRANCH_OFFSETS[name]
+            refine.insert_subgraph(subgraph, branch, branch_tick)
+            
+            for source, dest in branch.get_out_connections(graph.START_TICK):
+                if dest.tick != graph.FINAL_TICK:
+                    subgraph.connect(source, graph.Endpoint(dest.tick << branch_tick, dest.port))
+                    
+            outputs = {dest.port: source for source, dest in branch.get_in_connections(graph.FINAL_TICK)}
+            for port in ports:
+                # Outputs the branch does not assign keep the value they had before.
+                source = outputs.get(port, graph.Endpoint(graph.START_TICK, port))
+                if source.tick != graph.START_TICK:
+                    source = graph.Endpoint(source.tick << branch_tick, source.port)
+                subgraph.connect(source, graph.Endpoint(select_tick, "%s:%s" % (name, port)))
+        
+        for port in ports:
+            subgraph.connect(graph.Endpoint(select_tick, port), 
+                             graph.Endpoint(graph.FINAL_TICK, port))
+        return subgraph
     
     def __repr__(self):
         return "IfTask(%s, %s)" % (self.body_graph, self.orelse_graph)
 
+
+class BranchSelectTask(AbstractTask):
+    """
+    Part of the graph returned by :meth:`IfTask.speculative_graph`. 
+    
+    It has the outputs of both branches of the `if` as inputs, named
+    `body:<port>` and `orelse:<port>`. Once `$test` is known, the task
+    is replaced by a pass-through of the outputs of the branch that was taken.
+    The tasks of the other branch are removed from the graph, even if they
+    are still running or have already been evaluated.
+    """
+    
+    refiner_ports = {"$test"}
+    refiner_reducer = {"$test": bool}
+    
+    #: Ticks of the branches relative to the replaced :class:`IfTask`.
+    BRANCH_OFFSETS = {"body": 1, "orelse": 2}
+    
+    #: Tick of this task relative to the replaced :class:`IfTask`.
+    SELECT_OFFSET = 3
+    
+    def __init__(self, ports):
+        self.ports = frozenset(ports)
+        
+    def input_ports(self):
+        return ({"%s:%s" % (name, port) for name in self.BRANCH_OFFSETS for port in self.ports} | 
+                {"$test"})
+    
+    def output_ports(self):
+        return set(self.ports)
+    
+    def evaluate(self, inputs):
+        raise ValueError("replaced by subgraph")
+    
+    def refine(self, g, tick, known_inputs):
+        if known_inputs["$test"]:
+            taken, discarded = "body", "orelse"
+        else:
+            taken, discarded = "orelse", "body"
+            
+        subgraph = graph.Graph()
+        for port in self.ports:
+            subgraph.connect(graph.Endpoint(graph.START_TICK, "%s:%s" % (taken, port)), 
+                             graph.Endpoint(graph.FINAL_TICK, port))
+        refine.replace_task(g, tick, subgraph)
+        
+        if_tick = tick >> 1
+        discarded_tick = graph.START_TICK + self.BRANCH_OFFSETS[discarded] << if_tick
+        removed = refine.remove_subtree(g, discarded_tick)
+        logger.debug("Discarded %s tasks of the %s branch of %r." % (len(removed), discarded, if_tick))
+        
+    def __repr__(self):
+        return "BranchSelectTask(%r)" % sorted(self.ports)
+
+
+def in_undecided_branch(g, tick):
+    """
+    Returns `True` if the task at `tick` belongs to a branch of an `if` 
+    which is evaluated speculatively and it is not yet known
+    if the branch is taken.
+    """
+    branch_offsets = BranchSelectTask.BRANCH_OFFSETS.values()
+    while len(tick._elements) > 2: # stop at the top-level
+        parent = tick >> 1
+        if tick._elements[-1] in branch_offsets:
+            select_tick = graph.START_TICK + BranchSelectTask.SELECT_OFFSET << parent
+            try:
+                if isinstance(g.get_task(select_tick), BranchSelectTask):
+                    return True
+            except KeyError:
+                pass
+        tick = parent
+    return False
+
+
 class IterTask(AbstractTask):
     def __init__(self):
         pass
@@ -301,8 +435,114 @@ class IterTask(AbstractTask):
     def __repr__(self):
         return "IterTask()"
 
+def _sequence_length(iterable):
+    if isinstance(iterable, (list, tuple, xrange, basestring)):
+        return len(iterable)
+    elif numpy is not None and isinstance(iterable, numpy.ndarray) and iterable.ndim > 0:
+        return len(iterable)
+    else:
+        return None
+
+
+class _Raised(object):
+    """
+    Value of the outputs of a :class:`GuardTask` whose task raised an exception.
+    """
+    
+    def __init__(self, exception):
+        self.exception = exception
+        
+    def __repr__(self):
+        return "_Raised(%r)" % self.exception
+    
+    
+def raise_guarded(*values):
+    """
+    Raises the exception of the first value that is the output
+    of a failed :class:`GuardTask`.
+    """
+    for value in values:
+        if isinstance(value, _Raised):
+            raise value.exception
+        
+        
+def _is_raised(values):
+    return any(isinstance(value, _Raised) for value in values)
+
+
+def _raised_exception(value):
+    """
+    Reducer for the guarded inputs of loops.
+    """
+    if isinstance(value, _Raised):
+        return value.exception
+    else:
+        return None
+    
+    
+def guard_loop_inputs(looptask, ports):
+    """
+    Marks inputs of a :class:`ForTask` or :class:`WhileTask` that are 
+    the outputs of :class:`GuardTask` tasks moved out of the loop body.
+    Their exception is raised once the body is executed.
+    """
+    looptask.guarded_ports = looptask.guarded_ports | frozenset(ports)
+    looptask.refiner_ports = looptask.refiner_ports | set(ports)
+    reducer = dict(getattr(looptask, "refiner_reducer", {}))
+    for port in ports:
+        reducer[port] = _raised_exception
+    looptask.refiner_reducer = reducer
+    
+    
+def _raise_guarded_inputs(looptask, known_inputs):
+    for port in sorted(looptask.guarded_ports):
+        exception = known_inputs.get(port, None)
+        if exception is not None:
+            raise exception
+    
+    
+class GuardTask(AbstractTask):
+    """
+    Evaluates `task`, but instead of raising an exception all outputs
+    are set to a value that holds the exception. If an input holds an
+    exception, it is passed on without evaluating `task`.
+    
+    Used for values that Python only evaluates under a condition that
+    is not known when the task runs. The consumers raise the exception
+    with :func:`raise_guarded` once it is clear that Python would have
+    evaluated the value.
+    """
+    
+    def __init__(self, task):
+        self.task = task
+        
+    def input_ports(self):
+        return self.task.input_ports()
+    
+    def output_ports(self):
+        return self.task.output_ports()
+    
+    def subgraphs(self):
+        return self.task.subgraphs()
+    
+    def evaluate(self, inputs):
+        for value in inputs.itervalues():
+            if isinstance(value, _Raised):
+                return {port: value for port in self.output_ports()}
+        try:
+            return self.task.evaluate(inputs)
+        except Exception as e:
+            raised = _Raised(e)
+            return {port: raised for port in self.output_ports()}
+        
+    def __repr__(self):
+        return "GuardTask(%r)" % self.task
+
 class ForTask(AbstractTask):
     
+    #: Inputs that hold the result of a :class:`GuardTask`, see :func:`guard_loop_inputs`.
+    guarded_ports = frozenset()
+    
     def __init__(self, is_tail, has_breaked_input, body_graph, orelse_graph):
         """
         :param is_tail: If `False` this task represents the complete loop. If `True`
@@ -376,6 +616,8 @@ class ForTask(AbstractTask):
             use_body = False
             
         if use_body:
+            _raise_guarded_inputs(self, known_inputs)
+            
             if self.is_tail:
                 # the last tick item is the for-tail
                 # the prev. to last is the subgraph_tick
@@ -393,12 +635,13 @@ class ForTask(AbstractTask):
             item_tick = graph.START_TICK + 1 << iteration_tick
             subgraph_tick = graph.START_TICK + 2 << iteration_tick
             
-            g.add_task(item_tick, ConstTask(item))
-            item_endpoint = graph.Endpoint(item_tick, "value")
-            
-            refine.replace_task(g, tick, self.body_graph, 
-                                subgraph_tick=subgraph_tick, 
-                                additional_inputs={'$target':item_endpoint})
+            with g.batch():
+                g.add_task(item_tick, ConstTask(item))
+                item_endpoint = graph.Endpoint(item_tick, "value")
+                
+                refine.replace_task(g, tick, refine.cached_template(self.body_graph), 
+                                    subgraph_tick=subgraph_tick, 
+                                    additional_inputs={'$target':item_endpoint})
         else:
             refine.replace_task(g, tick, self.orelse_graph)
     
@@ -406,8 +649,368 @@ class ForTask(AbstractTask):
         return "ForTask(%s, %s, %s, %s)" % (self.is_tail, self.has_breaked_input, self.body_graph, self.orelse_graph)
     
     
+class UnrolledForTask(ForTask):
+    """
+    `for` loop whose iterations don't depend on each other.
+    
+    If the iterable is a sequence, up to `window` iterations are
+    instantiated at once, followed by another :class:`UnrolledForTask`
+    for the remaining elements. Each iteration reads its element from
+    the iterable by index. Other iterables are iterated over with a 
+    regular :class:`ForTask`.
+    
+    The body graph is the one of the regular :class:`ForTask`, it
+    still contains the tail task. It must not have an input that
+    is also an output (see :func:`is_independent_body`).
+    
+    For the variables in `reductions` the body only outputs the part
+    that a single iteration contributes. The parts of the instantiated
+    iterations are combined with a balanced tree of :class:`CombineTask`
+    which is then added to the value of the variable before the loop
+    with a :class:`ReduceTask`. Only integer parts are added up ahead,
+    all others are applied in iteration order, so the result is the
+    same as the one of the sequential loop.
+    """
+    
+    refiner_reducer = {"$iterable": _sequence_length}
+    
+    def __init__(self, body_graph, orelse_graph, window, offset=0, reductions=None):
+        """
+        :param window: Maximal number of iterations instantiated by one refinement.
+        
+        :param offset: Index of the first element this task iterates over.
+        
+        :param reductions: Maps variable names to the reduction operator,
+          see :class:`ReduceTask`.
+        """
+        ForTask.__init__(self, False, False, body_graph, orelse_graph)
+        self.refiner_ports = {"$iterable"}
+        self.window = window
+        self.offset = offset
+        self.reductions = reductions if reductions is not None else {}
+        
+    def input_ports(self):
+        return (ForTask.input_ports(self) - {"$iterator"}) | {"$iterable"}
+    
+    def refine(self, g, tick, known_inputs):
+        length = known_inputs["$iterable"]
+        properties = g.get_task_properties(tick)
+        
+        subgraph = graph.Graph()
+        if length is None:
+            # Not a sequence. Iterate one element after the other.
+            iter_tick = graph.START_TICK + 1
+            loop_tick = graph.START_TICK + 2
+            
+            subgraph.add_task(iter_tick, IterTask(), {"quick": True})
+            subgraph.connect(graph.Endpoint(graph.START_TICK, "$iterable"), 
+                             graph.Endpoint(iter_tick, "iterable"))
+            
+            body = accumulating_body(self.body_graph, self.reductions)
+            loop = ForTask(False, False, body, self.orelse_graph)
+            subgraph.add_task(loop_tick, loop, properties)
+            subgraph.connect(graph.Endpoint(iter_tick, "value"),
+                             graph.Endpoint(loop_tick, "$iterator"))
+            for port in loop.input_ports() - {"$iterator"}:
+                subgraph.connect(graph.Endpoint(graph.START_TICK, port),
+                                 graph.Endpoint(loop_tick, port))
+            for port in loop.output_ports():
+                subgraph.connect(graph.Endpoint(loop_tick, port),
+                                 graph.Endpoint(graph.FINAL_TICK, port))
+            refine.replace_task(g, tick, subgraph)
+            return
+        
+        count = max(0, min(self.window, length - self.offset))
+        body = refine.SubgraphTemplate(_remove_tail(self.body_graph))
+        
+        # Latest value of each output of the loop.
+        outputs = {}
+        
+        # Part of each iteration for the reductions.
+        parts = {var: [] for var in self.reductions}
+        for i in range(count):
+            iteration_tick = graph.START_TICK + (i + 1)
+            index_tick = graph.START_TICK + 1 << iteration_tick
+            item_tick = graph.START_TICK + 2 << iteration_tick
+            body_tick = graph.START_TICK + 3 << iteration_tick
+            
+            subgraph.add_task(index_tick, ConstTask(self.offset + i), {"quick": True})
+            subgraph.add_task(item_tick, SubscriptTask(), {"quick": True})
+            subgraph.connect(graph.Endpoint(graph.START_TICK, "$iterable"),
+                             graph.Endpoint(item_tick, "object"))
+            subgraph.connect(graph.Endpoint(index_tick, "value"),
+                             graph.Endpoint(item_tick, "slice"))
+            
+            shifted_ticks = body.insert(subgraph, body_tick)
+            
+            def shifted(endpoint):
+                if endpoint.tick == graph.START_TICK:
+                    if endpoint.port == "$target":
+                        return graph.Endpoint(item_tick, "value")
+                    return endpoint
+                return graph.Endpoint(shifted_ticks[endpoint.tick], endpoint.port)
+            
+            for port, dest_tick, dest_port in body.inputs:
+                subgraph.connect(shifted(graph.Endpoint(graph.START_TICK, port)),
+                                 graph.Endpoint(shifted_ticks[dest_tick], dest_port))
+            for port, source in body.outputs.iteritems():
+                if port in parts:
+                    parts[port].append(shifted(source))
+                else:
+                    outputs[port] = shifted(source)
+        
+        next_tick = count + 1
+        if count and self.reductions:
+            combine_tick = graph.START_TICK + next_tick
+            combine_ticks = (graph.START_TICK + i << combine_tick for i in itertools.count(1))
+            next_tick += 1
+            for var, op in sorted(self.reductions.items()):
+                combined = _combine_tree(subgraph, combine_ticks, parts[var], op)
+                
+                reduce_tick = next(combine_ticks)
+                subgraph.add_task(reduce_tick, ReduceTask(op), {"quick": True, "syncpoint": True})
+                subgraph.connect(graph.Endpoint(graph.START_TICK, var), 
+                                 graph.Endpoint(reduce_tick, "target"))
+                subgraph.connect(combined, graph.Endpoint(reduce_tick, "value"))
+                outputs[var] = graph.Endpoint(reduce_tick, "value")
+        
+        if self.offset + count < length:
+            tail_tick = graph.START_TICK + next_tick
+            tail = UnrolledForTask(self.body_graph, self.orelse_graph, self.window, self.offset + count, self.reductions)
+            subgraph.add_task(tail_tick, tail, properties)
+            for port in tail.input_ports():
+                source = outputs.get(port, graph.Endpoint(graph.START_TICK, port))
+                subgraph.connect(source, graph.Endpoint(tail_tick, port))
+            for port in tail.output_ports():
+                subgraph.connect(graph.Endpoint(tail_tick, port),
+                                 graph.Endpoint(graph.FINAL_TICK, port))
+        else:
+            for port, source in outputs.iteritems():
+                subgraph.connect(source, graph.Endpoint(graph.FINAL_TICK, port))
+                
+        refine.replace_task(g, tick, subgraph)
+    
+    def __repr__(self):
+        return "UnrolledForTask(%s, %s, %s, %s, %s)" % (self.body_graph, self.orelse_graph, self.window, self.offset, self.reductions)
+    
+
+def _combine_tree(g, ticks, parts, op):
+    """
+    Adds a balanced tree of :class:`CombineTask` to `g` that combines
+    the given endpoints in order. Returns the endpoint with the result.
+    
+    :param ticks: Iterator with the ticks to use for the tasks.
+    """
+    level = parts
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            tick = next(ticks)
+            g.add_task(tick, CombineTask(op), {"quick": True})
+            g.connect(level[i], graph.Endpoint(tick, "left"))
+            g.connect(level[i + 1], graph.Endpoint(tick, "right"))
+            next_level.append(graph.Endpoint(tick, "value"))
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def _find_tail(body_graph):
+    for tick in body_graph.get_all_ticks():
+        task = body_graph.get_task(tick)
+        if isinstance(task, (ForTask, WhileTask)) and task.is_tail:
+            return tick
+    return None
+
+def _remove_tail(body_graph):
+    """
+    Returns a copy of the body graph of a loop without the
+    task that runs the remaining iterations.
+    """
+    body = graph.Graph()
+    tail_tick = _find_tail(body_graph)
+    for tick in body_graph.get_all_ticks():
+        if tick != tail_tick:
+            body.add_task(tick, body_graph.get_task(tick), body_graph.get_task_properties(tick))
+    
+    tail_inputs = {dest.port: source for source, dest in body_graph.get_in_connections(tail_tick)}
+    for tick in body.get_all_ticks():
+        for source, dest in body_graph.get_in_connections(tick):
+            body.connect(source, dest)
+    for source, dest in body_graph.get_in_connections(graph.FINAL_TICK):
+        if source.tick == tail_tick:
+            source = tail_inputs[source.port]
+        body.connect(source, dest)
+    return body
+
+
+def accumulating_body(body_graph, reductions):
+    """
+    Returns a copy of the body graph of an :class:`UnrolledForTask` in which
+    each iteration adds its part to the reductions, so that it can be used
+    by a regular :class:`ForTask`.
+    """
+    if not reductions:
+        return body_graph
+    
+    tail_tick = _find_tail(body_graph)
+    tail = body_graph.get_task(tail_tick)
+    
+    body = graph.Graph()
+    for tick in body_graph.get_all_ticks():
+        if tick == tail_tick:
+            task = ForTask(True, tail.has_breaked_input, body, tail.orelse_graph)
+        else:
+            task = body_graph.get_task(tick)
+        body.add_task(tick, task, body_graph.get_task_properties(tick))
+        
+    # The reductions execute after the last task before the tail.
+    previous = max([tick for tick in body_graph.get_all_ticks() if tick < tail_tick] or [graph.START_TICK])
+    reduce_ticks = (graph.START_TICK + i << (graph.START_TICK << previous) for i in itertools.count(1))
+    
+    tail_inputs = {dest.port: source for source, dest in body_graph.get_in_connections(tail_tick)}
+    for var, op in sorted(reductions.items()):
+        reduce_tick = next(reduce_ticks)
+        body.add_task(reduce_tick, ReduceTask(op), {"quick": True, "syncpoint": True})
+        body.connect(graph.Endpoint(graph.START_TICK, var), graph.Endpoint(reduce_tick, "target"))
+        body.connect(tail_inputs[var], graph.Endpoint(reduce_tick, "value"))
+        tail_inputs[var] = graph.Endpoint(reduce_tick, "value")
+        
+    for tick in body_graph.get_all_ticks() + [graph.FINAL_TICK]:
+        if tick == tail_tick:
+            continue
+        for source, dest in body_graph.get_in_connections(tick):
+            body.connect(source, dest)
+    for port, source in tail_inputs.iteritems():
+        body.connect(source, graph.Endpoint(tail_tick, port))
+    return body
+
+
+def is_independent_body(body_graph):
+    """
+    Checks if the iterations of a loop with the given body can run
+    in parallel. The body must not have an output that is also an input,
+    except for the inputs that only the tail task reads.
+    """
+    body = _remove_tail(body_graph)
+    inputs = {source.port for source, _ in body.get_out_connections(graph.START_TICK)}
+    outputs = {dest.port for _, dest in body.get_in_connections(graph.FINAL_TICK)}
+    return not (inputs & outputs)
+    
+    
+#: Types for which `+` and `*` are associative. Floats are not, 
+#: due to rounding.
+_EXACT_TYPES = (int, long)
+
+
+class _ReductionParts(list):
+    """
+    Parts of a reduction which :class:`ReduceTask` applies to the
+    variable one after the other, since combining them first might
+    give a different result: `acc += a + b` is not always the same 
+    as `acc += a; acc += b`, for example if `acc` is a list and the 
+    parts are tuples, or if they are floats.
+    """
+    
+    #: Combination of all parts if they are all of :data:`_EXACT_TYPES`,
+    #: `None` otherwise.
+    total = None
+    
+    
+def _parts(value):
+    if isinstance(value, _ReductionParts):
+        return value
+    parts = _ReductionParts([value])
+    if type(value) in _EXACT_TYPES:
+        parts.total = value
+    return parts
+
+
+def _combine_exact(func):
+    """
+    Returns a combiner that keeps the parts in order and also
+    applies `func` to them if they are of :data:`_EXACT_TYPES`.
+    """
+    def combine(left, right):
+        left = _parts(left)
+        right = _parts(right)
+        parts = _ReductionParts(left + right)
+        if left.total is not None and right.total is not None:
+            parts.total = func(left.total, right.total)
+        return parts
+    return combine
+    
+    
+class ReduceTask(AbstractTask):
+    """
+    Adds the combined parts of several iterations to the value of
+    a reduction variable. Like `target += value` for `op` `"+="`. 
+    For `"append"` the value is a list of elements to append.
+    If the value is a :class:`_ReductionParts` then each of them
+    is added in order, unless both the parts and the variable are
+    of :data:`_EXACT_TYPES`.
+    """
+    
+    def __init__(self, op):
+        self.op = op
+        
+    def input_ports(self):
+        return {"target", "value"}
+    
+    def output_ports(self):
+        return {"value"}
+    
+    def evaluate(self, inputs):
+        acc = inputs["target"]
+        value = inputs["value"]
+        if isinstance(value, _ReductionParts) and value.total is not None and type(acc) in _EXACT_TYPES:
+            acc = builtins.__pydron_reduce__(acc, value.total, self.op)
+        elif self.op == "append" or isinstance(value, _ReductionParts):
+            for element in value:
+                acc = builtins.__pydron_reduce__(acc, element, self.op)
+        else:
+            acc = builtins.__pydron_reduce__(acc, value, self.op)
+        return {"value": acc}
+    
+    def __repr__(self):
+        return "ReduceTask(%r)" % self.op
+    
+    
+class CombineTask(AbstractTask):
+    """
+    Combines the parts of two sets of iterations of a reduction.
+    The operation has to be associative.
+    """
+    
+    #: Maps the reduction operator to the function combining two parts.
+    combiners = {"+=": _combine_exact(operator.add), 
+                 "*=": _combine_exact(operator.mul), 
+                 "min": min, 
+                 "max": max, 
+                 "append": operator.add}
+    
+    def __init__(self, op):
+        self.op = op
+        
+    def input_ports(self):
+        return {"left", "right"}
+    
+    def output_ports(self):
+        return {"value"}
+    
+    def evaluate(self, inputs):
+        return {"value": self.combiners[self.op](inputs["left"], inputs["right"])}
+    
+    def __repr__(self):
+        return "CombineTask(%r)" % self.op
+    
+    
 class WhileTask(AbstractTask):
     
+    #: Inputs that hold the result of a :class:`GuardTask`, see :func:`guard_loop_inputs`.
+    guarded_ports = frozenset()
+    
     def __init__(self, is_tail, has_breaked_input, body_graph, orelse_graph):
         """
         :param is_tail: If `False` this task represents the complete loop. If `True`
@@ -425,10 +1028,10 @@ class WhileTask(AbstractTask):
         
         if self.has_breaked_input:
             self.refiner_ports = {"$test", "$breaked"}
-            self.refiner_reducer = {"$test": bool}
+            self.refiner_reducer = {"$test": bool, "$breaked": bool}
         else:
             self.refiner_ports = {"$test"}
-            self.refiner_reducer = {"$test": bool, "$breaked": bool}
+            self.refiner_reducer = {"$test": bool}
             
     def subgraphs(self):
         return (self.body_graph, self.orelse_graph)
@@ -477,6 +1080,8 @@ class WhileTask(AbstractTask):
         use_body = test == True
             
         if use_body:
+            _raise_guarded_inputs(self, known_inputs)
+            
             if self.is_tail:
                 # the last tick item is the tail
                 # the one before that is the iteration_tick
@@ -491,7 +1096,7 @@ class WhileTask(AbstractTask):
                 
             subgraph_tick = iteration_tick
             
-            refine.replace_task(g, tick, self.body_graph, 
+            refine.replace_task(g, tick, refine.cached_template(self.body_graph), 
                                 subgraph_tick=subgraph_tick)
         else:
             refine.replace_task(g, tick, self.orelse_graph)
@@ -760,14 +1365,43 @@ class TupleTask(AbstractTask):
         return "TupleTask(%s)" % self.num_items
     
     
-def _is_functional(func):
-    functional = getattr(func, "functional", func in whitelist.functional_whitelist)
-    return functional
+def _functionality(func):
+    return purity.functionality(func)
+
+def _callee(func):
+    """
+    Reducer for the function of a :class:`CallTask`. Returns the function
+    itself if it can be inlined, and if it is functional otherwise.
+    """
+    if isinstance(func, ScheduledCallable):
+        return (False, func)
+    else:
+        return (_functionality(func), None)
+    
+class _DefaultValue(object):
+    """
+    Placeholder for a default value when binding the arguments of an inlined call.
+    """
+    def __init__(self, value):
+        self.value = value
     
 class CallTask(AbstractTask):
+    """
+    Calls a function.
+    
+    If the function is a :class:`ScheduledCallable`, the task is refined
+    by the graph of the callee, so that the scheduler sees the tasks of the
+    callee as if they were part of the caller's graph. Calls with `*args`
+    or `**kwargs` are not inlined as the arguments are only known at runtime.
+    """
 
     refiner_ports = {"func"}
-    refiner_reducer = {"func": _is_functional}
+    refiner_reducer = {"func": _callee}
+    refiner_cacheable = {"func"}
+    
+    #: Calls nested deeper than this within inlined calls are not inlined
+    #: anymore. This stops the inlining of recursive calls.
+    MAX_INLINE_DEPTH = 10
     
     def __init__(self, numargs, keywords, has_starargs, has_kwargs):
         self.numargs = numargs
@@ -805,17 +1439,222 @@ class CallTask(AbstractTask):
         return {"value":retval}
     
     def refine(self, g, tick, known_inputs):
-        functional = known_inputs["func"]
+        functional, callee = known_inputs["func"]
+        
+        if callee is not None:
+            depth = g.get_task_properties(tick).get("inline_depth", 0)
+            subgraph = None
+            if depth < self.MAX_INLINE_DEPTH:
+                subgraph = self.inline_graph(callee, depth + 1)
+            if subgraph is not None:
+                refine.replace_task(g, tick, subgraph)
+                return
         
+        if isinstance(functional, purity.OutArguments):
+            functional = functional.allows(self.numargs, self.keywords,
+                                           self.has_starargs, self.has_kwargs)
         if functional:
             g.set_task_property(tick, "syncpoint", False)
 
+    def inline_graph(self, callee, depth):
+        """
+        Returns a graph that takes the inputs of this task and evaluates
+        the body of `callee`, or `None` if the call cannot be inlined.
+        
+        Arguments are bound using :meth:`ScheduledCallable.calling_convention`.
+        Default values are inserted as :class:`ConstTask`, `*args` and `**kwargs` 
+        of the callee are built with a :class:`TupleTask` and a :class:`DictTask`.
+        
+        :param depth: Value of the `inline_depth` property of the inlined tasks.
+        """
+        if self.has_starargs or self.has_kwargs:
+            return None
+        
+        call_args = [graph.Endpoint(graph.START_TICK, "arg_%s" % i) for i in range(self.numargs)]
+        call_kwargs = {k: graph.Endpoint(graph.START_TICK, "karg_%s" % i) for i, k in enumerate(self.keywords)}
+        default_values = [_DefaultValue(v) for v in callee.default_values]
+        try:
+            callee_args, callee_vararg, callee_kwarg = callee.calling_convention(call_args, call_kwargs, default_values)
+        except TypeError:
+            return None # Let the call fail at runtime.
+        
+        subgraph = graph.Graph()
+        binding_ticks = iter(graph.START_TICK + i << (graph.START_TICK + 1) for i in itertools.count(1))
+        
+        def value_task(task, inputs):
+            task_tick = next(binding_ticks)
+            subgraph.add_task(task_tick, task, {"quick": True, "inline_depth": depth})
+            for port, source in inputs:
+                subgraph.connect(source, graph.Endpoint(task_tick, port))
+            return graph.Endpoint(task_tick, "value")
+        
+        def bind(value):
+            if isinstance(value, _DefaultValue):
+                return value_task(ConstTask(value.value), [])
+            else:
+                return value
+        
+        parameters = {}
+        for name, value in zip(callee.args, callee_args):
+            parameters[name] = bind(value)
+        if callee.vararg:
+            inputs = [("value_%s" % i, v) for i, v in enumerate(callee_vararg)]
+            parameters[callee.vararg] = value_task(TupleTask(len(callee_vararg)), inputs)
+        if callee.kwarg:
+            inputs = []
+            for i, (key, value) in enumerate(sorted(callee_kwarg.items())):
+                inputs.append(("key_%s" % i, value_task(ConstTask(key), [])))
+                inputs.append(("value_%s" % i, value))
+            parameters[callee.kwarg] = value_task(DictTask(len(callee_kwarg)), inputs)
+        
+        body_tick = graph.START_TICK + 2
+        def shifted(endpoint):
+            if endpoint.tick == graph.START_TICK:
+                return parameters[endpoint.port]
+            elif endpoint.tick == graph.FINAL_TICK:
+                return endpoint
+            else:
+                return graph.Endpoint(endpoint.tick << body_tick, endpoint.port)
+            
+        body = callee.graph
+        for source, _ in body.get_out_connections(graph.START_TICK):
+            if source.port not in parameters:
+                return None
+        for task_tick in body.get_all_ticks():
+            properties = dict(body.get_task_properties(task_tick))
+            properties["inline_depth"] = depth
+            subgraph.add_task(task_tick << body_tick, body.get_task(task_tick), properties)
+        for task_tick in body.get_all_ticks():
+            for source, dest in body.get_in_connections(task_tick):
+                subgraph.connect(shifted(source), shifted(dest))
+        for source, dest in body.get_in_connections(graph.FINAL_TICK):
+            if dest.port == "retval":
+                subgraph.connect(shifted(source), graph.Endpoint(graph.FINAL_TICK, "value"))
+        return subgraph
+                
                 
     def __repr__(self):
         return "Call(%s, %s, %s, %s)" % (self.numargs, repr(self.keywords), self.has_starargs, self.has_kwargs)
     
 
-    
+
+class MapTask(AbstractTask):
+    """
+    List comprehension of the form `[func(*args) for item in iterable]`
+    where `item` is inserted into `args` at `target_position`.
+
+    If the function is functional and the iterable is a sequence, then
+    the task is refined into an :class:`UnpackTask` and one
+    :class:`MapElementTask` per element, which can run in parallel.
+    Each of them only receives its own element. Otherwise the elements are evaluated
+    one after the other in a single job.
+    
+    The function and the arguments are usually the outputs of a
+    :class:`GuardTask`, as Python only evaluates them if there
+    is at least one element.
+    """
+
+    refiner_ports = {"func", "iterable"}
+    refiner_reducer = {"func": _functionality, "iterable": _sequence_length}
+    refiner_cacheable = {"func"}
+
+    def __init__(self, numargs, target_position):
+        self.numargs = numargs
+        self.target_position = target_position
+
+    def input_ports(self):
+        return {"func", "iterable"} | {"arg_%s" % i for i in range(self.numargs)}
+
+    def output_ports(self):
+        return {"value"}
+
+    def evaluate(self, inputs):
+        func = inputs["func"]
+        iterable = inputs["iterable"]
+        args = tuple(inputs["arg_%s" % i] for i in range(self.numargs))
+
+        if _is_raised((func,) + args):
+            # Python evaluates them once it got the first element.
+            for _ in iterable:
+                raise_guarded(func, *args)
+            return {"value":[]}
+        
+        retval = builtins.__pydron_map__(iterable, self.target_position, func, *args)
+        return {"value":retval}
+
+    def refine(self, g, tick, known_inputs):
+        functional = known_inputs["func"]
+        length = known_inputs["iterable"]
+
+        if isinstance(functional, purity.OutArguments):
+            # the item is passed as an additional positional argument.
+            functional = functional.allows(self.numargs + 1, (), False, False)
+        if not functional:
+            return
+
+        if length is None:
+            g.set_task_property(tick, "syncpoint", False)
+            return
+
+        subgraph = graph.Graph()
+
+        unpack_tick = graph.START_TICK + 1
+        if length:
+            subgraph.add_task(unpack_tick, UnpackTask(length), {"quick": True})
+            subgraph.connect(graph.Endpoint(graph.START_TICK, "iterable"),
+                             graph.Endpoint(unpack_tick, "value"))
+
+        list_tick = graph.START_TICK + (length + 2)
+        subgraph.add_task(list_tick, ListTask(length), {"quick": True})
+        subgraph.connect(graph.Endpoint(list_tick, "value"),
+                         graph.Endpoint(graph.FINAL_TICK, "value"))
+
+        inputs = ["func"] + ["arg_%s" % i for i in range(self.numargs)]
+        for index in range(length):
+            element_tick = graph.START_TICK + (index + 2)
+            subgraph.add_task(element_tick, MapElementTask(self.numargs, self.target_position))
+            for port in inputs:
+                subgraph.connect(graph.Endpoint(graph.START_TICK, port),
+                                 graph.Endpoint(element_tick, port))
+            subgraph.connect(graph.Endpoint(unpack_tick, str(index)),
+                             graph.Endpoint(element_tick, "item"))
+            subgraph.connect(graph.Endpoint(element_tick, "value"),
+                             graph.Endpoint(list_tick, "value_%s" % index))
+
+        refine.replace_task(g, tick, subgraph)
+
+    def __repr__(self):
+        return "MapTask(%s, %s)" % (self.numargs, self.target_position)
+
+
+class MapElementTask(AbstractTask):
+    """
+    Evaluates the function of a :class:`MapTask` for one element.
+    """
+
+    def __init__(self, numargs, target_position):
+        self.numargs = numargs
+        self.target_position = target_position
+
+    def input_ports(self):
+        return {"func", "item"} | {"arg_%s" % i for i in range(self.numargs)}
+
+    def output_ports(self):
+        return {"value"}
+
+    def evaluate(self, inputs):
+        func = inputs["func"]
+        item = inputs["item"]
+        args = tuple(inputs["arg_%s" % i] for i in range(self.numargs))
+        raise_guarded(func, *args)
+
+        retval = func(*builtins.map_args(args, self.target_position, item))
+        return {"value":retval}
+
+    def __repr__(self):
+        return "MapElementTask(%s, %s)" % (self.numargs, self.target_position)
+
+
 class ReprTask(AbstractTask):
 
     def input_ports(self):
@@ -898,27 +1737,7 @@ class ReadGlobal(AbstractTask):
     
     def evaluate(self, inputs):
         var = inputs["var"]
-        
-        # In `tranlator.translate_function` we try to use the
-        # full module name even for __main__ because we need it
-        # on other workers. But if we happen to run on the
-        # node where the module really is __main__ then we don't want
-        # to make a mess, so we use __main__ again.
-        main_mod = sys.modules["__main__"]
-        module = importlib.import_module(self.module_name)
-        if hasattr(module, "__file__") and hasattr(main_mod, "__file__"):
-            if module.__file__ == main_mod.__file__:
-                module = main_mod
-            
-        
-        try:
-            value = getattr(module, var)
-        except AttributeError:
-            try:
-                value = getattr(__builtin__, var)
-            except AttributeError:
-                raise NameError("global name %r is not defined in %r." % (var, module))
-        return {"value":value}
+        return {"value":lookup_global(self.module_name, var)}
             
     def __repr__(self):
         return "ReadGlobal(%r)" % (self.module_name)
@@ -945,6 +1764,66 @@ class AssignGlobal(AbstractTask):
         return "AssignGlobal(%r)" % (self.module_name)
     
     
+def _const_input(g, tick, port):
+    """
+    Returns the value of the :class:`ConstTask` connected to the input `port`
+    of the task at `tick`, or `None` if the input is not a constant.
+    """
+    for source, dest in g.get_in_connections(tick):
+        if dest.port == port:
+            task = g.get_task(source.tick)
+            if isinstance(task, ConstTask):
+                return task.value
+    return None
+
+def lookup_global(module_name, var):
+    """
+    Returns the value of the global `var` in the given module, or
+    of the builtin with that name. Raises `NameError` if there is neither.
+    """
+    # In `tranlator.translate_function` we try to use the
+    # full module name even for __main__ because we need it
+    # on other workers. But if we happen to run on the
+    # node where the module really is __main__ then we don't want
+    # to make a mess, so we use __main__ again.
+    main_mod = sys.modules["__main__"]
+    module = importlib.import_module(module_name)
+    if hasattr(module, "__file__") and hasattr(main_mod, "__file__"):
+        if module.__file__ == main_mod.__file__:
+            module = main_mod
+        
+    try:
+        return getattr(module, var)
+    except AttributeError:
+        try:
+            return getattr(__builtin__, var)
+        except AttributeError:
+            raise NameError("global name %r is not defined in %r." % (var, module))
+
+def read_global_name(g, source):
+    """
+    Returns `(module_name, var)` if the output `source` is produced by a 
+    :class:`ReadGlobal` task with a constant variable name, `None` otherwise.
+    """
+    if source.tick in (graph.START_TICK, graph.FINAL_TICK):
+        return None
+    task = g.get_task(source.tick)
+    if not isinstance(task, ReadGlobal):
+        return None
+    var = _const_input(g, source.tick, "var")
+    if var is None:
+        return None
+    return (task.module_name, var)
+
+def assigned_global_name(g, tick):
+    """
+    Returns `(module_name, var)` for the :class:`AssignGlobal` task at `tick`.
+    `var` is `None` if the variable name is not a constant.
+    """
+    task = g.get_task(tick)
+    return (task.module_name, _const_input(g, tick, "var"))
+    
+    
 class NextTask(AbstractTask):
     """
     Task for __pydron_next__. We cannot use CallTask since it returns
@@ -965,4 +1844,50 @@ class NextTask(AbstractTask):
     
     def __repr__(self):
         return "NextTask()"
-    
\ No newline at end of file
+        
+    
+class FusedTask(AbstractTask):
+    """
+    Evaluates several tasks in one step. Created by
+    :func:`optimize.fuse_tasks` from a tree of quick tasks where
+    all intermediate values are only used within the tree.
+    
+    The members are evaluated one after the other, passing the
+    intermediate values directly. Only the outputs of the last task
+    (the root of the tree) are outputs of this task.
+    """
+    
+    def __init__(self, members):
+        """
+        :param members: List of `(task, inputs)` tuples in evaluation order.
+          `inputs` maps the in-ports of `task` to a tuple `(index, port)`.
+          If `index` is `None` the value is read from the in-port `port`
+          of this task, otherwise from the out-port `port` of the member
+          at position `index`. The last member is the root.
+        """
+        self.members = members
+        
+    def input_ports(self):
+        return {port for _, inputs in self.members 
+                for index, port in inputs.itervalues() if index is None}
+    
+    def output_ports(self):
+        return self.members[-1][0].output_ports()
+    
+    def evaluate(self, inputs):
+        results = []
+        for task, member_inputs in self.members:
+            args = {}
+            for in_port, (index, port) in member_inputs.iteritems():
+                if index is None:
+                    args[in_port] = inputs[port]
+                else:
+                    args[in_port] = results[index][port]
+            results.append(task.evaluate(args))
+        return results[-1]
+    
+    def __eq__(self, other):
+        return isinstance(other, FusedTask) and self.members == other.members
+    
+    def __repr__(self):
+        return "FusedTask(%r)" % ([task for task, _ in self.members],)
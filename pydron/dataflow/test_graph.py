@@ -73,6 +73,32 @@ class TestTick(unittest.TestCase):
         t = graph.Tick((0,10,5,3), (False, True, False, True))
         self.assertEquals((10, 3), t.loop_elements)
         
+    def test_interned(self):
+        self.assertIs(graph.START_TICK + 3, graph.START_TICK + 3)
+        self.assertIs(graph.START_TICK + 3, graph.Tick((0, 3), (False, False)))
+        
+    def test_interned_loopmask(self):
+        t = graph.Tick((0,10,5), (False, False, False))
+        loop = t.mark_loop_iteration()
+        self.assertIsNot(t, loop)
+        self.assertTrue(t == loop)
+        self.assertEqual(hash(t), hash(loop))
+        self.assertFalse(t != loop)
+        
+    def test_pickle_interned(self):
+        t = graph.START_TICK + 2 << graph.START_TICK + 10
+        self.assertIs(t, pickle.loads(pickle.dumps(t)))
+        self.assertIs(t, pickle.loads(pickle.dumps(t, pickle.HIGHEST_PROTOCOL)))
+        
+    def test_compare_nested(self):
+        t = graph.START_TICK + 10
+        nested = graph.START_TICK + 2 << t
+        self.assertLess(t, nested)
+        self.assertLess(nested, t + 1)
+        self.assertLessEqual(nested, nested)
+        self.assertGreater(t + 1, nested)
+        self.assertGreaterEqual(t + 1, nested)
+        
     def test_repr_start(self):
         self.assertEqual("START_TICK", repr(graph.START_TICK))
         
@@ -158,6 +184,39 @@ class TestGraph(unittest.TestCase):
         self.target.set_task_property(START_TICK + 100, 'syncpoint', True)
         self.assertEqual({'nicename':'test', 'syncpoint': True}, self.target.get_task_properties(START_TICK + 100))
         
+    def test_set_hot_task_property(self):
+        self.target.add_task(START_TICK + 100, None, {'nicename':'test', 'out_data':{}})
+        self.target.set_task_property(START_TICK + 100, 'out_data', {'value':1})
+        props = self.target.get_task_properties(START_TICK + 100)
+        self.assertEqual({'nicename':'test', 'out_data':{'value':1}}, props)
+        self.assertIn('out_data', props)
+        
+    def test_unset_hot_task_property(self):
+        self.target.add_task(START_TICK + 100, None, {'nicename':'test'})
+        props = self.target.get_task_properties(START_TICK + 100)
+        self.assertNotIn('out_data', props)
+        self.assertIsNone(props.get('out_data'))
+        self.assertRaises(KeyError, lambda: props['out_data'])
+        
+    def test_task_properties_view(self):
+        self.target.add_task(START_TICK + 100, None, {'nicename':'test'})
+        props = self.target.get_task_properties(START_TICK + 100)
+        self.target.set_task_property(START_TICK + 100, 'syncpoint', True)
+        self.target.set_task_property(START_TICK + 100, 'out_data', {})
+        self.assertEqual({'nicename':'test', 'syncpoint': True, 'out_data':{}}, props)
+        
+    def test_task_properties_readonly(self):
+        self.target.add_task(START_TICK + 100, None, {'nicename':'test'})
+        props = self.target.get_task_properties(START_TICK + 100)
+        def assign():
+            props['syncpoint'] = True
+        self.assertRaises(TypeError, assign)
+        
+    def test_pickle_properties(self):
+        self.target.add_task(START_TICK + 100, None, {'nicename':'test', 'out_data':{'value':1}})
+        copy = pickle.loads(pickle.dumps(self.target))
+        self.assertEqual({'nicename':'test', 'out_data':{'value':1}}, copy.get_task_properties(START_TICK + 100))
+        
     def test_get_in_connections(self):
         self.target.add_task(START_TICK + 100, None, {'nicename':'test1'})
         self.target.add_task(START_TICK + 101, None, {'nicename':'test2'})
@@ -276,6 +335,24 @@ class TestGraph(unittest.TestCase):
         self.target.set_task_property(START_TICK + 100, "foo", "bar")
         self.assertEquals([("task_property_changed", START_TICK + 100, "foo", "bar")], self.observer.calls)
         
+    def test_observer_batch(self):
+        self.target.subscribe(self.observer)
+        with self.target.batch():
+            self.target.add_task(START_TICK + 100, "task1")
+            self.target.add_task(START_TICK + 101, "task2")
+            self.assertEquals([], self.observer.calls)
+            self.assertEquals(2, len(self.target.get_all_ticks()))
+        self.assertEquals([("task_added", START_TICK + 100, "task1", {}),
+                           ("task_added", START_TICK + 101, "task2", {})], self.observer.calls)
+        
+    def test_observer_batch_nested(self):
+        self.target.subscribe(self.observer)
+        with self.target.batch():
+            with self.target.batch():
+                self.target.add_task(START_TICK + 100, "task1")
+            self.assertEquals([], self.observer.calls)
+        self.assertEquals([("task_added", START_TICK + 100, "task1", {})], self.observer.calls)
+        
 class MockObserver(object):
     
     def __init__(self):
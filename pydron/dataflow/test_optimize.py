@@ -0,0 +1,647 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import ast
+import unittest
+
+from pydron.dataflow import optimize, tasks, utils
+from pydron.dataflow.graph import G, T, C, START_TICK, FINAL_TICK, Endpoint, Tick
+
+
+class TestFoldConstants(unittest.TestCase):
+
+    def test_binop(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(2), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(3, tasks.ConstTask(3), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.fold_constants(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_unaryop(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(2, tasks.ConstTask(-1), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        optimize.fold_constants(g)
+        utils.assert_graph_equal(expected, g)
+
+    def test_tuple(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask("a"), {'quick':True}),
+            C(1, "value", 3, "value_0"),
+            C(2, "value", 3, "value_1"),
+            T(3, tasks.TupleTask(2), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(3, tasks.ConstTask((1, "a")), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        optimize.fold_constants(g)
+        utils.assert_graph_equal(expected, g)
+
+    def test_nested_expression(self):
+        g = G(
+            T(1, tasks.ConstTask(2), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            T(3, tasks.ConstTask(3), {'quick':True}),
+            C(2, "value", 4, "left"),
+            C(3, "value", 4, "right"),
+            T(4, tasks.BinOpTask(ast.Mult()), {'quick':True}),
+            C(4, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(4, tasks.ConstTask(-6), {'quick':True}),
+            C(4, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(2, optimize.fold_constants(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_variable_input(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "left"),
+            C(START_TICK, "a", 2, "right"),
+            T(2, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "left"),
+            C(START_TICK, "a", 2, "right"),
+            T(2, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fold_constants(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_const_used_elsewhere(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval"),
+            C(1, "value", FINAL_TICK, "x")
+        )
+
+        expected = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(-1), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval"),
+            C(1, "value", FINAL_TICK, "x")
+        )
+
+        optimize.fold_constants(g)
+        utils.assert_graph_equal(expected, g)
+
+    def test_exception_not_folded(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(0), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Div()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fold_constants(g))
+        self.assertEqual(tasks.BinOpTask(ast.Div()), g.get_task(START_TICK + 3))
+
+    def test_long_sequence_not_folded(self):
+        g = G(
+            T(1, tasks.ConstTask("a"), {'quick':True}),
+            T(2, tasks.ConstTask(1000), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Mult()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fold_constants(g))
+
+    def test_subgraph(self):
+        body = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.Not()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+        orelse = G()
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            T(1, tasks.IfTask(body, orelse)),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.fold_constants(g))
+        self.assertEqual(tasks.ConstTask(False), body.get_task(START_TICK + 2))
+
+    def test_functiondef(self):
+        body = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+        g = G(
+            T(1, tasks.FunctionDefTask("scheduler", "f", [], None, None, 0, body)),
+            C(1, "function", FINAL_TICK, "f")
+        )
+
+        self.assertEqual(1, optimize.fold_constants(g))
+        self.assertEqual(tasks.ConstTask(-1), body.get_task(START_TICK + 2))
+
+
+class TestEliminateDeadTasks(unittest.TestCase):
+
+    def test_unused(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(2), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            T(2, tasks.ConstTask(2), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.eliminate_dead_tasks(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_transitive(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", 2, "value_0"),
+            C(START_TICK, "a", 2, "value_1"),
+            T(2, tasks.TupleTask(2), {'quick':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(2, optimize.eliminate_dead_tasks(g))
+        utils.assert_graph_equal(expected, g)
+        
+    def test_may_raise(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            C(START_TICK, "b", 1, "slice"),
+            T(1, tasks.SubscriptTask(), {'quick':True}),
+            C(START_TICK, "a", 2, "object"),
+            T(2, tasks.AttributeTask("x"), {'quick':True}),
+            C(START_TICK, "a", 3, "left"),
+            C(START_TICK, "b", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+        
+        self.assertEqual(0, optimize.eliminate_dead_tasks(g))
+        
+    def test_global_bound(self):
+        g = G(
+            T(1, tasks.ConstTask("unittest"), {'quick':True}),
+            C(1, "value", 2, "var"),
+            T(2, tasks.ReadGlobal(__name__), {'quick':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+        
+        expected = G(
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+        
+        self.assertEqual(2, optimize.eliminate_dead_tasks(g))
+        utils.assert_graph_equal(expected, g)
+        
+    def test_global_builtin(self):
+        g = G(
+            T(1, tasks.ConstTask("len"), {'quick':True}),
+            C(1, "value", 2, "var"),
+            T(2, tasks.ReadGlobal(__name__), {'quick':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+        
+        self.assertEqual(2, optimize.eliminate_dead_tasks(g))
+        
+    def test_global_unbound(self):
+        g = G(
+            T(1, tasks.ConstTask("not_defined_anywhere"), {'quick':True}),
+            C(1, "value", 2, "var"),
+            T(2, tasks.ReadGlobal(__name__), {'quick':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+        
+        self.assertEqual(0, optimize.eliminate_dead_tasks(g))
+
+    def test_syncpoint(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'syncpoint':True}),
+            C(START_TICK, "a", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.eliminate_dead_tasks(g))
+
+    def test_no_outputs(self):
+        g = G(
+            C(START_TICK, "t", 1, "type"),
+            C(START_TICK, "i", 1, "inst"),
+            C(START_TICK, "b", 1, "tback"),
+            T(1, tasks.RaiseTask(), {'quick':True}),
+        )
+
+        self.assertEqual(0, optimize.eliminate_dead_tasks(g))
+
+    def test_subgraph(self):
+        body = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(2), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            T(1, tasks.IfTask(body, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.eliminate_dead_tasks(g))
+        self.assertEqual([START_TICK + 2], body.get_all_ticks())
+
+
+class TestEliminateCommonSubexpressions(unittest.TestCase):
+
+    def test_merge(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(START_TICK, "a", 2, "object"),
+            T(2, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(1, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.eliminate_common_subexpressions(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_different_inputs(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(START_TICK, "b", 2, "object"),
+            T(2, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", FINAL_TICK, "x"),
+            C(2, "value", FINAL_TICK, "y")
+        )
+
+        self.assertEqual(0, optimize.eliminate_common_subexpressions(g))
+
+    def test_different_constants(self):
+        g = G(
+            T(1, tasks.ConstTask(1), {'quick':True}),
+            T(2, tasks.ConstTask(1.0), {'quick':True}),
+            T(3, tasks.ConstTask(1), {'quick':True}),
+            C(1, "value", FINAL_TICK, "x"),
+            C(2, "value", FINAL_TICK, "y"),
+            C(3, "value", FINAL_TICK, "z")
+        )
+
+        self.assertEqual(1, optimize.eliminate_common_subexpressions(g))
+        self.assertEqual([START_TICK + 1, START_TICK + 2], sorted(g.get_all_ticks()))
+
+    def test_syncpoint_between(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(START_TICK, "a", 2, "object"),
+            T(2, tasks.AttrAssign("x"), {'syncpoint':True}),
+            C(START_TICK, "a", 3, "object"),
+            T(3, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", FINAL_TICK, "x"),
+            C(3, "value", FINAL_TICK, "y")
+        )
+
+        self.assertEqual(0, optimize.eliminate_common_subexpressions(g))
+
+    def test_mutable_not_merged(self):
+        g = G(
+            T(1, tasks.ListTask(0), {'quick':True}),
+            T(2, tasks.ListTask(0), {'quick':True}),
+            C(1, "value", FINAL_TICK, "x"),
+            C(2, "value", FINAL_TICK, "y")
+        )
+
+        self.assertEqual(0, optimize.eliminate_common_subexpressions(g))
+
+
+class TestHoistLoopInvariants(unittest.TestCase):
+
+    def make_loop(self, body_task_properties={}, task=tasks.TupleTask(1), port="value_0"):
+        # while cond: y = (a,) + y
+        body = G(
+            C(START_TICK, "a", 1, port),
+            T(1, task, {'quick':True}),
+            C(1, "value", 2, "left"),
+            C(START_TICK, "y", 2, "right"),
+            T(2, tasks.BinOpTask(ast.Add()), body_task_properties),
+        )
+        tail_tick = START_TICK + 3
+        body.add_task(tail_tick, tasks.WhileTask(True, False, body, G()))
+        body.connect(Endpoint(START_TICK, "a"), Endpoint(tail_tick, "a"))
+        body.connect(Endpoint(START_TICK, "cond"), Endpoint(tail_tick, "cond"))
+        body.connect(Endpoint(START_TICK, "cond"), Endpoint(tail_tick, "$test"))
+        body.connect(Endpoint(START_TICK + 2, "value"), Endpoint(tail_tick, "y"))
+        body.connect(Endpoint(tail_tick, "y"), Endpoint(FINAL_TICK, "y"))
+        
+        g = G(
+            C(START_TICK, "a", 1, "a"),
+            C(START_TICK, "y", 1, "y"),
+            C(START_TICK, "cond", 1, "cond"),
+            C(START_TICK, "cond", 1, "$test"),
+            T(1, tasks.WhileTask(False, False, body, G())),
+            C(1, "y", FINAL_TICK, "y")
+        )
+        return g, body
+
+    def test_hoist(self):
+        g, body = self.make_loop()
+        
+        self.assertEqual(1, optimize.hoist_loop_invariants(g))
+        
+        hoisted_tick = START_TICK + 1 << (START_TICK << START_TICK)
+        self.assertEqual(tasks.TupleTask(1), g.get_task(hoisted_tick))
+        self.assertIn((Endpoint(START_TICK, "a"), Endpoint(hoisted_tick, "value_0")), 
+                      g.get_in_connections(hoisted_tick))
+        self.assertIn((Endpoint(hoisted_tick, "value"), Endpoint(START_TICK + 1, "$invariant_0")), 
+                      g.get_out_connections(hoisted_tick))
+        
+        self.assertNotIn(START_TICK + 1, body.get_all_ticks())
+        self.assertIn((Endpoint(START_TICK, "$invariant_0"), Endpoint(START_TICK + 2, "left")), 
+                      body.get_in_connections(START_TICK + 2))
+        self.assertIn((Endpoint(START_TICK, "$invariant_0"), Endpoint(START_TICK + 3, "$invariant_0")), 
+                      body.get_in_connections(START_TICK + 3))
+        
+    def test_sideeffects_in_body(self):
+        g, body = self.make_loop({'syncpoint': True}, task=tasks.AttributeTask("x"), port="object")
+        self.assertEqual(0, optimize.hoist_loop_invariants(g))
+
+    def test_attribute_guarded(self):
+        # might raise even if the loop body never runs.
+        g, body = self.make_loop(task=tasks.AttributeTask("x"), port="object")
+        self.assertEqual(1, optimize.hoist_loop_invariants(g))
+        
+        hoisted_tick = START_TICK + 1 << (START_TICK << START_TICK)
+        self.assertEqual(tasks.GuardTask(tasks.AttributeTask("x")), g.get_task(hoisted_tick))
+        
+        looptask = g.get_task(START_TICK + 1)
+        tail = body.get_task(START_TICK + 3)
+        for task in (looptask, tail):
+            self.assertEqual({"$invariant_0"}, task.guarded_ports)
+            self.assertEqual({"$test", "$invariant_0"}, task.refiner_ports)
+            self.assertIs(tasks._raised_exception, task.refiner_reducer["$invariant_0"])
+            self.assertIs(bool, task.refiner_reducer["$test"])
+        
+    def test_subscript_guarded(self):
+        g, body = self.make_loop(task=tasks.SubscriptTask(), port="object")
+        self.assertEqual(1, optimize.hoist_loop_invariants(g))
+        self.assertEqual({"$invariant_0"}, g.get_task(START_TICK + 1).guarded_ports)
+        
+    def test_guard_not_guarded_again(self):
+        # moved out of an inner loop, which raises the exception.
+        g, body = self.make_loop(task=tasks.GuardTask(tasks.AttributeTask("x")), port="object")
+        self.assertEqual(1, optimize.hoist_loop_invariants(g))
+        
+        hoisted_tick = START_TICK + 1 << (START_TICK << START_TICK)
+        self.assertEqual(tasks.GuardTask(tasks.AttributeTask("x")), g.get_task(hoisted_tick))
+        self.assertEqual(frozenset(), g.get_task(START_TICK + 1).guarded_ports)
+
+    def test_variant_input(self):
+        g, body = self.make_loop()
+        body.disconnect(Endpoint(START_TICK, "a"), Endpoint(START_TICK + 3, "a"))
+        body.connect(Endpoint(START_TICK + 2, "value"), Endpoint(START_TICK + 3, "a"))
+        self.assertEqual(0, optimize.hoist_loop_invariants(g))
+
+
+class TestFuseTasks(unittest.TestCase):
+
+    def test_chain(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        expected = G(
+            C(START_TICK, "a", 2, "in_0"),
+            T(2, tasks.FusedTask([
+                (tasks.AttributeTask("x"), {"object":(None, "in_0")}),
+                (tasks.UnaryOpTask(ast.USub()), {"value":(0, "value")})
+            ]), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(1, optimize.fuse_tasks(g))
+        utils.assert_graph_equal(expected, g)
+
+    def test_tree(self):
+        g = G(
+            C(START_TICK, "a", 1, "left"),
+            C(START_TICK, "b", 1, "right"),
+            T(1, tasks.BinOpTask(ast.Mult()), {'quick':True}),
+            C(START_TICK, "c", 2, "object"),
+            T(2, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(2, optimize.fuse_tasks(g))
+        self.assertEqual([START_TICK + 3], g.get_all_ticks())
+        task = g.get_task(START_TICK + 3)
+        self.assertEqual({"value":10}, task.evaluate({"in_0":2, "in_1":3, "in_2":Attr(4)}))
+
+    def test_shared_value_not_fused(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval"),
+            C(1, "value", FINAL_TICK, "x")
+        )
+
+        self.assertEqual(0, optimize.fuse_tasks(g))
+
+    def test_syncpoint_not_fused(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True, 'syncpoint':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fuse_tasks(g))
+
+    def test_syncpoint_between_not_fused(self):
+        # a = c.x; g(c); return a + 1
+        g = G(
+            C(START_TICK, "c", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(START_TICK, "c", 2, "object"),
+            T(2, tasks.AttrAssign("x"), {'syncpoint':True}),
+            C(1, "value", 3, "left"),
+            C(START_TICK, "one", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fuse_tasks(g))
+        self.assertEqual(tasks.AttributeTask("x"), g.get_task(START_TICK + 1))
+
+    def test_slow_not_fused(self):
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x")),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub()), {'quick':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fuse_tasks(g))
+
+    def test_no_cycle(self):
+        # 1 -> 2 -> 3 and 1 -> 3 where 2 is not fusable.
+        g = G(
+            C(START_TICK, "a", 1, "object"),
+            T(1, tasks.AttributeTask("x"), {'quick':True}),
+            C(1, "value", 2, "value"),
+            T(2, tasks.UnaryOpTask(ast.USub())),
+            C(1, "value", 3, "left"),
+            C(2, "value", 3, "right"),
+            T(3, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+
+        self.assertEqual(0, optimize.fuse_tasks(g))
+
+
+class TestSpeculateBranches(unittest.TestCase):
+
+    def test_speculate(self):
+        body = G(
+            T(1, tasks.ConstTask(1)),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            C(START_TICK, "retval", 1, "retval"),
+            T(1, tasks.IfTask(body, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+        self.assertEqual(1, optimize.speculate_branches(g))
+        
+        expected = G(
+            T((1,1,1), tasks.ConstTask(1)),
+            C(START_TICK, "cond", (1,3), "$test"),
+            C((1,1,1), "value", (1,3), "body:retval"),
+            C(START_TICK, "retval", (1,3), "orelse:retval"),
+            T((1,3), tasks.BranchSelectTask({"retval"})),
+            C((1,3), "retval", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+
+    def test_sideeffects(self):
+        body = G(
+            T(1, tasks.ConstTask(1), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            C(START_TICK, "retval", 1, "retval"),
+            T(1, tasks.IfTask(body, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+        self.assertEqual(0, optimize.speculate_branches(g))
+        
+    def test_nested(self):
+        inner = G(
+            T(1, tasks.ConstTask(1)),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        outer = G(
+            C(START_TICK, "cond", 1, "$test"),
+            C(START_TICK, "retval", 1, "retval"),
+            T(1, tasks.IfTask(inner, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            C(START_TICK, "cond", 1, "cond"),
+            C(START_TICK, "retval", 1, "retval"),
+            T(1, tasks.IfTask(outer, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+        self.assertEqual(2, optimize.speculate_branches(g))
+        self.assertIsInstance(g.get_task(Tick.parse_tick((1,1,1,3))), tasks.BranchSelectTask)
+
+
+class TestCountTasks(unittest.TestCase):
+
+    def test_nested(self):
+        body = G(
+            T(1, tasks.ConstTask(1)),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        g = G(
+            C(START_TICK, "cond", 1, "$test"),
+            T(1, tasks.IfTask(body, G())),
+            C(1, "retval", FINAL_TICK, "retval")
+        )
+        self.assertEqual(2, optimize.count_tasks(g))
+
+
+class Attr(object):
+    def __init__(self, x):
+        self.x = x
@@ -77,4 +77,75 @@ class TestReplaceTask(unittest.TestCase):
         refine.replace_task(g, START_TICK + 1, subgraph)
         
         utils.assert_graph_equal(expected, g)
-        
\ No newline at end of file
+        
+        
+    def test_template_reused(self):
+        
+        subgraph = G(
+            C(START_TICK, "sin", 1, "x"),
+            T(1, "subtask"),
+            C(1, "y", FINAL_TICK, "sout")
+        )
+        
+        g = G(
+              C(START_TICK, "in", 1, "sin"),
+              T(1, "task_to_replace"),
+              C(1, "sout", 2, "sin"),
+              T(2, "task_to_replace"),
+              C(2, "sout", FINAL_TICK, "out")
+              )
+        
+        expected  = G(
+              C(START_TICK, "in", (1,1), "x"),
+              T((1,1), "subtask"),
+              C((1,1), "y", (2,1), "x"),
+              T((2,1), "subtask"),
+              C((2,1), "y", FINAL_TICK, "out")
+              )
+        
+        template = refine.cached_template(subgraph)
+        refine.replace_task(g, START_TICK + 1, template)
+        refine.replace_task(g, START_TICK + 2, template)
+        
+        utils.assert_graph_equal(expected, g)
+        
+    def test_cached_template(self):
+        subgraph = G(
+            C(START_TICK, "sin", 1, "x"),
+            T(1, "subtask"),
+            C(1, "y", FINAL_TICK, "sout")
+        )
+        template = refine.cached_template(subgraph)
+        self.assertIs(template, refine.cached_template(subgraph))
+        self.assertIsNot(template, refine.cached_template(G()))
+        
+    def test_cached_template_forgotten(self):
+        subgraph = G(T(1, "subtask"))
+        key = id(subgraph)
+        refine.cached_template(subgraph)
+        del subgraph
+        self.assertNotIn(key, refine._templates)
+        
+
+class TestRemoveSubtree(unittest.TestCase):
+    
+    def test_remove(self):
+        g = G(
+              C(START_TICK, "in", (1,1), "x"),
+              T((1,1), "a"),
+              C((1,1), "y", (1,2,1), "x"),
+              T((1,2,1), "b"),
+              C((1,2,1), "y", 2, "x"),
+              T(2, "c"),
+              C(2, "y", FINAL_TICK, "out")
+              )
+        
+        expected  = G(
+              T(2, "c"),
+              C(2, "y", FINAL_TICK, "out")
+              )
+        
+        removed = refine.remove_subtree(g, START_TICK + 1)
+        
+        self.assertEqual(2, len(removed))
+        utils.assert_graph_equal(expected, g)
@@ -1,8 +1,10 @@
 # Copyright (C) 2015 Stefan C. Mueller
 import unittest
-from pydron.dataflow import tasks, utils
+from pydron.dataflow import tasks, utils, refine, graph
 from pydron.dataflow.graph import G, C, T, FINAL_TICK, START_TICK, graph_factory, Tick
 import sys
+import ast
+import pickle
 
 class TestScheduledCallable(unittest.TestCase):
     
@@ -58,6 +60,13 @@ class TestScheduledCallable(unittest.TestCase):
         
         self.assertEqual("im a graph", self.scheduler.graph)
         self.assertEqual({'a':1, 'b':2, 'kwargs':{'c':3}}, self.scheduler.inputs)
+        
+    def test_default(self):
+        target = tasks.ScheduledCallable(self.scheduler, "name", "im a graph", ['a', 'b'], None, None, (5,))
+        
+        self.assertEqual(42, target(1))
+        
+        self.assertEqual({'a':1, 'b':5}, self.scheduler.inputs)
     
         
 class TestConstTask(unittest.TestCase):
@@ -103,6 +112,73 @@ class TestIfTask(unittest.TestCase):
         
         utils.assert_graph_equal(expected, g)
         
+    # def f(t, x, y):
+    #     if t:
+    #         x = y * 2
+    #     return x
+        
+    def make_speculative_graph(self):
+        g = G(
+            C(START_TICK, "t", 1, "$test"),
+            C(START_TICK, "x", 1, "x"),
+            C(START_TICK, "y", 1, "y"),
+            T(1, tasks.IfTask(G(
+                C(START_TICK, "y", 1, "left"),
+                T(1, tasks.BinOpTask(ast.Mult())),
+                C(1, "value", FINAL_TICK, "x")
+            ), G(
+            ))),
+            C(1, "x", FINAL_TICK, "retval")
+        )
+        target = g.get_task(START_TICK + 1)
+        refine.replace_task(g, START_TICK + 1, target.speculative_graph())
+        return g
+        
+    def test_speculative_graph(self):
+        g = self.make_speculative_graph()
+        
+        expected = G(
+            C(START_TICK, "y", (1,1,1), "left"),
+            T((1,1,1), tasks.BinOpTask(ast.Mult())),
+            C(START_TICK, "t", (1,3), "$test"),
+            C((1,1,1), "value", (1,3), "body:x"),
+            C(START_TICK, "x", (1,3), "orelse:x"),
+            T((1,3), tasks.BranchSelectTask({"x"})),
+            C((1,3), "x", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_select_body(self):
+        g = self.make_speculative_graph()
+        g.get_task(START_TICK + 3 << START_TICK + 1).refine(g, START_TICK + 3 << START_TICK + 1, {"$test":True})
+        
+        expected = G(
+            C(START_TICK, "y", (1,1,1), "left"),
+            T((1,1,1), tasks.BinOpTask(ast.Mult())),
+            C((1,1,1), "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_select_orelse(self):
+        g = self.make_speculative_graph()
+        g.get_task(START_TICK + 3 << START_TICK + 1).refine(g, START_TICK + 3 << START_TICK + 1, {"$test":False})
+        
+        expected = G(
+            C(START_TICK, "x", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_in_undecided_branch(self):
+        g = self.make_speculative_graph()
+        self.assertTrue(tasks.in_undecided_branch(g, Tick.parse_tick((1,1,1))))
+        self.assertFalse(tasks.in_undecided_branch(g, Tick.parse_tick((1,3))))
+        self.assertFalse(tasks.in_undecided_branch(g, START_TICK + 1))
+        
+    def test_in_decided_branch(self):
+        g = self.make_speculative_graph()
+        g.get_task(START_TICK + 3 << START_TICK + 1).refine(g, START_TICK + 3 << START_TICK + 1, {"$test":True})
+        self.assertFalse(tasks.in_undecided_branch(g, Tick.parse_tick((1,1,1))))
+        
 class TestForTask(unittest.TestCase):
     
     def test_refine_body(self):
@@ -248,7 +324,257 @@ class TestForTask(unittest.TestCase):
             
         utils.assert_graph_equal(expected, g)
         
+    def test_guarded_raises(self):
+        body = G(
+            C(START_TICK, "$target", 1, "value"),
+            T(1, tasks.ForTask(True, False, G(), G()))
+        )
+        g = G(
+            C(START_TICK, "it", 1, "$iterator"),
+            C(START_TICK, "a", 1, "$invariant_0"),
+            T(1, tasks.ForTask(False, False, body, G()))
+        )
+        target = g.get_task(START_TICK + 1)
+        tasks.guard_loop_inputs(target, {"$invariant_0"})
+        self.assertRaises(KeyError, target.refine, g, START_TICK + 1, 
+                          {"$iterator":iter([1]), "$invariant_0":KeyError("a")})
+        
+        target.refine(g, START_TICK + 1, {"$iterator":iter([]), "$invariant_0":KeyError("a")})
+        self.assertEqual([], g.get_all_ticks())
+        
+        
+class TestUnrolledForTask(unittest.TestCase):
+    
+    # def f(lst, k, x, y):
+    #     for x in lst:
+    #         y = x * k
+    #     return y
+    
+    def make_graph(self):
+        with graph_factory():
+            g = G(
+              C(START_TICK, "lst", 1, "$iterable"),
+              C(START_TICK, "k", 1, "k"),
+              C(START_TICK, "x", 1, "x"),
+              C(START_TICK, "y", 1, "y"),
+              T(1, tasks.UnrolledForTask(G("body",
+                  C(START_TICK, "$target", 1, "left"),
+                  C(START_TICK, "k", 1, "right"),
+                  T(1, tasks.BinOpTask(ast.Mult())),
+                  C(START_TICK, "$target", 2, "x"),
+                  C(START_TICK, "$iterator", 2, "$iterator"),
+                  C(START_TICK, "k", 2, "k"),
+                  C(1, "value", 2, "y"),
+                  T(2, tasks.ForTask(True, False, G("body"), G("else"))),
+                  C(2, "x", FINAL_TICK, "x"),
+                  C(2, "y", FINAL_TICK, "y"),
+              ), G("else"), 2)),
+              C(1, "y", FINAL_TICK, "retval")
+            )
+        self.body = g.get_task(START_TICK + 1).body_graph
+        self.orelse = g.get_task(START_TICK + 1).orelse_graph
+        return g
+    
+    def iteration(self, i):
+        return [
+            T((1,i+1,1), tasks.ConstTask(i), {'quick':True}),
+            T((1,i+1,2), tasks.SubscriptTask(), {'quick':True}),
+            C(START_TICK, "lst", (1,i+1,2), "object"),
+            C((1,i+1,1), "value", (1,i+1,2), "slice"),
+            C((1,i+1,2), "value", (1,i+1,3,1), "left"),
+            C(START_TICK, "k", (1,i+1,3,1), "right"),
+            T((1,i+1,3,1), tasks.BinOpTask(ast.Mult())),
+        ]
+    
+    def test_input_ports(self):
+        g = self.make_graph()
+        target = g.get_task(START_TICK + 1)
+        self.assertEqual({"$iterable", "k", "x", "y"}, target.input_ports())
+        self.assertEqual({"x", "y"}, target.output_ports())
+        
+    def test_refine_window(self):
+        g = self.make_graph()
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"$iterable":3})
+        
+        expected = G(*(self.iteration(0) + self.iteration(1) + [
+            T((1,3), tasks.UnrolledForTask(self.body, self.orelse, 2, 2)),
+            C(START_TICK, "lst", (1,3), "$iterable"),
+            C(START_TICK, "k", (1,3), "k"),
+            C((1,2,2), "value", (1,3), "x"),
+            C((1,2,3,1), "value", (1,3), "y"),
+            C((1,3), "y", FINAL_TICK, "retval")
+        ]))
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_last(self):
+        g = self.make_graph()
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"$iterable":2})
+        
+        expected = G(*(self.iteration(0) + self.iteration(1) + [
+            C((1,2,3,1), "value", FINAL_TICK, "retval")
+        ]))
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_empty(self):
+        g = self.make_graph()
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"$iterable":0})
+        
+        expected = G(
+            C(START_TICK, "y", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_no_sequence(self):
+        g = self.make_graph()
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"$iterable":None})
+        
+        expected = G(
+            C(START_TICK, "lst", (1,1), "iterable"),
+            T((1,1), tasks.IterTask(), {'quick':True}),
+            C((1,1), "value", (1,2), "$iterator"),
+            C(START_TICK, "k", (1,2), "k"),
+            C(START_TICK, "x", (1,2), "x"),
+            C(START_TICK, "y", (1,2), "y"),
+            T((1,2), tasks.ForTask(False, False, self.body, self.orelse)),
+            C((1,2), "y", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_independent(self):
+        self.make_graph()
+        self.assertTrue(tasks.is_independent_body(self.body))
+        
+    def test_not_independent(self):
+        # y = y * x
+        with graph_factory():
+            body = G("body",
+                C(START_TICK, "$target", 1, "left"),
+                C(START_TICK, "y", 1, "right"),
+                T(1, tasks.BinOpTask(ast.Mult())),
+                C(START_TICK, "$target", 2, "x"),
+                C(START_TICK, "$iterator", 2, "$iterator"),
+                C(1, "value", 2, "y"),
+                T(2, tasks.ForTask(True, False, G("body"), G("else"))),
+                C(2, "x", FINAL_TICK, "x"),
+                C(2, "y", FINAL_TICK, "y"),
+            )
+        self.assertFalse(tasks.is_independent_body(body))
+        
+    # def f(lst, k, total):
+    #     for x in lst:
+    #         total += x * k
+    #     return total
+    
+    def make_reduction_graph(self):
+        with graph_factory():
+            g = G(
+              C(START_TICK, "lst", 1, "$iterable"),
+              C(START_TICK, "k", 1, "k"),
+              C(START_TICK, "total", 1, "total"),
+              T(1, tasks.UnrolledForTask(G("body",
+                  C(START_TICK, "$target", 1, "left"),
+                  C(START_TICK, "k", 1, "right"),
+                  T(1, tasks.BinOpTask(ast.Mult())),
+                  C(START_TICK, "$iterator", 2, "$iterator"),
+                  C(START_TICK, "k", 2, "k"),
+                  C(1, "value", 2, "total"),
+                  T(2, tasks.ForTask(True, False, G("body"), G("else"))),
+                  C(2, "total", FINAL_TICK, "total"),
+              ), G("else"), 4, reductions={"total":"+="})),
+              C(1, "total", FINAL_TICK, "retval")
+            )
+        self.body = g.get_task(START_TICK + 1).body_graph
+        self.orelse = g.get_task(START_TICK + 1).orelse_graph
+        return g
+    
+    def test_refine_reduction(self):
+        g = self.make_reduction_graph()
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"$iterable":3})
         
+        expected = G(*(self.iteration(0) + self.iteration(1) + self.iteration(2) + [
+            T((1,4,1), tasks.CombineTask("+="), {'quick':True}),
+            C((1,1,3,1), "value", (1,4,1), "left"),
+            C((1,2,3,1), "value", (1,4,1), "right"),
+            T((1,4,2), tasks.CombineTask("+="), {'quick':True}),
+            C((1,4,1), "value", (1,4,2), "left"),
+            C((1,3,3,1), "value", (1,4,2), "right"),
+            T((1,4,3), tasks.ReduceTask("+="), {'quick':True, 'syncpoint':True}),
+            C(START_TICK, "total", (1,4,3), "target"),
+            C((1,4,2), "value", (1,4,3), "value"),
+            C((1,4,3), "value", FINAL_TICK, "retval")
+        ]))
+        utils.assert_graph_equal(expected, g)
+        
+    def test_accumulating_body(self):
+        self.make_reduction_graph()
+        body = tasks.accumulating_body(self.body, {"total":"+="})
+        
+        with graph_factory():
+            expected = G("body",
+                C(START_TICK, "$target", 1, "left"),
+                C(START_TICK, "k", 1, "right"),
+                T(1, tasks.BinOpTask(ast.Mult())),
+                T((1,0,1), tasks.ReduceTask("+="), {'quick':True, 'syncpoint':True}),
+                C(START_TICK, "total", (1,0,1), "target"),
+                C(1, "value", (1,0,1), "value"),
+                C(START_TICK, "$iterator", 2, "$iterator"),
+                C(START_TICK, "k", 2, "k"),
+                C((1,0,1), "value", 2, "total"),
+                T(2, tasks.ForTask(True, False, G("body"), G("else"))),
+                C(2, "total", FINAL_TICK, "total"),
+            )
+        utils.assert_graph_equal(expected, body)
+        self.assertIs(body, body.get_task(START_TICK + 2).body_graph)
+        
+    def test_reduce(self):
+        task = tasks.ReduceTask("+=")
+        self.assertEqual({"value": 6}, task.evaluate({"target": 1, "value": 5}))
+        
+    def test_reduce_append(self):
+        task = tasks.ReduceTask("append")
+        target = [1]
+        self.assertEqual({"value": [1, 2, 3]}, task.evaluate({"target": target, "value": [2, 3]}))
+        self.assertEqual([1, 2, 3], target)
+        
+    def test_combine(self):
+        self.assertEqual({"value": [1, 2]}, tasks.CombineTask("append").evaluate({"left": [1], "right": [2]}))
+        self.assertEqual({"value": 3}, tasks.CombineTask("max").evaluate({"left": 2, "right": 3}))
+        
+    def test_combine_integers(self):
+        combined = tasks.CombineTask("*=").evaluate({"left": 2, "right": 3})["value"]
+        self.assertEqual(6, combined.total)
+        self.assertEqual({"value": 24}, tasks.ReduceTask("*=").evaluate({"target": 4, "value": combined}))
+        
+    def test_combine_floats(self):
+        combine = tasks.CombineTask("+=")
+        left = combine.evaluate({"left": 1e16, "right": 1.0})["value"]
+        right = combine.evaluate({"left": -1e16, "right": 1.0})["value"]
+        parts = combine.evaluate({"left": left, "right": right})["value"]
+        self.assertIsNone(parts.total)
+        self.assertEqual({"value": 1.0}, tasks.ReduceTask("+=").evaluate({"target": 0, "value": parts}))
+        
+    def test_combine_integers_float_target(self):
+        parts = tasks.CombineTask("+=").evaluate({"left": 1, "right": 1})["value"]
+        actual = tasks.ReduceTask("+=").evaluate({"target": 1e16, "value": parts})
+        self.assertEqual({"value": 1e16 + 1 + 1}, actual)
+        
+    def test_combine_mixed_sequences(self):
+        # acc = []; for r in rows: acc += r
+        combine = tasks.CombineTask("+=")
+        left = combine.evaluate({"left": [1], "right": (2,)})["value"]
+        parts = combine.evaluate({"left": left, "right": "ab"})["value"]
+        
+        target = []
+        actual = tasks.ReduceTask("+=").evaluate({"target": target, "value": parts})
+        self.assertEqual({"value": [1, 2, "a", "b"]}, actual)
+        self.assertIs(target, actual["value"])
+        
+
 class TestWhileTask(unittest.TestCase):
     
     def test_refine_body(self):
@@ -329,6 +655,44 @@ class TestWhileTask(unittest.TestCase):
             
         utils.assert_graph_equal(expected, g)
         
+    def guarded_loop(self):
+        with graph_factory():
+            g = G(
+              C(START_TICK, "x", 1, "$test"),
+              C(START_TICK, "x", 1, "x"),
+              C(START_TICK, "a", 1, "$invariant_0"),
+              T(1, tasks.WhileTask(False, False, G("body",
+                  C(START_TICK, "x", 1 , "$test"),
+                  C(START_TICK, "x", 1 , "x"),
+                  C(START_TICK, "$invariant_0", 1 , "$invariant_0"),
+                  T(1, tasks.WhileTask(True, False, G("body"), G("else"))),
+              ), G("else"))),
+              C(START_TICK, "x", FINAL_TICK, "retval")
+            )
+        target = g.get_task(START_TICK + 1)
+        tasks.guard_loop_inputs(target, {"$invariant_0"})
+        return g, target
+        
+    def test_guarded_raises(self):
+        g, target = self.guarded_loop()
+        self.assertRaises(KeyError, target.refine, g, START_TICK + 1, 
+                          {"$test":True, "$invariant_0":KeyError("a")})
+        
+    def test_guarded_not_executed(self):
+        g, target = self.guarded_loop()
+        target.refine(g, START_TICK + 1, {"$test":False, "$invariant_0":KeyError("a")})
+        self.assertEqual([], g.get_all_ticks())
+        
+    def test_guarded_no_exception(self):
+        g, target = self.guarded_loop()
+        target.refine(g, START_TICK + 1, {"$test":True, "$invariant_0":None})
+        self.assertEqual([Tick.parse_tick((1,1,1))], g.get_all_ticks())
+        
+    def test_raised_exception(self):
+        e = KeyError("a")
+        self.assertIs(e, tasks._raised_exception(tasks._Raised(e)))
+        self.assertIsNone(tasks._raised_exception(1))
+        
 class TestBuiltinTask(unittest.TestCase):
     
     def setUp(self):
@@ -347,8 +711,284 @@ class TestBuiltinTask(unittest.TestCase):
         self.assertEqual({"value":"abc"}, actual)
         
         
+class TestMapTask(unittest.TestCase):
+    
+    def test_evaluate(self):
+        target = tasks.MapTask(2, 1)
+        actual = target.evaluate({"func":lambda *args:args, "iterable":[1,2], "arg_0":"a", "arg_1":"b"})
+        self.assertEqual({"value":[("a", 1, "b"), ("a", 2, "b")]}, actual)
+        
+    def test_refine(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "lst", 1, "iterable"),
+            C(START_TICK, "a", 1, "arg_0"),
+            T(1, tasks.MapTask(1, 0), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":True, "iterable":2})
+        
+        expected = G(
+            C(START_TICK, "lst", (1,1), "value"),
+            T((1,1), tasks.UnpackTask(2), {'quick':True}),
+            C(START_TICK, "f", (1,2), "func"),
+            C((1,1), "0", (1,2), "item"),
+            C(START_TICK, "a", (1,2), "arg_0"),
+            T((1,2), tasks.MapElementTask(1, 0)),
+            C(START_TICK, "f", (1,3), "func"),
+            C((1,1), "1", (1,3), "item"),
+            C(START_TICK, "a", (1,3), "arg_0"),
+            T((1,3), tasks.MapElementTask(1, 0)),
+            C((1,2), "value", (1,4), "value_0"),
+            C((1,3), "value", (1,4), "value_1"),
+            T((1,4), tasks.ListTask(2), {'quick':True}),
+            C((1,4), "value", FINAL_TICK, "retval")
+        )
+        
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_empty(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "lst", 1, "iterable"),
+            T(1, tasks.MapTask(0, 0), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":True, "iterable":0})
+        
+        expected = G(
+            T((1,2), tasks.ListTask(0), {'quick':True}),
+            C((1,2), "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_not_functional(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "lst", 1, "iterable"),
+            T(1, tasks.MapTask(0, 0), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":False, "iterable":2})
+        
+        expected = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "lst", 1, "iterable"),
+            T(1, tasks.MapTask(0, 0), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_refine_no_sequence(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "lst", 1, "iterable"),
+            T(1, tasks.MapTask(0, 0), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":True, "iterable":None})
+        
+        self.assertFalse(g.get_task_properties(START_TICK + 1)["syncpoint"])
+        
+    def test_element(self):
+        target = tasks.MapElementTask(1, 0)
+        actual = target.evaluate({"func":lambda *args:args, "item":2, "arg_0":"a"})
+        self.assertEqual({"value":(2, "a")}, actual)
+        
+    def test_evaluate_raised_empty(self):
+        target = tasks.MapTask(1, 0)
+        raised = tasks._Raised(NameError("f"))
+        actual = target.evaluate({"func":raised, "iterable":[], "arg_0":"a"})
+        self.assertEqual({"value":[]}, actual)
+        
+    def test_evaluate_raised(self):
+        target = tasks.MapTask(1, 0)
+        raised = tasks._Raised(NameError("a"))
+        self.assertRaises(NameError, target.evaluate, 
+                          {"func":lambda *args:args, "iterable":[1], "arg_0":raised})
+        
+    def test_element_raised(self):
+        target = tasks.MapElementTask(1, 0)
+        raised = tasks._Raised(NameError("f"))
+        self.assertRaises(NameError, target.evaluate, 
+                          {"func":raised, "item":1, "arg_0":"a"})
+        
+        
+class TestGuardTask(unittest.TestCase):
+    
+    def test_evaluate(self):
+        target = tasks.GuardTask(tasks.AttributeTask("real"))
+        self.assertEqual({"value":1}, target.evaluate({"object":1}))
+        
+    def test_evaluate_raises(self):
+        target = tasks.GuardTask(tasks.AttributeTask("nope"))
+        actual = target.evaluate({"object":1})
+        self.assertIsInstance(actual["value"], tasks._Raised)
+        self.assertRaises(AttributeError, tasks.raise_guarded, actual["value"])
+        
+    def test_evaluate_raised_input(self):
+        target = tasks.GuardTask(tasks.AttributeTask("real"))
+        raised = tasks._Raised(NameError("x"))
+        self.assertEqual({"value":raised}, target.evaluate({"object":raised}))
+        
+    def test_ports(self):
+        target = tasks.GuardTask(tasks.AttributeTask("real"))
+        self.assertEqual(("object",), tuple(target.input_ports()))
+        self.assertEqual(("value",), tuple(target.output_ports()))
+        
+        
 DUMMY_GLOBAL = "Hello"
         
+class TestCallTask(unittest.TestCase):
+    
+    def setUp(self):
+        body = G(
+            C(START_TICK, "a", 1, "left"),
+            C(START_TICK, "b", 1, "right"),
+            T(1, tasks.BinOpTask(ast.Add()), {'quick':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        self.callee = tasks.ScheduledCallable(None, "add", body, ['a', 'b'], None, None, (10,))
+        
+    def test_refine_functional(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            T(1, tasks.CallTask(0, [], False, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(True, None)})
+        
+        self.assertFalse(g.get_task_properties(START_TICK + 1)["syncpoint"])
+        
+    def test_reducer(self):
+        reducer = tasks.CallTask.refiner_reducer["func"]
+        self.assertEqual((True, None), reducer(len))
+        self.assertEqual((False, None), reducer(open))
+        self.assertEqual((False, self.callee), reducer(self.callee))
+        
+    def test_inline(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "x", 1, "arg_0"),
+            C(START_TICK, "y", 1, "karg_0"),
+            T(1, tasks.CallTask(1, ['b'], False, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, self.callee)})
+        
+        expected = G(
+            C(START_TICK, "x", (1,2,1), "left"),
+            C(START_TICK, "y", (1,2,1), "right"),
+            T((1,2,1), tasks.BinOpTask(ast.Add()), {'quick':True, 'inline_depth':1}),
+            C((1,2,1), "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_inline_default(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "x", 1, "arg_0"),
+            T(1, tasks.CallTask(1, [], False, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, self.callee)})
+        
+        expected = G(
+            T((1,1,1), tasks.ConstTask(10), {'quick':True, 'inline_depth':1}),
+            C(START_TICK, "x", (1,2,1), "left"),
+            C((1,1,1), "value", (1,2,1), "right"),
+            T((1,2,1), tasks.BinOpTask(ast.Add()), {'quick':True, 'inline_depth':1}),
+            C((1,2,1), "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_inline_vararg_kwarg(self):
+        body = G(
+            C(START_TICK, "args", 1, "left"),
+            C(START_TICK, "kwargs", 1, "right"),
+            T(1, tasks.TupleTask(2), {'quick':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        callee = tasks.ScheduledCallable(None, "f", body, [], 'args', 'kwargs', ())
+        
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "x", 1, "arg_0"),
+            C(START_TICK, "y", 1, "karg_0"),
+            T(1, tasks.CallTask(1, ['c'], False, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, callee)})
+        
+        expected = G(
+            C(START_TICK, "x", (1,1,1), "value_0"),
+            T((1,1,1), tasks.TupleTask(1), {'quick':True, 'inline_depth':1}),
+            T((1,1,2), tasks.ConstTask('c'), {'quick':True, 'inline_depth':1}),
+            C((1,1,2), "value", (1,1,3), "key_0"),
+            C(START_TICK, "y", (1,1,3), "value_0"),
+            T((1,1,3), tasks.DictTask(1), {'quick':True, 'inline_depth':1}),
+            C((1,1,1), "value", (1,2,1), "left"),
+            C((1,1,3), "value", (1,2,1), "right"),
+            T((1,2,1), tasks.TupleTask(2), {'quick':True, 'inline_depth':1}),
+            C((1,2,1), "value", FINAL_TICK, "retval")
+        )
+        utils.assert_graph_equal(expected, g)
+        
+    def test_no_inline_starargs(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "x", 1, "starargs"),
+            T(1, tasks.CallTask(0, [], True, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, self.callee)})
+        
+        self.assertEqual(tasks.CallTask(0, [], True, False), g.get_task(START_TICK + 1))
+        
+    def test_no_inline_wrong_arguments(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            T(1, tasks.CallTask(0, [], False, False), {'syncpoint':True}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, self.callee)})
+        
+        self.assertEqual(tasks.CallTask(0, [], False, False), g.get_task(START_TICK + 1))
+        
+    def test_no_inline_too_deep(self):
+        g = G(
+            C(START_TICK, "f", 1, "func"),
+            C(START_TICK, "x", 1, "arg_0"),
+            T(1, tasks.CallTask(1, [], False, False), {'syncpoint':True, 'inline_depth':tasks.CallTask.MAX_INLINE_DEPTH}),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        
+        target = g.get_task(START_TICK + 1)
+        target.refine(g, START_TICK + 1, {"func":(False, self.callee)})
+        
+        self.assertEqual(tasks.CallTask(1, [], False, False), g.get_task(START_TICK + 1))
+        
+        
 class TestReadGlobal(unittest.TestCase):
     
     def setUp(self):
@@ -360,4 +1000,81 @@ class TestReadGlobal(unittest.TestCase):
         
     def test_builtin(self):
         actual = self.target.evaluate({"var":"range"})
-        self.assertEqual({"value":range}, actual)
\ No newline at end of file
+        self.assertEqual({"value":range}, actual)
+        
+    def test_read_global_name(self):
+        g = G(
+          T(1, tasks.ConstTask("DUMMY_GLOBAL")),
+          C(1, "value", 2, "var"),
+          T(2, self.target),
+          C(2, "value", 3, "func"),
+          T(3, tasks.CallTask(0, [], False, False)),
+          C(3, "value", FINAL_TICK, "retval")
+        )
+        source = graph.Endpoint(START_TICK + 2, "value")
+        self.assertEqual((__name__, "DUMMY_GLOBAL"), tasks.read_global_name(g, source))
+        
+    def test_read_global_name_variable(self):
+        g = G(
+          C(START_TICK, "name", 2, "var"),
+          T(2, self.target),
+          C(2, "value", FINAL_TICK, "retval")
+        )
+        source = graph.Endpoint(START_TICK + 2, "value")
+        self.assertIsNone(tasks.read_global_name(g, source))
+        
+    def test_read_global_name_other_task(self):
+        g = G(
+          T(1, tasks.ConstTask("DUMMY_GLOBAL")),
+          C(1, "value", FINAL_TICK, "retval")
+        )
+        source = graph.Endpoint(START_TICK + 1, "value")
+        self.assertIsNone(tasks.read_global_name(g, source))
+        self.assertIsNone(tasks.read_global_name(g, graph.Endpoint(START_TICK, "x")))
+        
+        
+class TestAssignGlobal(unittest.TestCase):
+    
+    def test_assigned_global_name(self):
+        g = G(
+          T(1, tasks.ConstTask("DUMMY_GLOBAL")),
+          C(1, "value", 2, "var"),
+          C(START_TICK, "x", 2, "value"),
+          T(2, tasks.AssignGlobal(__name__)),
+          C(2, "value", FINAL_TICK, "retval")
+        )
+        self.assertEqual((__name__, "DUMMY_GLOBAL"), tasks.assigned_global_name(g, START_TICK + 2))
+        
+    def test_assigned_global_name_variable(self):
+        g = G(
+          C(START_TICK, "name", 2, "var"),
+          C(START_TICK, "x", 2, "value"),
+          T(2, tasks.AssignGlobal(__name__)),
+          C(2, "value", FINAL_TICK, "retval")
+        )
+        self.assertEqual((__name__, None), tasks.assigned_global_name(g, START_TICK + 2))
+        
+        
+class TestFusedTask(unittest.TestCase):
+    
+    def setUp(self):
+        # (a * b) + c.real
+        self.target = tasks.FusedTask([
+            (tasks.BinOpTask(ast.Mult()), {"left":(None, "in_0"), "right":(None, "in_1")}),
+            (tasks.AttributeTask("real"), {"object":(None, "in_2")}),
+            (tasks.BinOpTask(ast.Add()), {"left":(0, "value"), "right":(1, "value")})
+        ])
+        
+    def test_ports(self):
+        self.assertEqual({"in_0", "in_1", "in_2"}, self.target.input_ports())
+        self.assertEqual({"value"}, self.target.output_ports())
+        
+    def test_evaluate(self):
+        actual = self.target.evaluate({"in_0":2, "in_1":3, "in_2":4})
+        self.assertEqual({"value":10}, actual)
+        
+    def test_pickle(self):
+        self.target.evaluate({"in_0":2, "in_1":3, "in_2":4})
+        copy = pickle.loads(pickle.dumps(self.target))
+        self.assertEqual(self.target, copy)
+        self.assertEqual({"value":7}, copy.evaluate({"in_0":1, "in_1":2, "in_2":5}))
@@ -1,6 +1,6 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
-from pydron.translation import translator
+from pydron.translation import cache
 from pydron.interpreter import blocking
 from pydron import picklesupport
 
@@ -9,14 +9,22 @@ import functools
 
 logger = logging.getLogger(__name__)
 
+#: Keyword arguments for :func:`translator.translate_function` used
+#: for `@schedule` functions. Set `speculate` to `True` to evaluate
+#: both branches of side-effect free `if` statements right away.
+translation_options = {"optimize": True, "unroll_window": 32, "speculate": False}
+
 
 def schedule(f):
     
     @functools.wraps(f)
     def call(*args, **kwargs):
-        dataflowcallable = translator.translate_function(f, blocking.BlockingScheduler())
+        dataflowcallable = cache.translation_cache.translate(f, blocking.BlockingScheduler, **translation_options)
         return dataflowcallable(*args, **kwargs)
     
+    # Allows tools such as `pydron.compile` to find the original function.
+    call.scheduled_function = f
+    
     return call
     
 
@@ -51,7 +51,8 @@ class BlockingScheduler(object):
         
         logger.info("Executing graph: %r" % g)
         
-        trav = traverser.Traverser(shed.schedule_refinement, shed.schedule_evaluation)
+        trav = traverser.Traverser(shed.schedule_refinement, shed.schedule_evaluation, shed.seed_constant, shed.free_values,
+                                   coalesce=True)
         
         @twistit.yieldefer
         def inside_reactor():
@@ -0,0 +1,418 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import contextlib
+from sortedcontainers import SortedSet
+from pydron.dataflow import graph
+
+
+class _TaskState(object):
+    """
+    Execution state of a task in an :class:`ExecutionGraph`.
+    """
+
+    __slots__ = ("refiner_ports", "out_data",
+                 "ready_count", "ready_ready", "ready_collected",
+                 "ref_count", "ref_ready", "ref_collected",
+                 "refined", "executed", "consumed")
+
+    def __init__(self, task, out_data, refined=False):
+        #: Input ports that have to have data before the task can be refined.
+        self.refiner_ports = frozenset(getattr(task, "refiner_ports", ()))
+
+        #: Maps output ports to the data set with `set_output_data`.
+        self.out_data = out_data
+
+        #: Number of input connections, and how many of those have data.
+        self.ready_count = 0
+        self.ready_ready = 0
+
+        #: Same, but only for the connections to `refiner_ports`.
+        self.ref_count = 0
+        self.ref_ready = 0
+
+        #: Returned by `collect_ready_tasks` or `collect_refine_tasks`.
+        self.ready_collected = False
+        self.ref_collected = False
+
+        #: The `refined` task property.
+        self.refined = refined
+
+        #: `set_output_data` was called.
+        self.executed = False
+
+        #: `consume_inputs` was called.
+        self.consumed = False
+
+
+class ExecutionGraph(graph.Graph):
+    """
+    Graph that keeps track of the state of each task while the graph
+    is executed:
+
+    * The data produced by each task, see :meth:`set_output_data`. Once the
+      data for a particular output is set, it cannot be changed. It is also
+      available as the `out_data` task property.
+
+    * Tasks that are ready for refinement, see :meth:`collect_refine_tasks`.
+
+    * Tasks that are ready for evaluation, see :meth:`collect_ready_tasks`.
+
+    * Data that is no longer needed, see :meth:`collect_unreferenced_data`
+      and :meth:`collect_discarded_tasks`.
+
+    A task is ready for refinement if it has input connections to refiner
+    ports and there is data for all of them. It is ready for evaluation if it
+    has been refined (or does not need refinement) and there is data for all
+    of its inputs. Tasks with a `syncpoint` property are evaluated only once
+    all tasks with a lower tick have been executed, tasks with a higher tick
+    wait until the sync-point task has been executed.
+
+    A task is considered to be `executed` once `set_output_data()` has been called.
+    """
+
+    def __init__(self):
+        graph.Graph.__init__(self)
+
+        start_state = _TaskState(None, {})
+        start_state.executed = True
+        final_state = _TaskState(None, {})
+        self.set_task_property(graph.START_TICK, "out_data", start_state.out_data)
+
+        #: Tick -> :class:`_TaskState`.
+        self._states = {graph.START_TICK: start_state, graph.FINAL_TICK: final_state}
+
+        #: Ticks of the tasks which are ready for evaluation but not yet collected.
+        self._ready_queue = SortedSet()
+
+        #: Ticks of the tasks which are ready for refinement but not yet collected.
+        self._refine_queue = SortedSet()
+
+        #: Ticks of the tasks with a `syncpoint` property which have not been executed.
+        self._pending_syncpoints = SortedSet()
+
+        #: Ticks of the tasks which have not been executed.
+        self._pending_ticks = SortedSet([graph.FINAL_TICK])
+
+        #: Ticks whose readiness is decided at the end of the batch.
+        self._batch_ticks = set()
+
+        #: Tasks that were removed after they had data set.
+        #: List of `(tick, properties)` tuples.
+        self._discarded = []
+
+        #: Maps the source endpoints with data to the number of
+        #: connections whose destination has not consumed it yet.
+        self._refcounts = {}
+
+        #: Endpoints whose count dropped to zero since the last
+        #: call to :meth:`collect_unreferenced_data`.
+        self._unreferenced = set()
+
+        self._consider(graph.FINAL_TICK)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Groups changes to the graph. Whether a task is ready is decided
+        once per affected task when the outermost batch ends, instead of
+        after every change.
+        """
+        try:
+            with graph.Graph.batch(self):
+                yield
+        finally:
+            if self._batch_depth == 0:
+                ticks = self._batch_ticks
+                self._batch_ticks = set()
+                for tick in ticks:
+                    self._consider(tick)
+
+    def add_task(self, tick, task, properties={}):
+        properties = dict(properties)
+        out_data = {}
+        properties["out_data"] = out_data
+        graph.Graph.add_task(self, tick, task, properties)
+
+        self._states[tick] = _TaskState(task, out_data, properties.get("refined", False))
+        self._pending_ticks.add(tick)
+        if properties.get("syncpoint", False):
+            self._pending_syncpoints.add(tick)
+        self._consider(tick)
+
+    def remove_task(self, tick):
+        props = self.get_task_properties(tick)
+        if self._states[tick].out_data or "eval_time" in props:
+            self._discarded.append((tick, props))
+        graph.Graph.remove_task(self, tick)
+        self._forget(tick)
+
+    def prune_task(self, tick):
+        """
+        Removes a task whose outputs are no longer needed. Unlike
+        :meth:`remove_task` the task is not returned by :meth:`collect_discarded_tasks`.
+        The task must be unconnected.
+        """
+        graph.Graph.remove_task(self, tick)
+        self._forget(tick)
+
+    def connect(self, source, dest):
+        graph.Graph.connect(self, source, dest)
+
+        dest_state = self._states[dest.tick]
+        has_data = source.port in self._states[source.tick].out_data
+        dest_state.ready_count += 1
+        if has_data:
+            dest_state.ready_ready += 1
+        if dest.port in dest_state.refiner_ports:
+            dest_state.ref_count += 1
+            if has_data:
+                dest_state.ref_ready += 1
+
+        if source in self._refcounts:
+            self._refcounts[source] += 1
+        self._consider(dest.tick)
+
+    def disconnect(self, source, dest):
+        graph.Graph.disconnect(self, source, dest)
+
+        dest_state = self._states[dest.tick]
+        has_data = source.port in self._states[source.tick].out_data
+        dest_state.ready_count -= 1
+        if has_data:
+            dest_state.ready_ready -= 1
+        if dest.port in dest_state.refiner_ports:
+            dest_state.ref_count -= 1
+            if has_data:
+                dest_state.ref_ready -= 1
+
+        if not dest_state.consumed:
+            self._release(source)
+        self._consider(dest.tick)
+
+    def set_task_property(self, tick, key, value):
+        graph.Graph.set_task_property(self, tick, key, value)
+        if key == "refined":
+            self._states[tick].refined = value
+            self._consider(tick)
+        elif key == "syncpoint":
+            if value and not self._states[tick].executed:
+                self._pending_syncpoints.add(tick)
+            else:
+                self._pending_syncpoints.discard(tick)
+
+    def set_output_data(self, tick, outputs):
+        """
+        Set the output values of a task.
+        Once an output is set, it cannot be changed.
+
+        This also marks the task as 'executed'. It should
+        therefore be invoked once the task has finished
+        even if the task has no output ports.
+
+        :param tick: Tick of the task that has completed.
+        :param outputs: Dict with out-port to value-reference map.
+        """
+        state = self._states[tick]
+        for port, data in outputs.iteritems():
+            if port in state.out_data:
+                raise ValueError("Value of out-port %s is already set." % port)
+            state.out_data[port] = data
+
+        state.executed = True
+        self._pending_syncpoints.discard(tick)
+        self._pending_ticks.discard(tick)
+
+        counts = dict.fromkeys(outputs, 0)
+        for source, dest in self.get_out_connections(tick):
+            if source.port in counts:
+                counts[source.port] += 1
+                dest_state = self._states[dest.tick]
+                dest_state.ready_ready += 1
+                if dest.port in dest_state.refiner_ports:
+                    dest_state.ref_ready += 1
+                self._consider(dest.tick)
+
+        if tick == graph.START_TICK:
+            return # graph inputs are not counted
+        for port, count in counts.iteritems():
+            source = graph.Endpoint(tick, port)
+            self._refcounts[source] = count
+            if count == 0:
+                self._unreferenced.add(source)
+
+    def get_data(self, out_endpoint):
+        """
+        Returns the data reference for the specified output port.
+
+        If the data reference was not set, a `KeyError` is raised.
+        """
+        try:
+            return self._states[out_endpoint.tick].out_data[out_endpoint.port]
+        except KeyError:
+            raise KeyError("Data is not available.")
+
+    def consume_inputs(self, tick):
+        """
+        Marks the data of all inputs of the task as consumed.
+        Call this once the task has been evaluated.
+        """
+        state = self._states[tick]
+        if state.consumed:
+            raise ValueError("Inputs of %r were already consumed." % tick)
+        state.consumed = True
+        for source, _ in self.get_in_connections(tick):
+            self._release(source)
+
+    def collect_unreferenced_data(self):
+        """
+        Returns the data which is no longer needed since all connections
+        from its output have been consumed or removed.
+
+        Only the data that became unreferenced since the last call are returned.
+        Graph outputs are connected to `FINAL_TICK` which never consumes its inputs,
+        so they are never returned. Neither are the graph inputs.
+
+        :returns: List of data references.
+        """
+        data = []
+        for source in self._unreferenced:
+            if self._refcounts.get(source, None) == 0:
+                del self._refcounts[source]
+                data.append(self.get_data(source))
+        self._unreferenced = set()
+        return data
+
+    def collect_discarded_tasks(self):
+        """
+        Returns the tasks which have been removed from the graph
+        even though they were already evaluated, such as those of
+        a speculative branch that was not taken.
+
+        Only the tasks removed since the last call are returned.
+
+        :returns: List of `(tick, properties)` tuples.
+        """
+        discarded = self._discarded
+        self._discarded = []
+        return discarded
+
+    def collect_ready_tasks(self):
+        """
+        Returns all tasks which are ready for evaluation.
+
+        Only the tasks that entered this state since the last call are returned.
+
+        Changes to the graph that would make a task not ready that was already
+        returned by this function are not allowed.
+        """
+        return self._collect(self._ready_queue, "ready_collected", True)
+
+    def collect_refine_tasks(self):
+        """
+        Returns all tasks which are ready for refinement.
+
+        Only the tasks that entered this state since the last call are returned.
+
+        Changes to the graph that would make a task not ready that was already
+        returned by this function are not allowed.
+        """
+        return self._collect(self._refine_queue, "ref_collected", False)
+
+    def was_ready_collected(self, tick):
+        """
+        Returns if the tick was returned by :meth:`collect_ready_tasks`.
+        """
+        return self._states[tick].ready_collected
+
+    def was_refine_collected(self, tick):
+        """
+        Returns if the tick was returned by :meth:`collect_refine_tasks`.
+        """
+        return self._states[tick].ref_collected
+
+    def will_be_refined(self, tick):
+        """
+        Returns if the tick will be refined at all.
+        """
+        return self._states[tick].ref_count > 0
+
+    def was_executed(self, tick):
+        """
+        Returns if :meth:`set_output_data` was called for the given tick.
+        """
+        return self._states[tick].executed
+
+    def past_all_syncpoints(self):
+        """
+        Returns `True` if all sync-point tasks have been executed.
+        """
+        return len(self._pending_syncpoints) == 0
+
+    def past_all_tasks(self):
+        """
+        Returns `True` if all tasks have been executed.
+        """
+        return self._pending_ticks[0] == graph.FINAL_TICK
+
+    def _collect(self, queue, collected_attr, syncpoint_run_last):
+        """
+        Removes the ticks from `queue` up to the next sync-point and returns them.
+
+        :param syncpoint_run_last: If `True` then the sync-point itself is only
+          returned once all tasks with a lower tick have been executed.
+        """
+        ticks = set()
+        while queue:
+            tick = queue[0]
+            if self._pending_syncpoints:
+                next_syncpoint = self._pending_syncpoints[0]
+                if tick > next_syncpoint:
+                    # has to wait til the sync-point completed
+                    break
+                if (tick == next_syncpoint and syncpoint_run_last and
+                    self._pending_ticks[0] < next_syncpoint):
+                    # There are still unfinished tasks that have to run before it.
+                    break
+            setattr(self._states[tick], collected_attr, True)
+            queue.remove(tick)
+            ticks.add(tick)
+        return ticks
+
+    def _consider(self, tick):
+        """
+        Updates the queues after something changed that might affect
+        if the task is ready.
+        """
+        if self._batch_depth:
+            self._batch_ticks.add(tick)
+            return
+
+        state = self._states[tick]
+        if not state.ready_collected:
+            if state.ready_count == state.ready_ready and (state.refined or not state.refiner_ports):
+                self._ready_queue.add(tick)
+            else:
+                self._ready_queue.discard(tick)
+        if not state.ref_collected:
+            if state.ref_count and state.ref_count == state.ref_ready:
+                self._refine_queue.add(tick)
+            else:
+                self._refine_queue.discard(tick)
+
+    def _release(self, source):
+        if source in self._refcounts:
+            self._refcounts[source] -= 1
+            if self._refcounts[source] == 0:
+                self._unreferenced.add(source)
+
+    def _forget(self, tick):
+        state = self._states.pop(tick)
+        for port in state.out_data:
+            source = graph.Endpoint(tick, port)
+            self._refcounts.pop(source, None)
+            self._unreferenced.discard(source)
+        self._batch_ticks.discard(tick)
+        self._ready_queue.discard(tick)
+        self._refine_queue.discard(tick)
+        self._pending_syncpoints.discard(tick)
+        self._pending_ticks.discard(tick)
@@ -1,9 +1,12 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
 
+import collections
+import weakref
 from pydron.backend import worker
+from pydron.dataflow import graph, tasks
 
-from twisted.internet import defer, task
+from twisted.internet import defer, task, reactor
 
 import logging
 import twistit
@@ -11,6 +14,12 @@ import anycall
 import pickle
 from pydron.interpreter import traverser
 logger = logging.getLogger(__name__)
+
+#: Estimated duration in seconds of a task which was not evaluated before.
+DEFAULT_DURATION = 0.1
+
+#: Estimated duration in seconds of a task with the `quick` property.
+QUICK_DURATION = 0.0
     
     
 class Scheduler(object):
@@ -29,6 +38,10 @@ class Scheduler(object):
             self.inputs = inputs
             self.result = defer.Deferred(self._cancel)
             
+            #: Critical-path priority, see :func:`critical_path_priorities`.
+            #: Calculated once the job is about to be dispatched.
+            self.priority = None
+            
         def _cancel(self, d):
             self.scheduler._cancel_job(self)
             
@@ -52,6 +65,33 @@ class Scheduler(object):
         #: task is executed.
         self._leaked_valuerefs = set()
         
+        #: `(module_name, var, reducer)` -> `(value, reduced)` of a global
+        #: callable, for refiner ports in `refiner_cacheable`. `value` is
+        #: the object the global was bound to when it was reduced. 
+        #: Entries are removed when the global is assigned, and ignored
+        #: if the global was bound to another object by code we don't schedule.
+        self._global_refiner_cache = {}
+        
+        #: `id(task)` -> `(task, digest)` for recently evaluated tasks. The
+        #: task is kept so that its id isn't reused while the entry exists.
+        #: The digest is `None` if the task cannot be pickled.
+        self._task_digests = worker.TaskRegistry()
+        
+        #: worker -> :class:`worker.TaskRegistry` of the digests we've sent to it.
+        self._sent_tasks = {}
+        
+        #: `id(task)` -> `(task, duration)` of recently evaluated tasks. Used
+        #: to estimate how long the next evaluation of the same task takes,
+        #: for example in the next iteration of a loop.
+        self._eval_times = worker.TaskRegistry()
+        
+        #: `id(graph)` -> :class:`CriticalPathLevels` of the graphs we've
+        #: seen jobs of. Entries are removed when the graph is garbage collected.
+        self._critical_paths = {}
+        
+        #: Delayed call of :meth:`_schedule` after jobs were added to the queue.
+        self._schedule_call = None
+        
         self._master_worker = None
         
         self._statusreport_interval = 2
@@ -73,6 +113,7 @@ class Scheduler(object):
         logger.debug("Refinement request for %r. Transferring inputs to %r" % (tick, me))
         
         in_ports = list(inputs.iterkeys())
+        cache_keys = global_refiner_cache_keys(g, tick, task)
         
         # First, get all the required data here.
         data_transfers = []
@@ -85,15 +126,23 @@ class Scheduler(object):
             else:
                 reducer = None
         
-            if reducer is None:
+            if self._cached_global_reduction(cache_keys.get(port, None)):
+                # We've reduced the value of this global before.
+                d = defer.succeed(self._global_refiner_cache[cache_keys[port]][1])
+            elif reducer is not None and reducer in valueref.reduced:
+                # The worker that produced the value reduced it already.
+                d = defer.succeed(valueref.reduced[reducer])
+            elif reducer is None:
                 # Get the complete value.
                 # We could use a `lambda x:x` reducer, but this way
                 # the value ends up in our store, so we might not have
                 # to transfer it again.
                 d = me.fetch_from(source, valueref.valueid)
-                def fetched(_):
+                def fetched(_, valueref):
+                    # Remember the copy, so that it is freed with the others.
+                    valueref.add_worker(meremote)
                     return me.get_value(valueref.valueid)
-                d.addCallback(fetched)
+                d.addCallback(fetched, valueref)
             else:
                 d = source.reduce(valueref.valueid, reducer)
             
@@ -105,6 +154,10 @@ class Scheduler(object):
         for i, port in enumerate(in_ports):
             _, value = transfer_results[i]
             input_values[port] = value
+            if port in cache_keys:
+                module_name, var, _ = cache_keys[port]
+                bound = _bound_global(module_name, var)
+                self._global_refiner_cache[cache_keys[port]] = (bound, value)
             
         logger.info("Refining %r..." % tick)
         
@@ -113,6 +166,27 @@ class Scheduler(object):
     
         logger.info("Refining of %r completed." % tick)
     
+    def seed_constant(self, g, tick, task):
+        """
+        Stores the value of a :class:`tasks.ConstTask` directly in the local
+        worker, so that no job has to be scheduled for it.
+        
+        :returns: port -> valueref for the outputs of the task or `None` if
+          the task has to be evaluated.
+        """
+        if not isinstance(task, tasks.ConstTask):
+            return None
+        
+        me = anycall.RPCSystem.default.local_worker  #@UndefinedVariable
+        meremote = anycall.RPCSystem.default.local_remoteworker  #@UndefinedVariable
+        
+        valueid = worker.ValueId(graph.Endpoint(tick, "value"))
+        datasize = me.set_value(valueid, task.value)
+        valueref = worker.ValueRef(valueid, datasize is not None, meremote)
+        valueref.datasize = datasize
+        logger.debug("Seeded constant %r for %r" % (task.value, tick))
+        return {"value": valueref}
+    
     def schedule_evaluation(self, g, tick, task, inputs):
         """
         Evaluate a task.
@@ -126,17 +200,30 @@ class Scheduler(object):
         logger.debug("Job added to queue: %r" % job)
         self._job_queue.add(job)
         
-        self._schedule()
+        # The traverser passes all tasks that became ready at once. We wait 
+        # until all of them are in the queue so that the most urgent ones
+        # are dispatched first.
+        if self._schedule_call is None:
+            self._schedule_call = reactor.callLater(0, self._schedule_delayed) #@UndefinedVariable
 
         return job.result
+    
+    def _schedule_delayed(self):
+        self._schedule_call = None
+        self._schedule()
        
     def _schedule(self):
         """
         Call this whenever a worker becomes idle or a new job is added to the queue.
+        
+        The jobs are passed to the strategy ordered by their critical-path priority,
+        the most urgent first.
         """
 
         if self._job_queue:
-            pairs = list(self._strategy.assign_jobs_to_workers(list(self._job_queue)))
+            self._prioritize([job for job in self._job_queue if job.priority is None])
+            jobs = sorted(self._job_queue, key=lambda job: (-job.priority, job.tick))
+            pairs = list(self._strategy.assign_jobs_to_workers(jobs))
 
             for workr, job, callback in pairs:
                 logger.debug("Job %r scheduled for %r." % (job, workr))
@@ -172,11 +259,30 @@ class Scheduler(object):
         runs_on_master = workr is self._master_worker
             
         # Run
+        reducers = refiner_reducers(job.g, job.tick)
+        fail_on_unexpected_nosend = not runs_on_master
+        if runs_on_master:
+            task_ref = job.task
+        else:
+            task_ref = self._task_ref(workr, job.task)
         d = workr.evaluate(job.tick, 
-                           job.task, 
+                           task_ref, 
                            prepared_inputs, 
                            nosend_ports=nosend_ports,
-                           fail_on_unexpected_nosend=not runs_on_master)
+                           fail_on_unexpected_nosend=fail_on_unexpected_nosend,
+                           reducers=reducers)
+        
+        if isinstance(task_ref, worker.TaskRef) and task_ref.task is None:
+            def unknown_task(reason):
+                reason.trap(worker.UnknownTaskError)
+                logger.debug("%r evicted the task of %r. Sending it again." % (workr, job))
+                return workr.evaluate(job.tick, 
+                                      worker.TaskRef(task_ref.digest, job.task), 
+                                      prepared_inputs, 
+                                      nosend_ports=nosend_ports,
+                                      fail_on_unexpected_nosend=fail_on_unexpected_nosend,
+                                      reducers=reducers)
+            d.addErrback(unknown_task)
         
         def catch_pickleerror(reason, job, workr):
             """
@@ -188,9 +294,28 @@ class Scheduler(object):
                 return reason
             
         def on_success(evalresult, job, workr):
+            if job not in self._currently_running:
+                # We cancelled this job but the worker completed it anyways.
+                logger.info("Job %r completed after it was cancelled." % job)
+                if callback is not None:
+                    callback(job, workr, False)
+                if isinstance(evalresult.result, dict):
+                    for valueid in evalresult.result.itervalues():
+                        d = workr.free(valueid)
+                        
+                        def on_err(reason, valueid, workr):
+                            logger.error("Failed to free %r from %r." %
+                                         (valueid, workr))
+                        d.addErrback(on_err, valueid, workr)
+                self._schedule()
+                return
+            
             logger.info("Job %r completed." % job)
             self._stopped_running(job)
             
+            if evalresult.duration is not None:
+                self._eval_times.add(id(job.task), (job.task, evalresult.duration))
+            
             if callback is not None:
                 callback(job, workr, False)
             
@@ -206,6 +331,9 @@ class Scheduler(object):
             for valueref in job.inputs.itervalues():
                 valueref.add_worker(workr)
                 
+            if isinstance(job.task, tasks.AssignGlobal):
+                self._global_assigned(job.g, job.tick)
+                
             if syncpoint:
                 # All the inputs have now potentially leaked into
                 # global variables.
@@ -229,6 +357,8 @@ class Scheduler(object):
                         
                     valref = worker.ValueRef(valueid, pickle_support, workr) 
                     valref.datasize = datasize
+                    if evalresult.reduced:
+                        valref.reduced = {reducer:value for (p, reducer), value in evalresult.reduced.iteritems() if p == port}
                     
                     outs[port] = valref
                         
@@ -305,6 +435,73 @@ class Scheduler(object):
         d.addErrback(unhandled)
         
 
+    def free_values(self, valuerefs):
+        """
+        Frees the values on all workers that have them. 
+        
+        Each worker gets a single :meth:`worker.RemoteWorker.free_many` call.
+        
+        :param valuerefs: References to values that are not used anymore.
+        """
+        valueids_per_worker = collections.defaultdict(list)
+        for valueref in valuerefs:
+            self._leaked_valuerefs.discard(valueref)
+            for workr in list(valueref.get_workers()):
+                valueids_per_worker[workr].append(valueref.valueid)
+                valueref.remove_worker(workr)
+                
+        for workr, valueids in valueids_per_worker.iteritems():
+            d = workr.free_many(valueids)
+            
+            def on_err(reason, valueids, workr):
+                logger.error("Failed to free %r from %r." %
+                             (valueids, workr))
+            d.addErrback(on_err, valueids, workr)
+
+    def _prioritize(self, jobs):
+        """
+        Calculates the critical-path priority of the given jobs.
+        """
+        jobs_per_graph = collections.defaultdict(list)
+        for job in jobs:
+            jobs_per_graph[id(job.g)].append(job)
+        for graph_jobs in jobs_per_graph.itervalues():
+            levels = self._critical_path_levels(graph_jobs[0].g)
+            priorities = levels.priorities([job.tick for job in graph_jobs], self._estimate_duration)
+            for job in graph_jobs:
+                job.priority = priorities[job.tick]
+            
+    def _critical_path_levels(self, g):
+        """
+        Returns the :class:`CriticalPathLevels` of the graph.
+        """
+        key = id(g)
+        levels = self._critical_paths.get(key, None)
+        if levels is None:
+            def collected(_):
+                self._critical_paths.pop(key, None)
+            levels = CriticalPathLevels(g, collected)
+            self._critical_paths[key] = levels
+        return levels
+            
+    def _estimate_duration(self, g, tick):
+        """
+        Returns the expected duration of the task in seconds. This is the 
+        `eval_time` property if the task has one, otherwise the duration of the
+        last evaluation of the same task object. If the task was never evaluated 
+        we fall back to :data:`QUICK_DURATION` or :data:`DEFAULT_DURATION`.
+        """
+        props = g.get_task_properties(tick)
+        if "eval_time" in props:
+            return props["eval_time"]
+        task = g.get_task(tick)
+        entry = self._eval_times.get(id(task))
+        if entry is not None and entry[0] is task:
+            return entry[1]
+        if props.get("quick", False):
+            return QUICK_DURATION
+        return DEFAULT_DURATION
+
     def _cancel_job(self, job):
         if job in self._job_queue:
             self._job_queue.remove(job)
@@ -355,8 +552,59 @@ class Scheduler(object):
         
             valueref.valueid = new_valueid
             
+            # The value might have changed.
+            valueref.reduced = {}
+            
         return defer.DeferredList(copies, fireOnOneErrback=True)
          
+    def _task_ref(self, workr, task):
+        """
+        Returns what to pass to `evaluate` of `workr` for `task`. This is a
+        :class:`worker.TaskRef` that includes the task only if we haven't sent
+        it to `workr` before, or the task itself if it cannot be pickled.
+        """
+        entry = self._task_digests.get(id(task))
+        if entry is None or entry[0] is not task:
+            try:
+                digest = worker.task_digest(task)
+            except Exception:
+                digest = None # Let the evaluation report the pickle error.
+            entry = (task, digest)
+            self._task_digests.add(id(task), entry)
+        digest = entry[1]
+        
+        if digest is None:
+            return task
+        
+        sent = self._sent_tasks.setdefault(workr, worker.TaskRegistry())
+        if sent.get(digest, False):
+            return worker.TaskRef(digest)
+        else:
+            sent.add(digest, True)
+            return worker.TaskRef(digest, task)
+        
+    def _cached_global_reduction(self, key):
+        """
+        Returns `True` if there is a cached reduction for `key` and the 
+        global is still bound to the same object.
+        """
+        if key not in self._global_refiner_cache:
+            return False
+        module_name, var, _ = key
+        bound, _ = self._global_refiner_cache[key]
+        return bound is _bound_global(module_name, var)
+        
+    def _global_assigned(self, g, tick):
+        """
+        Forget the cached reductions of the global assigned by
+        the :class:`tasks.AssignGlobal` task at `tick`.
+        """
+        module_name, var = tasks.assigned_global_name(g, tick)
+        for key in list(self._global_refiner_cache.iterkeys()):
+            if key[0] == module_name and (var is None or key[1] == var):
+                logger.debug("Global %s.%s assigned. Forgetting %r." % (module_name, var, key))
+                del self._global_refiner_cache[key]
+            
     def _started_running(self, job, workr, d):
         self._currently_running[job] = (d, workr)
         self._currently_running_changed()
@@ -377,4 +625,166 @@ class Scheduler(object):
         logger.info("--------------------------------------")
         for job, (_, workr) in self._currently_running.iteritems():
             logger.info("   %r on %r" % (job, workr))
-            
+
+
+def critical_path_priorities(g, ticks, estimate, levels=None):
+    """
+    Returns the bottom-level of the given tasks: The sum of the estimated 
+    durations along the longest path from the task to the outputs of the graph,
+    including the task itself. Tasks on a long chain get a higher priority than
+    those of a short side branch.
+    
+    The priorities are only approximate for tasks upstream of a task that
+    is not refined yet, such as a `ForTask` or `WhileTask` whose body has
+    not been unrolled. Such a task counts with its own estimate only, not
+    with the tasks it will be replaced with.
+    
+    :param ticks: Tasks for which the priority is required.
+    
+    :param estimate: Callable `estimate(g, tick)` that returns the expected
+      duration of a task.
+      
+    :param levels: Optional `dict` with the levels of tasks that were calculated
+      before and are still valid. Those tasks are not visited again. The levels
+      calculated by this call are added to it.
+      
+    :returns: `dict` that maps the given ticks to their priority.
+    """
+    if levels is None:
+        levels = {}
+    levels[graph.FINAL_TICK] = 0
+    
+    # All tasks that depend on one of the given ones and have no level yet.
+    downstream = set()
+    stack = list(ticks)
+    while stack:
+        tick = stack.pop()
+        if tick in downstream or tick in levels:
+            continue
+        downstream.add(tick)
+        stack.extend(dest.tick for _, dest in g.get_out_connections(tick))
+    
+    # Connections always point to a later tick, so the levels of 
+    # the consumers are known by the time we get to a task.
+    for tick in sorted(downstream, reverse=True):
+        consumer_levels = [levels[dest.tick] for _, dest in g.get_out_connections(tick)]
+        levels[tick] = estimate(g, tick) + max(consumer_levels or [0])
+    return {tick: levels[tick] for tick in ticks}
+
+
+class CriticalPathLevels(object):
+    """
+    Memoizes the levels calculated by :func:`critical_path_priorities` for
+    a graph, so that each scheduling round only visits the tasks added since.
+    
+    Observes the graph: A change to the out-connections of a task invalidates
+    its level and the levels of all tasks upstream of it. The estimated
+    durations are not observed, a level keeps the estimates of the time
+    it was calculated.
+    """
+    
+    def __init__(self, g, collected=None):
+        """
+        :param collected: Called with a weak reference to the graph once
+          the graph is garbage collected.
+        """
+        # The graph references us as an observer.
+        self._graph = weakref.ref(g, collected)
+        
+        #: Tick -> level of the tasks whose level is still valid. If a
+        #: task is in here, then so are all the tasks downstream of it.
+        self._levels = {}
+        
+        g.subscribe(self)
+        
+    def priorities(self, ticks, estimate):
+        """
+        Same as :func:`critical_path_priorities`.
+        """
+        return critical_path_priorities(self._graph(), ticks, estimate, self._levels)
+    
+    def task_added(self, tick, task, properties):
+        pass
+    
+    def task_removed(self, tick):
+        self._levels.pop(tick, None)
+        
+    def connected(self, source, dest):
+        self._invalidate(source.tick)
+        
+    def disconnected(self, source, dest):
+        self._invalidate(source.tick)
+        
+    def task_property_changed(self, tick, key, value):
+        pass
+        
+    def _invalidate(self, tick):
+        g = self._graph()
+        stack = [tick]
+        while stack:
+            tick = stack.pop()
+            if self._levels.pop(tick, None) is None:
+                # Not calculated, so neither is anything upstream.
+                continue
+            try:
+                in_connections = g.get_in_connections(tick)
+            except KeyError:
+                # Removed later within the same batch. It was
+                # disconnected before, which invalidates its sources.
+                continue
+            stack.extend(source.tick for source, _ in in_connections)
+
+
+def refiner_reducers(g, tick):
+    """
+    Returns the reducers of the refiner ports that the outputs of the 
+    task at `tick` are connected to.
+    
+    :returns: `dict` that maps output ports to a list of reducers, 
+      or `None` if there are none.
+    """
+    reducers = {}
+    for source, dest in g.get_out_connections(tick):
+        if dest.tick == graph.FINAL_TICK:
+            continue
+        task = g.get_task(dest.tick)
+        if dest.port not in getattr(task, "refiner_ports", ()):
+            continue
+        reducer = getattr(task, "refiner_reducer", {}).get(dest.port, None)
+        if reducer is not None and reducer not in reducers.get(source.port, ()):
+            reducers.setdefault(source.port, []).append(reducer)
+    return reducers or None
+
+
+#: Returned by :func:`_bound_global` if the global is not bound.
+_UNBOUND = object()
+
+def _bound_global(module_name, var):
+    try:
+        return tasks.lookup_global(module_name, var)
+    except (NameError, ImportError):
+        return _UNBOUND
+
+
+def global_refiner_cache_keys(g, tick, task):
+    """
+    Returns the keys into the cache of reduced global callables for
+    the refiner ports of the task at `tick`.
+    
+    Only ports in `refiner_cacheable` that have a reducer and are connected
+    to a :class:`tasks.ReadGlobal` with a constant variable name get a key.
+    
+    :returns: `dict` that maps refiner ports to `(module_name, var, reducer)`.
+    """
+    keys = {}
+    cacheable = getattr(task, "refiner_cacheable", ())
+    for source, dest in g.get_in_connections(tick):
+        if dest.port not in cacheable:
+            continue
+        reducer = getattr(task, "refiner_reducer", {}).get(dest.port, None)
+        if reducer is None:
+            continue
+        name = tasks.read_global_name(g, source)
+        if name is not None:
+            keys[dest.port] = name + (reducer,)
+    return keys
@@ -20,7 +20,7 @@ class SchedulingStrategy(object):
         
         It is allowed to run several jobs in parallel on the same worker.
 
-        :param jobs: Jobs ready for execution.
+        :param jobs: Jobs ready for execution, the most urgent first.
         
         :returns: List of `(worker, job, callback)` tuples. 
             The callback is invoked once the job has finished.
@@ -136,9 +136,7 @@ class TrivialSchedulingStrategy(SchedulingStrategy):
         if self._master_worker is None:
             self._master_worker = anycall.RPCSystem.default.local_remoteworker #@UndefinedVariable
         
-        while jobs:
-            job = jobs.pop()
-            
+        for job in jobs:
             worker, callback = self._assign_job_to_worker(job)
             if worker is not None:
                 yield worker, job, callback
@@ -2,7 +2,7 @@
 
 import unittest
 
-from pydron.interpreter import graphdecorator
+from pydron.interpreter import executiongraph
 from pydron.dataflow import graph
 
 
@@ -13,10 +13,10 @@ TICK4 = graph.START_TICK + 4
 TICK5 = graph.START_TICK + 5
 FINAL = graph.FINAL_TICK
 
-class TestDataDecorator(unittest.TestCase):
+class TestData(unittest.TestCase):
     
     def setUp(self):
-        self.target = graphdecorator.DataGraphDecorator(graph.Graph())
+        self.target = executiongraph.ExecutionGraph()
 
     def test_get_data(self):
         self.target.add_task(graph.START_TICK + 1, "task1")
@@ -38,12 +38,87 @@ class TestDataDecorator(unittest.TestCase):
         self.target.connect(graph.Endpoint(graph.START_TICK, "graphin"), graph.Endpoint(TICK1, "in"))
         self.assertRaises(KeyError, self.target.get_data, graph.Endpoint(graph.START_TICK, "graphin"))
         
-class TestReadyDecorator(unittest.TestCase):
+    def test_remove_task_discarded(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.remove_task(TICK1)
+        self.assertEqual([TICK1], [tick for tick, _ in self.target.collect_discarded_tasks()])
+        
+    def test_unreferenced_consumed(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, "task2")
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        self.target.consume_inputs(TICK2)
+        self.assertEqual(["data"], self.target.collect_unreferenced_data())
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_not_connected(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.assertEqual(["data"], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_disconnected(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, "task2")
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.disconnect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.assertEqual(["data"], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_reconnected(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, "task2")
+        self.target.add_task(TICK3, "task3")
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.disconnect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK3, "in"))
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_consumed_disconnected(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, "task2")
+        self.target.add_task(TICK3, "task3")
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK3, "in"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.consume_inputs(TICK2)
+        self.target.disconnect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_graph_output(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(FINAL, "retval"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_graph_input(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.connect(graph.Endpoint(graph.START_TICK, "in"), graph.Endpoint(TICK1, "in"))
+        self.target.set_output_data(graph.START_TICK, {"in": "data"})
+        self.target.consume_inputs(TICK1)
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_unreferenced_removed(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.remove_task(TICK1)
+        self.assertEqual([], self.target.collect_unreferenced_data())
+        
+    def test_prune_task_not_discarded(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.target.prune_task(TICK1)
+        self.assertEqual([], self.target.collect_discarded_tasks())
+        self.assertEqual([], self.target.get_all_ticks())
+        
+class TestReady(unittest.TestCase):
     
     
     def setUp(self):
-        self.target = graphdecorator.ReadyDecorator(
-                            graphdecorator.DataGraphDecorator(graph.Graph()))
+        self.target = executiongraph.ExecutionGraph()
         
     def test_add_task_flush(self):
         self.target.add_task(TICK1, "task")
@@ -214,12 +289,51 @@ class TestReadyDecorator(unittest.TestCase):
         self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
         self.assertFalse(self.target.was_ready_collected(TICK2))
         
-class TestRefineDecorator(unittest.TestCase):
+    def test_batch(self):
+        with self.target.batch():
+            self.target.add_task(TICK1, "task1")
+            self.target.add_task(TICK2, "task2")
+            self.assertEqual({FINAL}, self.target.collect_ready_tasks())
+            self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+            
+        self.assertEqual({TICK1}, self.target.collect_ready_tasks())
+        
+    def test_batch_nested(self):
+        with self.target.batch():
+            with self.target.batch():
+                self.target.add_task(TICK1, "task1")
+            self.assertEqual({FINAL}, self.target.collect_ready_tasks())
+        self.assertEqual({TICK1}, self.target.collect_ready_tasks())
+        
+    def test_batch_remove_task(self):
+        with self.target.batch():
+            self.target.add_task(TICK1, "task1")
+            self.target.add_task(TICK2, "task2")
+            self.target.remove_task(TICK1)
+        self.assertEqual({TICK2, FINAL}, self.target.collect_ready_tasks())
+        
+    def test_was_executed(self):
+        self.target.add_task(TICK1, "task1")
+        self.assertFalse(self.target.was_executed(TICK1))
+        self.target.collect_ready_tasks()
+        self.assertFalse(self.target.was_executed(TICK1))
+        self.target.set_output_data(TICK1, {})
+        self.assertTrue(self.target.was_executed(TICK1))
+        self.assertFalse(self.target.was_executed(FINAL))
+        
+    def test_prune_task(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, "task2", {"syncpoint": True})
+        self.target.prune_task(TICK2)
+        self.assertTrue(self.target.past_all_syncpoints())
+        self.assertEqual({TICK1, FINAL}, self.target.collect_ready_tasks())
+        
+        
+class TestRefine(unittest.TestCase):
     
     
     def setUp(self):
-        self.target = graphdecorator.RefineDecorator(
-                            graphdecorator.DataGraphDecorator(graph.Graph()))
+        self.target = executiongraph.ExecutionGraph()
         
     def test_add_task_disconnected(self):
         self.target.add_task(TICK1, MockTask("in"))
@@ -245,6 +359,15 @@ class TestRefineDecorator(unittest.TestCase):
         self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
         self.assertEquals({TICK2}, self.target.collect_refine_tasks())
         
+    def test_batch(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        with self.target.batch():
+            self.target.add_task(TICK2, MockTask("in"))
+            self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+            self.assertEquals(set(), self.target.collect_refine_tasks())
+        self.assertEquals({TICK2}, self.target.collect_refine_tasks())
+        
     def test_disconnect(self):
         self.target.add_task(TICK1, "task1")
         self.target.add_task(TICK2, MockTask("in"))
@@ -295,6 +418,50 @@ class TestRefineDecorator(unittest.TestCase):
         self.target.add_task(TICK1, "task")
         self.assertFalse(self.target.will_be_refined(TICK1))
         
+class TestExecutionGraph(unittest.TestCase):
+    
+    def setUp(self):
+        self.target = executiongraph.ExecutionGraph()
+        
+    def test_out_data_property(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.assertEqual({"out": "data"}, self.target.get_task_properties(TICK1)["out_data"])
+        
+    def test_refine_before_ready(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, MockTask("in"))
+        self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.target.set_output_data(TICK1, {"out": "data"})
+        self.assertEqual({TICK2}, self.target.collect_refine_tasks())
+        self.assertEqual({TICK1, FINAL}, self.target.collect_ready_tasks())
+        self.target.set_task_property(TICK2, "refined", True)
+        self.assertEqual({TICK2}, self.target.collect_ready_tasks())
+        
+    def test_refine_and_ready_in_batch(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.set_output_data(TICK1, {"out": "data"})
+        with self.target.batch():
+            self.target.add_task(TICK2, MockTask("in"), {"refined": True})
+            self.target.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        self.assertEqual({TICK2}, self.target.collect_refine_tasks())
+        self.assertEqual({TICK1, TICK2, FINAL}, self.target.collect_ready_tasks())
+        
+    def test_refine_syncpoint_first(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.add_task(TICK2, MockTask("in"), {"syncpoint": True})
+        self.target.add_task(TICK3, MockTask("in"))
+        self.target.connect(graph.Endpoint(graph.START_TICK, "in"), graph.Endpoint(TICK2, "in"))
+        self.target.connect(graph.Endpoint(graph.START_TICK, "in"), graph.Endpoint(TICK3, "in"))
+        self.target.set_output_data(graph.START_TICK, {"in": "data"})
+        self.assertEqual({TICK2}, self.target.collect_refine_tasks())
+        self.assertEqual({TICK1}, self.target.collect_ready_tasks())
+        
+    def test_consume_twice(self):
+        self.target.add_task(TICK1, "task1")
+        self.target.consume_inputs(TICK1)
+        self.assertRaises(ValueError, self.target.consume_inputs, TICK1)
+        
 class MockTask(object):
     def __init__(self, *refiner_ports):
         self.refiner_ports = set(refiner_ports)
\ No newline at end of file
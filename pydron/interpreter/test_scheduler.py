@@ -0,0 +1,150 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import unittest
+
+from pydron.dataflow import graph
+from pydron.dataflow.graph import G, T, C, FINAL_TICK, START_TICK
+from pydron.interpreter import scheduler
+
+TICK1 = START_TICK + 1
+TICK2 = START_TICK + 2
+TICK3 = START_TICK + 3
+TICK4 = START_TICK + 4
+
+def eval_time(g, tick):
+    return g.get_task_properties(tick).get("eval_time", 1)
+
+class TestCriticalPathPriorities(unittest.TestCase):
+
+    def test_single(self):
+        g = G(
+            T(1, "task"),
+            C(1, "out", FINAL_TICK, "retval")
+        )
+        actual = scheduler.critical_path_priorities(g, [TICK1], eval_time)
+        self.assertEqual({TICK1: 1}, actual)
+
+    def test_chain(self):
+        g = G(
+            T(1, "task"),
+            C(1, "out", 2, "in"),
+            T(2, "task"),
+            C(2, "out", 3, "in"),
+            T(3, "task"),
+            C(3, "out", FINAL_TICK, "retval")
+        )
+        actual = scheduler.critical_path_priorities(g, [TICK1, TICK2], eval_time)
+        self.assertEqual({TICK1: 3, TICK2: 2}, actual)
+
+    def test_longest_path(self):
+        g = G(
+            T(1, "task"),
+            C(1, "out", 2, "in"),
+            C(1, "out", 3, "in"),
+            T(2, "task", {"eval_time": 5}),
+            T(3, "task"),
+            C(3, "out", 4, "in"),
+            T(4, "task"),
+        )
+        actual = scheduler.critical_path_priorities(g, [TICK1], eval_time)
+        self.assertEqual({TICK1: 6}, actual)
+
+    def test_side_branch(self):
+        g = G(
+            T(1, "task"),
+            T(2, "task"),
+            C(2, "out", 3, "in"),
+            T(3, "task"),
+            C(3, "out", FINAL_TICK, "retval")
+        )
+        actual = scheduler.critical_path_priorities(g, [TICK1, TICK2], eval_time)
+        self.assertEqual({TICK1: 1, TICK2: 2}, actual)
+
+class TestCriticalPathLevels(unittest.TestCase):
+
+    def setUp(self):
+        self.g = G(
+            T(1, "task"),
+            C(1, "out", 2, "in"),
+            T(2, "task"),
+            C(2, "out", FINAL_TICK, "retval")
+        )
+        self.target = scheduler.CriticalPathLevels(self.g)
+        self.estimated = []
+
+    def estimate(self, g, tick):
+        self.estimated.append(tick)
+        return eval_time(g, tick)
+
+    def test_priorities(self):
+        actual = self.target.priorities([TICK1], self.estimate)
+        self.assertEqual({TICK1: 2}, actual)
+
+    def test_memoized(self):
+        self.target.priorities([TICK2], self.estimate)
+        self.target.priorities([TICK1], self.estimate)
+        self.assertEqual([TICK2, TICK1], self.estimated)
+
+    def test_connected_downstream(self):
+        self.target.priorities([TICK1], self.estimate)
+        self.g.add_task(TICK3, "task")
+        self.g.connect(graph.Endpoint(TICK2, "out"), graph.Endpoint(TICK3, "in"))
+        actual = self.target.priorities([TICK1], self.estimate)
+        self.assertEqual({TICK1: 3}, actual)
+
+    def test_disconnected_downstream(self):
+        self.target.priorities([TICK1], self.estimate)
+        self.g.disconnect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+        actual = self.target.priorities([TICK1], self.estimate)
+        self.assertEqual({TICK1: 1}, actual)
+
+    def test_unrelated_change(self):
+        self.target.priorities([TICK1], self.estimate)
+        self.g.add_task(TICK3, "task")
+        self.g.connect(graph.Endpoint(TICK3, "out"), graph.Endpoint(FINAL_TICK, "other"))
+        self.estimated = []
+        self.target.priorities([TICK1, TICK3], self.estimate)
+        self.assertEqual([TICK3], self.estimated)
+
+    def test_replaced_in_batch(self):
+        self.target.priorities([TICK1], self.estimate)
+        with self.g.batch():
+            self.g.disconnect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK2, "in"))
+            self.g.disconnect(graph.Endpoint(TICK2, "out"), graph.Endpoint(FINAL_TICK, "retval"))
+            self.g.remove_task(TICK2)
+            self.g.add_task(TICK3, "task", {"eval_time": 5})
+            self.g.connect(graph.Endpoint(TICK1, "out"), graph.Endpoint(TICK3, "in"))
+        actual = self.target.priorities([TICK1], self.estimate)
+        self.assertEqual({TICK1: 6}, actual)
+
+
+def helper():
+    pass
+
+class TestGlobalRefinerCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.original = helper
+        self.target = scheduler.Scheduler(None, None)
+        self.key = (__name__, "helper", bool)
+        self.target._global_refiner_cache[self.key] = (helper, True)
+        
+    def tearDown(self):
+        global helper
+        helper = self.original
+        
+    def test_hit(self):
+        self.assertTrue(self.target._cached_global_reduction(self.key))
+        
+    def test_missing(self):
+        self.assertFalse(self.target._cached_global_reduction((__name__, "other", bool)))
+    
+    def test_rebound(self):
+        global helper
+        helper = lambda: None
+        self.assertFalse(self.target._cached_global_reduction(self.key))
+        
+    def test_unbound(self):
+        global helper
+        del helper
+        self.assertFalse(self.target._cached_global_reduction(self.key))
@@ -5,7 +5,7 @@ import unittest
 from pydron.dataflow import tasks
 from pydron.dataflow.graph import G, T, C, FINAL_TICK, START_TICK, Endpoint, Tick
 from pydron.interpreter import traverser
-from twisted.internet import defer
+from twisted.internet import defer, task
 from twisted.python import failure
 import twistit
 
@@ -31,6 +31,8 @@ class TestTraverser(unittest.TestCase):
             self.ready.append((g, tick, task, inputs, d))
             return d
         
+        self.refine_task_callback = refine_task_callback
+        self.ready_task_callback = ready_task_callback
         self.target = traverser.Traverser(refine_task_callback, ready_task_callback)
         
     def next_refine(self):
@@ -132,6 +134,95 @@ class TestTraverser(unittest.TestCase):
         self.assertEqual({"retval":"Hello"}, outputs)
         
         
+    def chain_graph(self):
+        return G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", 2, "in"),
+            C(1, "value", 3, "in"),
+            T(2, "task"),
+            C(2, "out", 3, "in2"),
+            T(3, "task"),
+            C(3, "out", FINAL_TICK, "retval")
+        )
+        
+    def test_prune(self):
+        self.target.execute(self.chain_graph(), {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"World"}))
+        self.assertEqual([TICK1, TICK2, START_TICK + 3], self.target.get_graph().get_all_ticks())
+        
+        self.assertEqual((START_TICK + 3, "task", {"in":"Hello", "in2":"World"}), self.next_ready()[1:-1])
+        
+    def test_prune_after_consumers(self):
+        d = self.target.execute(self.chain_graph(), {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"World"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"!"}))
+        
+        self.assertEqual({"retval":"!"}, extract(d))
+        self.assertEqual([START_TICK + 3], self.target.get_graph().get_all_ticks())
+        self.assertEqual(2, self.target.get_pruned_count())
+        
+    def test_free_consumed(self):
+        freed = []
+        self.target = traverser.Traverser(self.refine_task_callback, self.ready_task_callback, 
+                                          free_data_callback=freed.extend)
+        d = self.target.execute(self.chain_graph(), {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"World"}))
+        self.assertEqual([], freed)
+        
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"!"}))
+        self.assertEqual({"retval":"!"}, extract(d))
+        self.assertItemsEqual(["Hello", "World"], freed)
+        
+    def test_prune_disabled(self):
+        self.target = traverser.Traverser(self.refine_task_callback, self.ready_task_callback, prune=False)
+        d = self.target.execute(self.chain_graph(), {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"World"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"out":"!"}))
+        
+        self.assertEqual({"retval":"!"}, extract(d))
+        self.assertEqual([TICK1, TICK2, START_TICK + 3], self.target.get_graph().get_all_ticks())
+        self.assertEqual(0, self.target.get_pruned_count())
+        
+    def test_coalesce(self):
+        clock = task.Clock()
+        self.target = traverser.Traverser(self.refine_task_callback, self.ready_task_callback, 
+                                          coalesce=True, clock=clock)
+        self.target.execute(self.chain_graph(), {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.assertIsNone(self.next_ready())
+        
+        clock.advance(0)
+        self.assertEqual((TICK2, "task", {"in":"Hello"}), self.next_ready()[1:-1])
+        
+    def test_coalesce_once_per_turn(self):
+        clock = task.Clock()
+        self.target = traverser.Traverser(self.refine_task_callback, self.ready_task_callback, 
+                                          coalesce=True, clock=clock)
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            T(2, tasks.ConstTask(None)),
+            C(1, "value", 3, "in1"),
+            C(2, "value", 3, "in2"),
+            T(3, "task"),
+            C(3, "out", FINAL_TICK, "retval")
+        )
+        d = self.target.execute(g, {})
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.next_ready()[-1].callback(traverser.EvalResult({"value":"World"}))
+        self.assertEqual(1, len(clock.getDelayedCalls()))
+        
+        clock.advance(0)
+        _, tick, _, inputs, task_d = self.next_ready()
+        self.assertEqual((START_TICK + 3, {"in1":"Hello", "in2":"World"}), (tick, inputs))
+        
+        task_d.callback(traverser.EvalResult({"out":"!"}))
+        clock.advance(0)
+        self.assertEqual({"retval":"!"}, extract(d))
+        
     def test_finish_nomoretasks(self):
         g = G(
             T(1, tasks.ConstTask(None)),
@@ -157,6 +248,35 @@ class TestTraverser(unittest.TestCase):
         self.assertTrue(f.value.cause.check(MockError))
         self.assertEqual(Tick.parse_tick(1), f.value.tick)
     
+    def test_finish_waits_for_unused(self):
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", FINAL_TICK, "retval"),
+            T(2, "task")
+        )
+        d = self.target.execute(g, {})
+        first, second = sorted([self.next_ready(), self.next_ready()], key=lambda r:r[1])
+        first[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        self.assertFalse(d.called)
+        
+        second[-1].callback(traverser.EvalResult({}))
+        self.assertEqual({"retval":"Hello"}, extract(d))
+        
+    def test_unused_fail(self):
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", FINAL_TICK, "retval"),
+            T(2, "task")
+        )
+        d = self.target.execute(g, {})
+        first, second = sorted([self.next_ready(), self.next_ready()], key=lambda r:r[1])
+        first[-1].callback(traverser.EvalResult({"value":"Hello"}))
+        second[-1].errback(failure.Failure(MockError()))
+        
+        f = twistit.extract_failure(d)
+        self.assertTrue(f.check(traverser.EvaluationError))
+        self.assertTrue(f.value.cause.check(MockError))
+    
     def test_refine_called(self):
         task = MockTask("in")
         g = G(
@@ -236,6 +356,140 @@ class TestTraverser(unittest.TestCase):
         self.assertEqual(None, self.next_refine())
         
         
+    def test_seed(self):
+        def seed_task_callback(g, tick, task):
+            return {"value": "Hello"}
+        self.target = traverser.Traverser(None, None, seed_task_callback)
+        
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        d = self.target.execute(g, {})
+        
+        self.assertEqual({"retval":"Hello"}, extract(d))
+        self.assertEqual(traverser.TaskState.EVALUATED, self.target.get_task_state(TICK1))
+        
+    def test_seed_makes_task_ready(self):
+        def seed_task_callback(g, tick, task):
+            return {"value": "Hello"}
+        self.target = traverser.Traverser(None, self.ready_task_callback, seed_task_callback)
+        
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", 2, "in"),
+            T(2, "task"),
+            C(2, "out", FINAL_TICK, "retval")
+        )
+        self.target.execute(g, {})
+        self.assertEqual((TICK2, "task", {"in":"Hello"}), self.next_ready()[1:-1])
+        
+    def test_seed_declined(self):
+        def seed_task_callback(g, tick, task):
+            return None
+        self.target = traverser.Traverser(None, self.ready_task_callback, seed_task_callback)
+        
+        g = G(
+            T(1, tasks.ConstTask(None)),
+            C(1, "value", FINAL_TICK, "retval")
+        )
+        self.target.execute(g, {})
+        self.assertEqual((TICK1, tasks.ConstTask(None), {}), self.next_ready()[1:-1])
+        
+    def speculative_graph(self):
+        # if t: x = a() else: x = b()
+        return G(
+            T((1,1,1), "a"),
+            C((1,1,1), "out", (1,3), "body:x"),
+            T((1,2,1), "b"),
+            C((1,2,1), "out", (1,3), "orelse:x"),
+            C(START_TICK, "t", (1,3), "$test"),
+            T((1,3), tasks.BranchSelectTask({"x"})),
+            C((1,3), "x", FINAL_TICK, "retval")
+        )
+    
+    def decide(self, test):
+        refine_g, tick, task, _, refine_d = self.next_refine()
+        task.refine(refine_g, tick, {"$test": test})
+        refine_d.callback(None)
+        
+    def test_speculative_both_ready(self):
+        self.target.execute(self.speculative_graph(), {"t": "test"})
+        ready = {r[1] for r in self.ready}
+        self.assertEqual({Tick.parse_tick((1,1,1)), Tick.parse_tick((1,2,1))}, ready)
+        
+    def test_speculative_cancel(self):
+        d = self.target.execute(self.speculative_graph(), {"t": "test"})
+        _, _, _, _, a_d = self.next_ready()
+        _, _, _, _, b_d = self.next_ready()
+        
+        self.decide(True)
+        self.assertTrue(b_d.called) # cancelled
+        
+        a_d.callback(traverser.EvalResult({"out":"Hello"}))
+        self.assertEqual({"retval":"Hello"}, extract(d))
+        self.assertEqual({"evaluated":0, "cancelled":1, "eval_time":0.0}, 
+                         self.target.get_speculation_waste())
+        
+    def test_speculative_free(self):
+        freed = []
+        self.target = traverser.Traverser(self.refine_task_callback, 
+                                          self.ready_task_callback, 
+                                          free_data_callback=freed.extend)
+        d = self.target.execute(self.speculative_graph(), {"t": "test"})
+        _, _, _, _, a_d = self.next_ready()
+        _, _, _, _, b_d = self.next_ready()
+        b_d.callback(traverser.EvalResult({"out":"World"}, duration=2.0))
+        
+        self.decide(True)
+        self.assertEqual(["World"], freed)
+        
+        a_d.callback(traverser.EvalResult({"out":"Hello"}))
+        self.assertEqual({"retval":"Hello"}, extract(d))
+        self.assertEqual({"evaluated":1, "cancelled":0, "eval_time":2.0}, 
+                         self.target.get_speculation_waste())
+        
+    def test_speculative_fail_discarded(self):
+        d = self.target.execute(self.speculative_graph(), {"t": "test"})
+        _, _, _, _, a_d = self.next_ready()
+        _, _, _, _, b_d = self.next_ready()
+        b_d.callback(traverser.EvalResult(failure.Failure(MockError())))
+        self.assertFalse(d.called)
+        
+        self.decide(True)
+        a_d.callback(traverser.EvalResult({"out":"Hello"}))
+        self.assertEqual({"retval":"Hello"}, extract(d))
+        
+    def run_synchronous(self, test):
+        def refine_task_callback(g, tick, task, inputs):
+            task.refine(g, tick, inputs)
+            return defer.succeed(None)
+        
+        def ready_task_callback(g, tick, task, inputs):
+            return defer.succeed(traverser.EvalResult({"out":task}))
+        
+        self.target = traverser.Traverser(refine_task_callback, ready_task_callback)
+        return extract(self.target.execute(self.speculative_graph(), {"t": test}))
+        
+    def test_speculative_synchronous_taken(self):
+        self.assertEqual({"retval":"a"}, self.run_synchronous(True))
+        
+    def test_speculative_synchronous_not_taken(self):
+        self.assertEqual({"retval":"b"}, self.run_synchronous(False))
+        
+    def test_speculative_fail_taken(self):
+        d = self.target.execute(self.speculative_graph(), {"t": "test"})
+        _, _, _, _, a_d = self.next_ready()
+        a_d.callback(traverser.EvalResult(failure.Failure(MockError())))
+        self.assertFalse(d.called)
+        
+        self.decide(True)
+        f = twistit.extract_failure(d)
+        self.assertTrue(f.check(traverser.EvaluationError))
+        self.assertTrue(f.value.cause.check(MockError))
+        self.assertEqual(Tick.parse_tick((1,1,1)), f.value.tick)
+        
+        
 class MockError(Exception):
     pass
         
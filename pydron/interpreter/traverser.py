@@ -1,9 +1,9 @@
 # Copyright (C) 2015 Stefan C. Mueller
 
-from pydron.dataflow import graph
-from pydron.interpreter import graphdecorator
+from pydron.dataflow import graph, tasks
+from pydron.interpreter import executiongraph
 
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 from twisted.internet.defer import CancelledError
 from twisted.python import failure
 
@@ -53,7 +53,7 @@ class EvalResult(object):
     """
     Result of a task evaulation.
     """
-    def __init__(self, result, duration=None, datasizes=None, transfer_results=None):
+    def __init__(self, result, duration=None, datasizes=None, transfer_results=None, reduced=None):
         """
         :param result: Either a :class:`failure.Failure` or a `dict` with out-port name
          to value map, where value is typically a :class:`worker.ValueId`.
@@ -65,14 +65,18 @@ class EvalResult(object):
         
         :param transfer_results: `dict` with port to :class:`worker.TransmissionResult` mapping for
             inputs that had to be transferred first.
+            
+        :param reduced: `dict` with `(port, reducer)` to reduced value mapping for
+            outputs that are inputs to refiner ports with a `refiner_reducer`.
         """
         self.result = result
         self.duration = duration
         self.datasizes = datasizes
         self.transfer_results = transfer_results
+        self.reduced = reduced
         
     def __repr__(self):
-        return "EvalResult(%r, %r, %r, %r)" % (self.result, self.duration, self.datasizes, self.transfer_results)
+        return "EvalResult(%r, %r, %r, %r, %r)" % (self.result, self.duration, self.datasizes, self.transfer_results, self.reduced)
     
 
 class EvaluationError(Exception):
@@ -108,18 +112,19 @@ class Traverser(object):
     Traverses the graph, performs graph refinement and invokes a callback
     to ask the scheduler to execute tasks.
         
-    The actual record-keeping is all done in :mod:`graphdecorator`. This is
+    The actual record-keeping is all done in :mod:`executiongraph`. This is
     mostly glue code to give a nicer API for the scheduler and 
     `ScheduledCallable` based on deferreds.
     """
     
-    def __init__(self, refine_task_callback, ready_task_callback):
+    def __init__(self, refine_task_callback, ready_task_callback, seed_task_callback=None, 
+                 free_data_callback=None, prune=True, coalesce=False, clock=None):
         """
         :param ready_task_callback: function which is invoked when a task
             becomes ready for execution.
             
             It is invoked with four arguments:
-             * `graph` The graph we are traversing with all the decorators around it.
+             * `graph` The :class:`executiongraph.ExecutionGraph` we are traversing.
              * `tick` Tick of the task.
              * `task` Task object, equal to `graph.get_task(tick)`
              * `inputs` `dict` that maps input ports to values (or rather value references).
@@ -134,11 +139,43 @@ class Traverser(object):
             the return value is ignored.
             
             The returned deferred might get cancelled if the result isn't required.
+            
+        :param seed_task_callback: Optional function which is invoked for tasks
+            without inputs before they are passed to `ready_task_callback`.
+            It is invoked with `graph`, `tick`, and `task`. If it returns
+            a `dict` that maps the output ports to value references, then these
+            are used as the outputs of the task without evaluating it. If it
+            returns `None` the task is evaluated as usual.
+            
+            This allows the scheduler to provide constants without running a job for them.
+            
+        :param free_data_callback: Optional function which is invoked with a list of
+            value references that are no longer needed. Either all tasks that consume
+            them have been evaluated, or the tasks that produced them were discarded,
+            for example because they belong to a speculatively evaluated branch that 
+            was not taken. The inputs and outputs of the graph are never passed.
+            
+        :param prune: If `True` then evaluated tasks are removed from the graph
+            once all tasks that consume their outputs have been evaluated too. This keeps
+            the graph small for long running loops. Set to `False` to keep the fully refined
+            graph for debugging, see :meth:`get_graph` and :attr:`EvaluationError.graph`.
+            
+        :param coalesce: If `True` then finished refinements and evaluations only update
+            the graph. The tasks that became ready are passed to the callbacks once per
+            reactor turn, instead of once per finished operation. This reduces the overhead
+            if many jobs complete at the same time.
+            
+        :param clock: Provider of `callLater` used with `coalesce`. Defaults to the reactor.
         """
 
                 
         self._refine_task_callback = refine_task_callback
         self._ready_task_callback = ready_task_callback
+        self._seed_task_callback = seed_task_callback
+        self._free_data_callback = free_data_callback
+        self._prune = prune
+        self._coalesce = coalesce
+        self._clock = clock if clock is not None else reactor
         self._result = defer.Deferred(self._cancel)
         
         #: maps tick to the deferred that we passed to `ready_task_callback`.
@@ -157,20 +194,59 @@ class Traverser(object):
         #: be passed on to the user.
         self._caught_failure = None
         
+        #: Maps tick to the failure of tasks in speculative branches.
+        #: They only stop the execution once we know that the branch
+        #: is taken.
+        self._speculative_failures = {}
+        
+        #: Work done for tasks that were discarded, see :meth:`get_speculation_waste`.
+        self._waste = {"evaluated": 0, "cancelled": 0, "eval_time": 0.0}
+        
+        #: Number of tasks removed by :meth:`_prune_around`.
+        self._pruned_count = 0
+        
+        #: Delayed call of :meth:`_iterate` if `coalesce` is enabled.
+        self._iterate_call = None
+        
         self._graph = None
         self._started = False
         self._finished = False
         
+        #: Set once the graph outputs are available. We still wait
+        #: for the remaining tasks, since they might raise an exception.
+        self._outputs_ready = False
+        
         
     def get_graph(self):
         """
         Returns the graph which is refined as traversal is progressing.
         
         Once :meth:`execute` has finished, this function can be used
-        to get the fully refined graph.
+        to get the fully refined graph. Unless pruning was disabled,
+        the tasks which were no longer needed are missing, see 
+        :meth:`get_pruned_count`.
         """
         return self._graph
     
+    def get_pruned_count(self):
+        """
+        Returns the number of evaluated tasks that were removed from the
+        graph since their outputs were no longer needed.
+        """
+        return self._pruned_count
+    
+    def get_speculation_waste(self):
+        """
+        Returns how much work was done for tasks that were discarded
+        because they belonged to a speculatively evaluated branch that
+        was not taken.
+        
+        :returns: `dict` with the number of discarded tasks which were
+          already `evaluated`, the number of running evaluations that were 
+          `cancelled`, and the `eval_time` in seconds of the evaluated ones.
+        """
+        return dict(self._waste)
+    
     def get_task_state(self, tick):
         """
         Returns the :class:`TaskState` describing the current state of the given
@@ -216,17 +292,15 @@ class Traverser(object):
             raise ValueError("Traverser can only be started once.")
         self._started = True
         
-        self._graph = graph.Graph()
-        self._graph = graphdecorator.DataGraphDecorator(self._graph)
-        self._graph = graphdecorator.RefineDecorator(self._graph)
-        self._graph = graphdecorator.ReadyDecorator(self._graph)
+        self._graph = executiongraph.ExecutionGraph()
         
         # copy the graph into g
-        for tick in g.get_all_ticks():
-            self._graph.add_task(tick, g.get_task(tick), g.get_task_properties(tick))
-        for tick in g.get_all_ticks() + [graph.FINAL_TICK]:
-            for source, dest in g.get_in_connections(tick):
-                self._graph.connect(source, dest)
+        with self._graph.batch():
+            for tick in g.get_all_ticks():
+                self._graph.add_task(tick, g.get_task(tick), g.get_task_properties(tick))
+            for tick in g.get_all_ticks() + [graph.FINAL_TICK]:
+                for source, dest in g.get_in_connections(tick):
+                    self._graph.connect(source, dest)
 
         # ingest graph inputs
         self._graph.set_output_data(graph.START_TICK, inputs)
@@ -235,8 +309,28 @@ class Traverser(object):
         
         return self._result
 
+    def _iterate_later(self):
+        """
+        Invoked when an operation has finished. Iterates right away, unless `coalesce`
+        is enabled. Then the iteration is done once in the next reactor turn, together
+        with those of all other operations that finish in the mean time.
+        """
+        if not self._coalesce:
+            self._iterate()
+        elif self._iterate_call is None:
+            self._iterate_call = self._clock.callLater(0, self._iterate_delayed)
+            
+    def _iterate_delayed(self):
+        self._iterate_call = None
+        self._iterate()
+
     def _iterate(self):
         
+        if self._iterate_call is not None:
+            # We iterate right now, no need to do it later again.
+            self._iterate_call.cancel()
+            self._iterate_call = None
+        
         if self._finished:
             return
         
@@ -251,15 +345,25 @@ class Traverser(object):
         ready_for_refine = self._graph.collect_refine_tasks()
         
         # If the final tick is ready for execution, we have the graph
-        # outputs and can finish traversing.
+        # outputs and can finish traversing once the tasks whose
+        # results are not used have run too.
         if graph.FINAL_TICK in ready_for_execution:
+            ready_for_execution.discard(graph.FINAL_TICK)
+            self._outputs_ready = True
+        if self._outputs_ready and self._graph.past_all_tasks():
             self._finished = True
+            if self._waste["evaluated"] or self._waste["cancelled"]:
+                logger.info("Speculation wasted %(evaluated)s evaluated tasks (%(eval_time).3fs) and cancelled %(cancelled)s." % self._waste)
             graph_outputs = {dest.port : self._graph.get_data(source) for source, dest in self._graph.get_in_connections(graph.FINAL_TICK)}
             self._result.callback(graph_outputs)
             return
         
         # Pass the refine jobs to the scheduler.
         for tick in ready_for_refine:
+            if self._finished:
+                return
+            if not self._has_task(tick):
+                continue # removed by a refinement that completed synchronously
             task = self._graph.get_task(tick)
             inputs = {dest.port : self._graph.get_data(source) for source, dest in self._graph.get_in_connections(tick) if dest.port in task.refiner_ports}
             
@@ -273,6 +377,8 @@ class Traverser(object):
             self._pending_refine_deferreds[tick] = d
             
             def on_success(value, tick, token):
+                if tick not in self._pending_refine_deferreds:
+                    return # task was discarded
                 del self._pending_refine_deferreds[tick] 
                 
                 # Mark the task as refined. Using the token to see if the task is still
@@ -284,9 +390,12 @@ class Traverser(object):
                 if token_found:
                     self._graph.set_task_property(tick, "refined", True)
                 
-                self._iterate()
+                self._discard_removed_tasks()
+                self._iterate_later()
         
             def on_fail(fail, tick):
+                if tick not in self._pending_refine_deferreds:
+                    return None # task was discarded
                 del self._pending_refine_deferreds[tick]
                 try:
                     raise RefineError(self.get_graph(), tick, fail)
@@ -301,16 +410,33 @@ class Traverser(object):
                 
             d.addErrback(unhandled)
         
+        # Set if tasks got their outputs without evaluation.
+        seeded = False
+        
         # Pass the evaluation jobs to the scheduler.
         for tick in ready_for_execution:
+            if self._finished:
+                return
+            if not self._has_task(tick):
+                continue # removed by a refinement that completed synchronously
             task = self._graph.get_task(tick)
             inputs = {dest.port : self._graph.get_data(source) for source, dest in self._graph.get_in_connections(tick)}
             
+            if not inputs and self._seed_task_callback is not None:
+                outputs = self._seed_task_callback(self._graph, tick, task)
+                if outputs is not None:
+                    self._graph.set_output_data(tick, outputs)
+                    self._prune_around(tick)
+                    seeded = True
+                    continue
+            
             self._pending_ready_deferreds[tick] = None
             d = self._ready_task_callback(self._graph, tick, task, inputs)
             self._pending_ready_deferreds[tick] = d
         
             def on_success(evalresult, tick):
+                if tick not in self._pending_ready_deferreds:
+                    return # task was discarded
                 del self._pending_ready_deferreds[tick]
                 
                 if evalresult.duration is not None:
@@ -322,12 +448,19 @@ class Traverser(object):
                     if evalresult.datasizes is not None:
                         self._graph.set_task_property(tick, "datasizes", evalresult.datasizes)
                     
+                    self._graph.consume_inputs(tick)
                     self._graph.set_output_data(tick, outputs)
-                    
+                    self._free_unreferenced_data()
+                    self._prune_around(tick)
                         
                 elif isinstance(evalresult.result, failure.Failure):
                     logger.debug("Evaluation of %r has caused exception: " % tick + evalresult.result.getTraceback())
                     
+                    if tasks.in_undecided_branch(self._graph, tick):
+                        self._speculative_failures[tick] = evalresult.result
+                        self._iterate_later()
+                        return
+                    
                     try:
                         raise EvaluationError(self.get_graph(), tick, evalresult.result)
                     except:
@@ -338,9 +471,11 @@ class Traverser(object):
                 else:
                     raise ValueError("Unexpected result for tick %r:%r" % (tick, evalresult.result))
                 
-                self._iterate()
+                self._iterate_later()
             
             def on_fail(fail, tick):
+                if tick not in self._pending_ready_deferreds:
+                    return None # task was discarded
                 del self._pending_ready_deferreds[tick]
             
                 try:
@@ -356,7 +491,105 @@ class Traverser(object):
                 logger.error(failure.getTraceback())
                 
             d.addErrback(unhandled)
+            
+        if seeded:
+            # Seeded outputs may have made more tasks ready.
+            self._iterate()
+
+
+    def _prune_around(self, tick):
+        """
+        Removes the tasks that are no longer needed now that the task at `tick`
+        has been evaluated. These are the task itself and the tasks connected to
+        its inputs if all tasks which consume their outputs have been evaluated.
+        
+        Tasks connected to the outputs of the graph are kept. So are the tasks 
+        of speculatively evaluated branches, they are removed by the refinement
+        if the branch is not taken.
+        """
+        if not self._prune:
+            return
+        
+        candidates = {source.tick for source, _ in self._graph.get_in_connections(tick)}
+        candidates.add(tick)
+        candidates.discard(graph.START_TICK)
+        
+        prunable = []
+        for candidate in candidates:
+            if not self._graph.was_executed(candidate):
+                continue
+            consumers = {dest.tick for _, dest in self._graph.get_out_connections(candidate)}
+            if not all(self._graph.was_executed(consumer) for consumer in consumers):
+                continue
+            if tasks.in_undecided_branch(self._graph, candidate):
+                continue
+            prunable.append(candidate)
+        
+        if not prunable:
+            return
+        with self._graph.batch():
+            for candidate in prunable:
+                for source, dest in self._graph.get_in_connections(candidate):
+                    self._graph.disconnect(source, dest)
+                for source, dest in self._graph.get_out_connections(candidate):
+                    self._graph.disconnect(source, dest)
+                self._graph.prune_task(candidate)
+        self._pruned_count += len(prunable)
 
+    def _discard_removed_tasks(self):
+        """
+        Refinements may remove tasks which have already been passed to the scheduler,
+        such as those of a speculative branch that was not taken. We cancel the
+        pending operations for them and free their outputs.
+        """
+        exists = self._has_task
+        
+        for tick in [t for t in self._pending_refine_deferreds if not exists(t)]:
+            d = self._pending_refine_deferreds.pop(tick)
+            if d is not None:
+                d.cancel()
+                
+        for tick in [t for t in self._pending_ready_deferreds if not exists(t)]:
+            d = self._pending_ready_deferreds.pop(tick)
+            self._waste["cancelled"] += 1
+            if d is not None:
+                d.cancel()
+                
+        for tick in self._speculative_failures.keys():
+            if not exists(tick):
+                del self._speculative_failures[tick]
+                self._waste["evaluated"] += 1
+            elif not tasks.in_undecided_branch(self._graph, tick):
+                # The branch was taken, the failure is real.
+                fail = self._speculative_failures.pop(tick)
+                try:
+                    raise EvaluationError(self.get_graph(), tick, fail)
+                except:
+                    self._caught_failure = failure.Failure()
+        
+        valuerefs = self._graph.collect_unreferenced_data()
+        for tick, props in self._graph.collect_discarded_tasks():
+            self._waste["evaluated"] += 1
+            self._waste["eval_time"] += props.get("eval_time", 0)
+            valuerefs.extend(props["out_data"].itervalues())
+        if valuerefs and self._free_data_callback is not None:
+            self._free_data_callback(valuerefs)
+            
+    def _has_task(self, tick):
+        try:
+            self._graph.get_task(tick)
+            return True
+        except KeyError:
+            return False
+            
+    def _free_unreferenced_data(self):
+        """
+        Frees the values which are no longer needed since all tasks
+        that consume them have been evaluated.
+        """
+        valuerefs = self._graph.collect_unreferenced_data()
+        if valuerefs and self._free_data_callback is not None:
+            self._free_data_callback(valuerefs)
 
     def _cancel(self, d):
         """
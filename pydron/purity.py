@@ -0,0 +1,311 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Decides if a callable is functional, that is, if calling it has no
+side-effects. Calls to functional callables don't have to be syncpoints.
+
+A callable is functional if
+
+* it has an attribute `functional` that is `True` (see :func:`decorators.functional`),
+* it is in :data:`whitelist.functional_whitelist`, or
+* it is a plain Python function that :func:`infer_purity` considers pure.
+
+Callables in :data:`whitelist.out_argument_whitelist`, such as NumPy ufuncs,
+are functional only if the call does not pass an output argument,
+see :func:`functionality`.
+"""
+
+import __builtin__
+import ast
+import inspect
+import logging
+import textwrap
+import types
+
+from pydron import whitelist
+
+logger = logging.getLogger(__name__)
+
+#: Maps code objects to the calls found by :class:`_PurityChecker`,
+#: or `None` if the code is impure no matter what it calls.
+_analysed = {}
+
+#: Code objects for which :func:`infer_purity` is currently running.
+_in_progress = set()
+
+
+def is_functional(func):
+    """
+    Returns `True` if calls to `func` have no side-effects.
+    """
+    functional = getattr(func, "functional", None)
+    if functional is not None:
+        return bool(functional)
+    try:
+        if func in whitelist.functional_whitelist:
+            return True
+    except TypeError:
+        return False # not hashable
+    if isinstance(func, types.FunctionType):
+        return infer_purity(func)
+    return False
+
+
+def functionality(func):
+    """
+    Like :func:`is_functional`, but returns an :class:`OutArguments` for
+    callables in :data:`whitelist.out_argument_whitelist`. Whether calls
+    to those are functional depends on the arguments passed.
+    """
+    try:
+        if func in whitelist.out_argument_whitelist:
+            return OutArguments(func.nin)
+    except TypeError:
+        return False # not hashable
+    return is_functional(func)
+
+
+class OutArguments(object):
+    """
+    Returned by :func:`functionality` for callables that are functional
+    unless they are given an output argument, such as NumPy ufuncs which
+    write into the array passed as `out`.
+    """
+
+    def __init__(self, nin):
+        #: Number of positional inputs. Any further positional
+        #: arguments are outputs.
+        self.nin = nin
+
+    def allows(self, numargs, keywords, has_starargs, has_kwargs):
+        """
+        Returns `True` if a call with the given arguments is functional.
+        Calls with `*args` or `**kwargs` might pass an output, so they are not.
+
+        :param numargs: Number of positional arguments.
+        :param keywords: Names of the keyword arguments.
+        """
+        if has_starargs or has_kwargs:
+            return False
+        return numargs <= self.nin and "out" not in keywords
+
+    def __repr__(self):
+        return "OutArguments(%s)" % self.nin
+
+
+def infer_purity(function):
+    """
+    Analyses the source code of a Python function and returns `True`
+    if the function has no side-effects. The analysis is conservative,
+    the function is considered pure if it
+
+    * has no `global` statement,
+    * does not assign to attributes or items, except directly on variables
+      that are only ever bound to a list, dict or set expression,
+    * only uses augmented assignment on such variables, or on variables
+      that are only ever bound to a number or string literal,
+    * only calls functions that are functional (see :func:`functionality`)
+      or methods of such container variables. Callees must be global names,
+      or attributes of them, such as `math.sqrt`.
+    * does not use `exec`, `yield`, `import`, `with`, nested
+      functions or classes.
+
+    The analysis of the source code is cached per code object. The
+    callees are looked up each time, since the globals might have
+    been rebound in the meantime.
+    """
+    code = function.__code__
+    if code not in _analysed:
+        try:
+            _analysed[code] = _PurityChecker(function).check()
+        except Exception as e:
+            logger.debug("Cannot infer purity of %r: %s" % (function, e))
+            _analysed[code] = None
+    calls = _analysed[code]
+    if calls is None:
+        return False
+    if code in _in_progress:
+        # recursion. We're pure if the rest of the function is.
+        return True
+
+    _in_progress.add(code)
+    try:
+        for names, numargs, keywords, has_starargs, has_kwargs in calls:
+            callee = _resolve(function, names)
+            functional = functionality(callee) if callee is not None else False
+            if isinstance(functional, OutArguments):
+                functional = functional.allows(numargs, keywords, has_starargs, has_kwargs)
+            if not functional:
+                return False
+        return True
+    finally:
+        _in_progress.remove(code)
+
+
+def clear_cache():
+    """
+    Forgets the analysis done by :func:`infer_purity`.
+    """
+    _analysed.clear()
+
+
+def _resolve(function, names):
+    """
+    Returns the object that the global name or attribute chain refers to,
+    or `None`.
+
+    :param names: The global name followed by the attribute names.
+    """
+    name = names[0]
+    if name in function.__globals__:
+        obj = function.__globals__[name]
+    else:
+        obj = getattr(__builtin__, name, None)
+    for attr in names[1:]:
+        if obj is None or not isinstance(obj, types.ModuleType):
+            # Only module attributes. Anything else could be
+            # a property with side-effects.
+            return None
+        obj = getattr(obj, attr, None)
+    return obj
+
+
+class _PurityChecker(ast.NodeVisitor):
+    """
+    Checks the parts of a function that don't depend on its globals.
+    """
+
+    #: Statements and expressions that make a function impure.
+    forbidden = (ast.Global, ast.Exec, ast.Yield, ast.Import, ast.ImportFrom,
+                 ast.With, ast.FunctionDef, ast.ClassDef, ast.Lambda)
+
+    #: Expressions that create a new container.
+    fresh_values = (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.SetComp, ast.DictComp)
+
+    #: Expressions that evaluate to a new container or an immutable literal.
+    own_values = fresh_values + (ast.Num, ast.Str)
+
+    def __init__(self, function):
+        self.function = function
+        self.pure = True
+
+        #: Calls of global callees as `(names, numargs, keywords, has_starargs, has_kwargs)`
+        #: where `names` is the global name followed by the attribute names.
+        self.calls = []
+
+    def check(self):
+        """
+        Returns the calls the function makes, or `None` if the function is impure.
+        """
+        source = textwrap.dedent(inspect.getsource(self.function))
+        module = ast.parse(source)
+        funcdef = module.body[0]
+        if not isinstance(funcdef, ast.FunctionDef) or funcdef.name != self.function.__name__:
+            return None
+
+        self.parameters = {n.id for n in funcdef.args.args if isinstance(n, ast.Name)}
+        self.parameters |= {name for name in (funcdef.args.vararg, funcdef.args.kwarg) if name}
+        self.local_vars = set(self.parameters)
+        self._find_locals(funcdef.body)
+
+        for stmt in funcdef.body:
+            self.visit(stmt)
+            if not self.pure:
+                return None
+        return self.calls
+
+    def _find_locals(self, body):
+        # maps variable names to `True` if all assignments assign a fresh container.
+        fresh = {}
+        # same, for `own_values`.
+        own = {}
+        # Name nodes that are the target of a plain or augmented assignment.
+        assigned = set()
+        for stmt in body:
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Assign):
+                    is_fresh = isinstance(node.value, self.fresh_values)
+                    is_own = isinstance(node.value, self.own_values)
+                    for target in node.targets:
+                        if isinstance(target, ast.Name):
+                            assigned.add(target)
+                            fresh[target.id] = fresh.get(target.id, True) and is_fresh
+                            own[target.id] = own.get(target.id, True) and is_own
+                elif isinstance(node, ast.AugAssign):
+                    # Checked by `visit_AugAssign`. Rebinds to the same
+                    # container, or to a new immutable value.
+                    assigned.add(node.target)
+                elif isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                    self.local_vars.add(node.id)
+                    if node not in assigned:
+                        # loop targets, unpacking, ...
+                        fresh[node.id] = False
+                        own[node.id] = False
+
+        #: Variables only ever bound to a new container.
+        self.fresh_vars = {var for var, is_fresh in fresh.iteritems()
+                           if is_fresh and var not in self.parameters}
+
+        #: Variables that cannot refer to an object passed in
+        #: to the function, or an element of one.
+        self.own_vars = {var for var, is_own in own.iteritems()
+                         if is_own and var not in self.parameters}
+
+    def generic_visit(self, node):
+        if isinstance(node, self.forbidden):
+            self.pure = False
+            return
+        ast.NodeVisitor.generic_visit(self, node)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, (ast.Store, ast.Del)) and not self._is_fresh(node):
+            self.pure = False
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, (ast.Store, ast.Del)) and not self._is_fresh(node):
+            self.pure = False
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        # `+=` and friends may change the object in-place. Attributes
+        # and items are handled by their visitors.
+        if isinstance(node.target, ast.Name) and node.target.id not in self.own_vars:
+            self.pure = False
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and self._is_fresh(func):
+            pass # method of a container we created.
+        else:
+            names = self._global_names(func)
+            if names is None:
+                self.pure = False
+                return
+            keywords = tuple(keyword.arg for keyword in node.keywords)
+            self.calls.append((names, len(node.args), keywords,
+                               node.starargs is not None, node.kwargs is not None))
+        self.generic_visit(node)
+
+    def _is_fresh(self, node):
+        # Only directly on the container. Its elements were not created
+        # by the function.
+        return isinstance(node.value, ast.Name) and node.value.id in self.fresh_vars
+
+    def _global_names(self, node):
+        """
+        Returns the global name followed by the attribute names if
+        the node is a global name or an attribute chain on one, `None` otherwise.
+        """
+        if isinstance(node, ast.Name):
+            if node.id in self.local_vars:
+                return None
+            return (node.id,)
+        elif isinstance(node, ast.Attribute):
+            names = self._global_names(node.value)
+            if names is None:
+                return None
+            return names + (node.attr,)
+        else:
+            return None
@@ -4,6 +4,8 @@ import unittest
 import utwist
 import pydron
 import logging
+from pydron import decorators
+from pydron.interpreter import traverser
 from twisted.internet import threads
 
 logging.basicConfig(level=logging.DEBUG)
@@ -90,6 +92,20 @@ class IntegrationTests(unittest.TestCase):
             return [0,1,2][1]
         self.assertEqual(1, target()) 
         
+    @utwist.with_reactor
+    @run_in_thread
+    def test_subscript_unused_raises(self):
+        @pydron.schedule
+        def target():
+            d = {1:2}
+            d['missing']
+            return 1
+        try:
+            target()
+            self.fail("Expected KeyError")
+        except traverser.EvaluationError as e:
+            self.assertTrue(e.cause.check(KeyError))
+        
     @utwist.with_reactor
     @run_in_thread
     def test_if_true(self):
@@ -179,6 +195,42 @@ class IntegrationTests(unittest.TestCase):
             return out
         self.assertEqual([1,4,9], target()) 
         
+    @utwist.with_reactor
+    @run_in_thread
+    def test_listcomp(self):
+        @pydron.schedule
+        def target():
+            return [mock_square(x) for x in [1,2,3]]
+        self.assertEqual([1,4,9], target()) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_listcomp_not_functional(self):
+        @pydron.schedule
+        def target():
+            return [mock_function(x) for x in [1,2]]
+        self.assertEqual([((1,), {}), ((2,), {})], target()) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_listcomp_empty_undefined(self):
+        @pydron.schedule
+        def target():
+            return [undefined_function(x) for x in []] #@UndefinedVariable
+        self.assertEqual([], target()) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_listcomp_undefined(self):
+        @pydron.schedule
+        def target():
+            return [undefined_function(x) for x in [1]] #@UndefinedVariable
+        try:
+            target()
+            self.fail("Expected NameError")
+        except traverser.EvaluationError as e:
+            self.assertTrue(e.cause.check(NameError))
+        
     @utwist.with_reactor
     @run_in_thread
     def test_attr_assign(self):
@@ -189,8 +241,166 @@ class IntegrationTests(unittest.TestCase):
             return x.abc
         self.assertEqual("Hello", target()) 
         
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_invariant(self):
+        @pydron.schedule
+        def target(obj):
+            total = 0
+            for x in [1,2,3]:
+                total = total + obj.scale * x
+            return total
+        obj = MockClass()
+        obj.scale = 10
+        self.assertEqual(60, target(obj)) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_unrolled(self):
+        @pydron.schedule
+        def target(n):
+            out = []
+            for x in range(n):
+                y = mock_square(x)
+                out.append(y)
+            return out, y
+        self.assertEqual(([x * x for x in range(50)], 49 * 49), target(50)) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_unrolled_no_sequence(self):
+        @pydron.schedule
+        def target():
+            out = []
+            for x in {3:"a"}:
+                out.append(x)
+            return out
+        self.assertEqual([3], target()) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_reduction(self):
+        @pydron.schedule
+        def target(n):
+            total = 0
+            best = 0
+            for x in range(n):
+                y = mock_square(x)
+                total += y
+                best = max(best, y % 7)
+            return total, best
+        self.assertEqual((sum(x * x for x in range(50)), 4), target(50)) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_zero_iterations(self):
+        @pydron.schedule
+        def target(lst, n):
+            total = 0
+            for i in range(n):
+                total = total + lst[0]
+            return total
+        self.assertEqual(0, target([], 0))
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_hoisted(self):
+        @pydron.schedule
+        def target(lst, n):
+            total = 0
+            for i in range(n):
+                total = total + lst[0]
+            return total
+        self.assertEqual(6, target([2], 3))
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_hoisted_raises(self):
+        @pydron.schedule
+        def target(lst, n):
+            total = 0
+            for i in range(n):
+                total = total + lst[0]
+            return total
+        try:
+            target([], 1)
+            self.fail("Expected IndexError")
+        except traverser.RefineError as e:
+            self.assertTrue(e.cause.check(IndexError))
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_reduction_mixed_sequences(self):
+        @pydron.schedule
+        def target(rows):
+            acc = []
+            for r in rows:
+                acc += r
+            return acc
+        self.assertEqual([1, 2, "a", "b"], target([[1], (2,), "ab"]))
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_for_reduction_floats(self):
+        @pydron.schedule
+        def target(values):
+            total = 0
+            for v in values:
+                total += v
+            return total
+        self.assertEqual(1.0, target([1e16, 1.0, -1e16, 1.0]))
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_inline_call(self):
+        @pydron.schedule
+        def target():
+            def inner(a, b=10, *rest, **kwargs):
+                return a + b + len(rest) + len(kwargs)
+            return inner(1) + inner(1, 2, 3, 4) + inner(b=5, a=1, c=2)
+        self.assertEqual(11 + 5 + 7, target()) 
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_speculative_if(self):
+        @pydron.schedule
+        def target(n):
+            if n > 2:
+                y = n * n
+            else:
+                y = 1 // (n - n)
+            return y
+        options = dict(decorators.translation_options)
+        decorators.translation_options["speculate"] = True
+        try:
+            self.assertEqual(9, target(3))
+        finally:
+            decorators.translation_options.update(options)
+        
+    @utwist.with_reactor
+    @run_in_thread
+    def test_global_callee_reassigned(self):
+        @pydron.schedule
+        def target():
+            global mock_callee
+            before = 0
+            for x in range(3):
+                before += mock_callee(x)
+            mock_callee = mock_function
+            return before, mock_callee(2)
+        try:
+            self.assertEqual((5, ((2,), {})), target())
+        finally:
+            globals()["mock_callee"] = mock_square
+        
 def mock_function(*args, **kwargs):
     return args, kwargs
 
+@pydron.functional
+def mock_square(x):
+    return x * x
+
+mock_callee = mock_square
+
 class MockClass(object):
     pass
\ No newline at end of file
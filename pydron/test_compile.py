@@ -0,0 +1,38 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import unittest
+import tempfile
+import shutil
+import os
+import pydron
+from pydron import compile
+from pydron.translation import cache
+
+
+@pydron.schedule
+def scheduled():
+    return 42
+
+def not_scheduled():
+    return 42
+
+
+
+class TestCompile(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_find_scheduled_functions(self):
+        import pydron.test_compile as module
+        functions = compile.find_scheduled_functions(module)
+        self.assertEqual([scheduled.scheduled_function], functions)
+        
+    def test_compile_module(self):
+        disk_cache = cache.DiskCache(self.directory)
+        count = compile.compile_module("pydron.test_compile", disk_cache)
+        self.assertEqual(1, count)
+        self.assertEqual(1, len(os.listdir(self.directory)))
@@ -0,0 +1,271 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import contextlib
+import math
+import operator
+import unittest
+
+from pydron import purity, decorators, whitelist
+
+
+class TestIsFunctional(unittest.TestCase):
+
+    def test_decorated(self):
+        self.assertTrue(purity.is_functional(decorated))
+
+    def test_builtin(self):
+        self.assertTrue(purity.is_functional(len))
+        self.assertTrue(purity.is_functional(abs))
+        self.assertFalse(purity.is_functional(open))
+
+    def test_math(self):
+        self.assertTrue(purity.is_functional(math.sqrt))
+
+    def test_operator(self):
+        self.assertTrue(purity.is_functional(operator.add))
+        self.assertFalse(purity.is_functional(operator.setitem))
+        self.assertFalse(purity.is_functional(operator.iadd))
+
+    def test_unhashable(self):
+        self.assertFalse(purity.is_functional(Unhashable()))
+
+    def test_inferred(self):
+        self.assertTrue(purity.is_functional(pure_arithmetic))
+
+
+class TestInferPurity(unittest.TestCase):
+
+    def setUp(self):
+        purity.clear_cache()
+
+    def test_arithmetic(self):
+        self.assertTrue(purity.infer_purity(pure_arithmetic))
+
+    def test_recursion(self):
+        self.assertTrue(purity.infer_purity(fib))
+
+    def test_fresh_container(self):
+        self.assertTrue(purity.infer_purity(fresh_container))
+
+    def test_pure_callee(self):
+        self.assertTrue(purity.infer_purity(calls_pure))
+
+    def test_global(self):
+        self.assertFalse(purity.infer_purity(writes_global))
+
+    def test_argument_method(self):
+        self.assertFalse(purity.infer_purity(mutates_argument))
+
+    def test_argument_item(self):
+        self.assertFalse(purity.infer_purity(sets_item))
+
+    def test_argument_augassign(self):
+        self.assertFalse(purity.infer_purity(augassign_argument))
+
+    def test_alias_augassign(self):
+        self.assertFalse(purity.infer_purity(augassign_alias))
+
+    def test_loop_target_augassign(self):
+        self.assertFalse(purity.infer_purity(augassign_loop_target))
+
+    def test_fresh_augassign(self):
+        self.assertTrue(purity.infer_purity(augassign_fresh))
+
+    def test_consumes_iterator(self):
+        self.assertFalse(purity.infer_purity(consumes_iterator))
+
+    def test_global_rebound(self):
+        global helper
+        self.assertTrue(purity.infer_purity(calls_helper))
+        helper = mutates_argument
+        try:
+            self.assertFalse(purity.infer_purity(calls_helper))
+        finally:
+            helper = pure_arithmetic
+
+    def test_impure_callee(self):
+        self.assertFalse(purity.infer_purity(calls_impure))
+
+    def test_store_through_element(self):
+        self.assertFalse(purity.infer_purity(stores_through_element))
+
+    def test_method_of_element(self):
+        self.assertFalse(purity.infer_purity(calls_method_of_element))
+
+    def test_rebound_by_loop(self):
+        self.assertFalse(purity.infer_purity(rebinds_in_loop))
+
+    def test_out_argument_not_passed(self):
+        with out_argument_whitelisted(fake_ufunc):
+            self.assertTrue(purity.infer_purity(calls_ufunc))
+
+    def test_out_keyword(self):
+        with out_argument_whitelisted(fake_ufunc):
+            self.assertFalse(purity.infer_purity(calls_ufunc_out_keyword))
+
+    def test_out_positional(self):
+        with out_argument_whitelisted(fake_ufunc):
+            self.assertFalse(purity.infer_purity(calls_ufunc_out_positional))
+
+    def test_indirect_recursion(self):
+        self.assertFalse(purity.infer_purity(ping))
+        self.assertFalse(purity.infer_purity(pong))
+
+    def test_no_source(self):
+        f = eval("lambda x: x")
+        self.assertFalse(purity.infer_purity(f))
+
+    def test_cached(self):
+        purity.infer_purity(pure_arithmetic)
+        self.assertIn(pure_arithmetic.__code__, purity._analysed)
+
+
+class TestOutArguments(unittest.TestCase):
+
+    def test_functionality(self):
+        with out_argument_whitelisted(fake_ufunc):
+            actual = purity.functionality(fake_ufunc)
+        self.assertIsInstance(actual, purity.OutArguments)
+        self.assertEqual(2, actual.nin)
+
+    def test_not_functional_without_arguments(self):
+        with out_argument_whitelisted(fake_ufunc):
+            self.assertFalse(purity.is_functional(fake_ufunc))
+
+    def test_inputs(self):
+        self.assertTrue(purity.OutArguments(2).allows(2, [], False, False))
+
+    def test_other_keyword(self):
+        self.assertTrue(purity.OutArguments(2).allows(2, ["dtype"], False, False))
+
+    def test_out_keyword(self):
+        self.assertFalse(purity.OutArguments(2).allows(2, ["out"], False, False))
+
+    def test_out_positional(self):
+        self.assertFalse(purity.OutArguments(2).allows(3, [], False, False))
+
+    def test_starargs(self):
+        self.assertFalse(purity.OutArguments(2).allows(1, [], True, False))
+
+    def test_kwargs(self):
+        self.assertFalse(purity.OutArguments(2).allows(2, [], False, True))
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        self.assertFalse(purity.is_functional(numpy.add))
+        self.assertIsInstance(purity.functionality(numpy.add), purity.OutArguments)
+
+
+@decorators.functional
+def decorated():
+    print "Hello"
+
+class Unhashable(object):
+    __hash__ = None
+
+class FakeUfunc(object):
+    nin = 2
+    def __call__(self, a, b, out=None):
+        return a + b
+
+fake_ufunc = FakeUfunc()
+
+@contextlib.contextmanager
+def out_argument_whitelisted(func):
+    whitelist.out_argument_whitelist.add(func)
+    try:
+        yield
+    finally:
+        whitelist.out_argument_whitelist.discard(func)
+
+def pure_arithmetic(a, b=2):
+    c = 1
+    c += a * b
+    return math.sqrt(c)
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def fresh_container(n):
+    result = []
+    for i in range(n):
+        result.append(i)
+    lookup = {}
+    lookup["n"] = n
+    return result, lookup
+
+def calls_pure(n):
+    return pure_arithmetic(n) + fib(n)
+
+COUNTER = 0
+
+def writes_global():
+    global COUNTER
+    COUNTER += 1
+
+def mutates_argument(l):
+    l.append(1)
+
+def sets_item(l):
+    l[0] = 1
+
+def augassign_argument(l):
+    l += [1]
+
+def augassign_alias(l):
+    alias = l
+    alias += [1]
+
+def augassign_loop_target(l):
+    for x in l:
+        x += [1]
+
+def augassign_fresh(l):
+    result = []
+    result += l
+    return result
+
+def consumes_iterator(it):
+    return tuple(it)
+
+helper = pure_arithmetic
+
+def calls_helper(x):
+    return helper(x)
+
+def calls_impure(l):
+    return mutates_argument(l)
+
+def stores_through_element(arg):
+    x = [arg]
+    x[0].attr = 5
+
+def calls_method_of_element(arg):
+    x = [arg]
+    x[0].append(1)
+
+def rebinds_in_loop(args):
+    x = []
+    for x in args:
+        x.append(1)
+
+def calls_ufunc(a, b):
+    return fake_ufunc(a, b)
+
+def calls_ufunc_out_keyword(a, b, c):
+    return fake_ufunc(a, b, out=c)
+
+def calls_ufunc_out_positional(a, b, c):
+    return fake_ufunc(a, b, c)
+
+def ping(n):
+    return pong(n)
+
+def pong(l):
+    l.append(1)
+    return ping(l)
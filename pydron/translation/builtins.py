@@ -1,6 +1,18 @@
 
-__pydron_unbound__ = object()
-__pydron_unbound_nocheck__ = object()
+class _Marker(object):
+    """
+    Unique marker object. Unpickles to the very same instance, so
+    that `is` comparisons still work after transfer.
+    """
+    def __init__(self, name):
+        self.name = name
+    def __reduce__(self):
+        return self.name
+    def __repr__(self):
+        return self.name
+
+__pydron_unbound__ = _Marker("__pydron_unbound__")
+__pydron_unbound_nocheck__ = _Marker("__pydron_unbound_nocheck__")
 
 def __pydron_unbound_check__(value):
     if value is __pydron_unbound__:
@@ -156,11 +168,53 @@ class __pydron_iter__(object):
         except StopIteration:
             return self.END
         
+def __pydron_unroll__(iterable):
+    """
+    Marks the iterable of a `for` loop whose iterations are independent
+    of each other. See :class:`defor.DeFor`.
+    """
+    return iterable
+
+def __pydron_reduce__(acc, value, op):
+    """
+    One step of a reduction in a loop. Same as `acc += value`,
+    `acc *= value`, `min(acc, value)`, `max(acc, value)`, or 
+    `acc.append(value)`, depending on `op`. Returns the new
+    value of `acc`.
+    """
+    if op == "+=":
+        acc += value
+    elif op == "*=":
+        acc *= value
+    elif op == "min":
+        acc = min(acc, value)
+    elif op == "max":
+        acc = max(acc, value)
+    elif op == "append":
+        acc.append(value)
+    else:
+        raise ValueError("Unknown reduction: %r" % op)
+    return acc
+
 def __pydron_next__(it):
     return it.next(), it
 def __pydron_hasnext__(it):
     return it.hasnext()
-    
+
+def __pydron_map__(iterable, target_position, func, *args):
+    """
+    Same as `[func(*args) for item in iterable]` with `item` inserted
+    into `args` at index `target_position`.
+    """
+    return [func(*map_args(args, target_position, item)) for item in iterable]
+
+def map_args(args, target_position, item):
+    """
+    Returns the arguments for one invocation of the function passed
+    to :func:`__pydron_map__`.
+    """
+    return args[:target_position] + (item,) + args[target_position:]
+
 
 __all__ = [var for var in globals().keys() if var.startswith("__pydron")]
 
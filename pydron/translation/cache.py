@@ -0,0 +1,240 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+"""
+Caches translated functions so that `@schedule` functions are only
+translated once per process.
+"""
+
+import threading
+import logging
+import hashlib
+import os
+import tempfile
+import cPickle as pickle
+
+import pydron
+from pydron.translation import translator
+
+logger = logging.getLogger(__name__)
+
+#: Suggested location for :class:`DiskCache`.
+DEFAULT_CACHE_DIRECTORY = os.path.join("~", ".cache", "pydron")
+
+#: Name of the environment variable that enables the on-disk cache
+#: for :data:`translation_cache`. The value is the cache directory.
+CACHE_DIRECTORY_ENV = "PYDRON_TRANSLATION_CACHE"
+
+
+class TranslationCache(object):
+    """
+    Per-process cache of :class:`tasks.ScheduledCallable` instances
+    returned by :func:`translator.translate_function`.
+
+    Entries are keyed by the module and the code object of the
+    translated function. Function objects created repeatedly from the same
+    code (nested definitions, for example) therefore share one translation.
+
+    If the code of a function changes (`reload()` or by assigning
+    `func_code`) then the old entry is invalidated and the function
+    is translated again.
+
+    :attr:`hits` Number of lookups that found a valid entry.
+    :attr:`misses` Number of lookups that required a translation.
+    :attr:`invalidations` Number of entries dropped because the code changed.
+    """
+
+    def __init__(self, disk_cache=None):
+        """
+        :param disk_cache: Optional :class:`DiskCache` consulted before a
+          function gets translated.
+        """
+        self.disk_cache = disk_cache
+        self._lock = threading.Lock()
+
+        #: maps `_key(...)` to `(code, scheduled_callable)`.
+        self._entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def translate(self, function, scheduler_factory, **kwargs):
+        """
+        Returns the :class:`tasks.ScheduledCallable` for `function`.
+
+        :param scheduler_factory: Callable without arguments that returns the
+          scheduler passed to :func:`translator.translate_function`. Only
+          invoked if the function has to be translated.
+
+        :param kwargs: Passed on to :func:`translator.translate_function`.
+          They are part of the cache key.
+        """
+        code = function.func_code
+        key = self._key(function, code, kwargs)
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                cached_code, scheduled_callable = entry
+                if cached_code is code:
+                    self.hits += 1
+                    return scheduled_callable
+                else:
+                    logger.debug("Code of %r has changed, invalidating its translation." % function)
+                    del self._entries[key]
+                    self.invalidations += 1
+            self.misses += 1
+
+        # Translate without holding the lock. Two threads might translate
+        # the same function concurrently, but that is harmless.
+        scheduler = scheduler_factory()
+        if self.disk_cache is not None:
+            funcdeftask = self.disk_cache.translate_function_def(function, scheduler, **kwargs)
+        else:
+            funcdeftask = translator.translate_function_def(function, scheduler, **kwargs)
+        scheduled_callable = translator.make_scheduled_callable(function, funcdeftask)
+
+        with self._lock:
+            self._entries[key] = (code, scheduled_callable)
+
+        return scheduled_callable
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "TranslationCache(entries=%s, hits=%s, misses=%s, invalidations=%s)" % (
+                len(self), self.hits, self.misses, self.invalidations)
+
+    @staticmethod
+    def _key(function, code, kwargs):
+        """
+        The key identifies the place where the function is defined. The code
+        object itself is stored in the entry so that we can detect if it has
+        changed.
+        """
+        module_name = getattr(function, "__module__", None)
+        location = (code.co_filename, code.co_firstlineno, code.co_name)
+        return (module_name, location, tuple(sorted(kwargs.iteritems())))
+
+
+class DiskCache(object):
+    """
+    Stores the :class:`tasks.FunctionDefTask` produced by
+    :func:`translator.translate_function_def` on disk, so that new processes
+    don't have to translate the functions again.
+    
+    The entries are keyed by a hash of the source code of the function, 
+    the module name, and the pydron version. The scheduler is not
+    stored, the one passed to :meth:`translate_function_def` is used
+    instead.
+    
+    Entries that cannot be loaded are treated as if they did not exist.
+    
+    :attr:`hits` Number of translations loaded from disk.
+    :attr:`misses` Number of translations that had to be made.
+    """
+    
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.hits = 0
+        self.misses = 0
+        
+    def translate_function_def(self, function, scheduler, **kwargs):
+        """
+        Same as :func:`translator.translate_function_def` but uses
+        the cached result if there is one.
+        """
+        key = self.key(function, kwargs)
+        
+        funcdeftask = self.load(key, scheduler)
+        if funcdeftask is not None:
+            self.hits += 1
+            return funcdeftask
+        
+        self.misses += 1
+        funcdeftask = translator.translate_function_def(function, scheduler, **kwargs)
+        self.store(key, funcdeftask, scheduler)
+        return funcdeftask
+    
+    def key(self, function, kwargs={}):
+        """
+        Returns the hex-digest under which the translation of `function` is stored.
+        """
+        h = hashlib.sha1()
+        h.update(pydron.__version__)
+        h.update("\0")
+        h.update(translator.function_module_name(function))
+        h.update("\0")
+        h.update(repr(sorted(kwargs.iteritems())))
+        h.update("\0")
+        h.update(translator.function_source(function))
+        return h.hexdigest()
+        
+    def load(self, key, scheduler):
+        """
+        Returns the cached :class:`tasks.FunctionDefTask` or `None`.
+        """
+        filename = self._filename(key)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "rb") as f:
+                unpickler = pickle.Unpickler(f)
+                unpickler.persistent_load = lambda pid: scheduler
+                return unpickler.load()
+        except Exception:
+            logger.warn("Ignoring unreadable translation cache entry %r." % filename, exc_info=True)
+            return None
+        
+    def store(self, key, funcdeftask, scheduler):
+        """
+        Writes the task to disk. Failures are logged but otherwise ignored.
+        """
+        filename = self._filename(key)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+                
+            # Write to a temporary file first so that concurrent
+            # readers never see an incomplete entry.
+            fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                    pickler.persistent_id = lambda obj: "scheduler" if obj is scheduler else None
+                    pickler.dump(funcdeftask)
+                os.rename(tmpname, filename)
+            except:
+                os.remove(tmpname)
+                raise
+        except Exception:
+            logger.warn("Failed to write translation cache entry %r." % filename, exc_info=True)
+            
+    def _filename(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+    
+    def __repr__(self):
+        return "DiskCache(%r)" % self.directory
+
+
+def _default_disk_cache():
+    directory = os.environ.get(CACHE_DIRECTORY_ENV, None)
+    if directory:
+        return DiskCache(directory)
+    else:
+        return None
+
+#: Cache used by :func:`pydron.schedule`. It uses a :class:`DiskCache` if
+#: the environment variable `PYDRON_TRANSLATION_CACHE` is set.
+translation_cache = TranslationCache(_default_disk_cache())
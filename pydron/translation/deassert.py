@@ -16,6 +16,8 @@ class DeAssert(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features = {'raise', 'complexexpr'}
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
         pass
     
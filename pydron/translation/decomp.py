@@ -1,10 +1,18 @@
 # Copyright (C) 2014 Stefan C. Mueller
 
 import ast
-from pydron.translation.astwriter import mk_call, mk_tuple
+from pydron.translation.astwriter import mk_call, mk_tuple, mk_num
 from pydron.translation import transformer
 
 class DeComp(transformer.AbstractTransformer):
+    """
+    Replaces set and dict comprehensions with list comprehensions.
+    
+    List comprehensions that just call a function for each element,
+    such as `[f(a, x) for x in lst]`, are replaced by a call
+    to `__pydron_map__` which is translated into a task that can
+    evaluate the elements in parallel.
+    """
     
     #: List of features that this transformer expects to be
     #: absent in the input AST. 
@@ -16,13 +24,49 @@ class DeComp(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features =  {'listcomp', 'complexexpr'}
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
-        pass
+        self.blocks = []
+        
+    def visit_Module(self, node):
+        return self._visit_block(node)
+    
+    def visit_ClassDef(self, node):
+        return self._visit_block(node)
+    
+    def visit_FunctionDef(self, node):
+        return self._visit_block(node)
+    
+    def visit_Lambda(self, node):
+        return self._visit_block(node)
+    
+    def _visit_block(self, node):
+        self.blocks.append(node)
+        node = self.generic_visit(node)
+        self.blocks.pop()
+        return node
+    
+    def visit_ListComp(self, node):
+        node = self.generic_visit(node)
+        return self._listcomp(node)
+    
+    def _listcomp(self, node):
+        if not self._is_map(node):
+            return node
+        
+        target = node.generators[0].target.id
+        call = node.elt
+        
+        target_position = [i for i, arg in enumerate(call.args) if _is_name(arg, target)][0]
+        args = [arg for i, arg in enumerate(call.args) if i != target_position]
+        
+        return mk_call('__pydron_map__', [node.generators[0].iter, mk_num(target_position), call.func] + args)
     
     def visit_SetComp(self, node):
         node = self.generic_visit(node)
         listexpr = ast.ListComp(elt=node.elt, generators=node.generators)
-        return mk_call('set', [listexpr])
+        return mk_call('set', [self._listcomp(listexpr)])
     
     def visit_DictComp(self, node):
         node = self.generic_visit(node)
@@ -30,4 +74,76 @@ class DeComp(transformer.AbstractTransformer):
         listexpr = ast.ListComp(elt=elt, generators=node.generators)
         return mk_call('dict', [listexpr])
     
-    
\ No newline at end of file
+    def _is_map(self, node):
+        """
+        Checks if the comprehension can be replaced by `__pydron_map__`.
+        
+        The function and the other arguments are evaluated only once,
+        so they have to be free of side effects. The target variable
+        must not be used outside of the comprehension since
+        `__pydron_map__` does not assign it.
+        """
+        if len(node.generators) != 1:
+            return False
+        generator = node.generators[0]
+        if generator.ifs or not isinstance(generator.target, ast.Name):
+            return False
+        target = generator.target.id
+        
+        call = node.elt
+        if not isinstance(call, ast.Call):
+            return False
+        if call.keywords or call.starargs or call.kwargs:
+            return False
+        
+        if len([arg for arg in call.args if _is_name(arg, target)]) != 1:
+            return False
+        for expr in [call.func] + call.args:
+            if not _is_name(expr, target):
+                if not _is_simple(expr) or _uses_name(expr, target):
+                    return False
+        
+        # The variable of a list comprehension remains assigned after the
+        # comprehension. We only have to care about this in functions.
+        if not self.blocks or not isinstance(self.blocks[-1], (ast.FunctionDef, ast.Lambda)):
+            return False
+        block = self.blocks[-1]
+        for n in ast.walk(block):
+            if isinstance(n, ast.Global) and target in n.names:
+                return False
+        if _unbound_uses(block, target) > 0:
+            return False
+        
+        return True
+    
+def _is_name(node, identifier):
+    return isinstance(node, ast.Name) and node.id == identifier
+
+def _uses_name(node, identifier):
+    return any(_is_name(n, identifier) for n in ast.walk(node))
+
+def _unbound_uses(node, identifier):
+    """
+    Counts the occurrences of the variable that are not bound by a
+    comprehension within `node`.
+    """
+    if _is_name(node, identifier):
+        return 1
+    comprehensions = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+    if isinstance(node, comprehensions):
+        if any(_is_name(generator.target, identifier) for generator in node.generators):
+            # The iterable of the first generator is evaluated before
+            # the variable is assigned.
+            return _unbound_uses(node.generators[0].iter, identifier)
+    return sum(_unbound_uses(child, identifier) for child in ast.iter_child_nodes(node))
+
+def _is_simple(node):
+    """
+    Expressions that we can evaluate once instead of once per element.
+    """
+    if isinstance(node, (ast.Name, ast.Num, ast.Str)):
+        return True
+    elif isinstance(node, ast.Attribute):
+        return _is_simple(node.value)
+    else:
+        return False
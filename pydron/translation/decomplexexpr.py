@@ -50,6 +50,8 @@ class DeComplexExpr(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features = {'funcdefaultvalues' , 'overwrite', 'for'}
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
         self.id_factory = id_factory
         self.stack = []
@@ -19,6 +19,8 @@ class DeDecorator(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features = {'complexexpr'}
     
+    requires_scopes = False
+    
     
     def __init__(self, id_factory):
         self.id_factory = id_factory
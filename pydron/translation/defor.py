@@ -13,6 +13,17 @@ from pydron.translation import transformer
 class DeFor(transformer.AbstractTransformer):
     """
     Replaces `for` loops with `while` loops.
+    
+    Loops inside functions whose iterations don't depend on each other
+    are kept. Their iterable is wrapped in a call to `__pydron_unroll__`
+    which tells the translator that it may run the iterations in parallel.
+    An iteration depends on the previous one if it reads a variable
+    before assigning it, or if it assigns a variable only conditionally.
+    
+    Reductions are not considered a dependency. These are statements of
+    the form `v += e`, `v *= e`, `v = min(v, e)`, `v = max(v, e)` and
+    `v.append(e)` where `v` is not used anywhere else in the loop. They
+    are replaced by `v = __pydron_reduce__(v, e, op)`.
     """
     
     #: List of features that this transformer expects to be
@@ -20,18 +31,44 @@ class DeFor(transformer.AbstractTransformer):
     unsupported_features = set()
     
     #: List of features that are removed from the AST.
-    removed_features = {'for'}
+    #: Independent loops remain, so `for` is not removed.
+    removed_features = set()
     
     #: List of features added to the AST.
-    added_features =  {'while', 'overwrite'}
+    added_features =  {'while', 'overwrite', 'complexexpr'}
+    
+    requires_scopes = False
 
     def __init__(self, id_factory):
         self.id_factory = id_factory
+        self.blocks = []
+        
+    def visit_Module(self, node):
+        return self._visit_block(node)
+    
+    def visit_ClassDef(self, node):
+        return self._visit_block(node)
+    
+    def visit_FunctionDef(self, node):
+        return self._visit_block(node)
+    
+    def _visit_block(self, node):
+        self.blocks.append(node)
+        node = self.generic_visit(node)
+        self.blocks.pop()
+        return node
 
     def visit_For(self, node):
         
         node = self.generic_visit(node)
         
+        if self._is_unrollable(node):
+            body = self._replace_reductions(node.body, node.target.id)
+            if not _carried_names(body):
+                node.body = body
+                node.iter = mk_call("__pydron_unroll__", [node.iter])
+                return node
+        
         iterator_id = self.id_factory("iterator")
         iter_stmt = mk_assign(iterator_id, mk_call("__pydron_iter__", [node.iter]))
     
@@ -46,3 +83,142 @@ class DeFor(transformer.AbstractTransformer):
         
         return [iter_stmt, while_stmt]
     
+    def _is_unrollable(self, node):
+        """
+        Checks if the loop is one we could run in parallel if
+        there are no dependencies between the iterations.
+        """
+        if not self.blocks or not isinstance(self.blocks[-1], ast.FunctionDef):
+            return False
+        if node.orelse or not isinstance(node.target, ast.Name):
+            return False
+        
+        interrupts = (ast.Break, ast.Continue, ast.Return, ast.Yield,
+                      ast.FunctionDef, ast.ClassDef, ast.Lambda)
+        if any(isinstance(n, interrupts) for stmt in node.body for n in ast.walk(stmt)):
+            return False
+        
+        global_names = {name for n in ast.walk(self.blocks[-1]) if isinstance(n, ast.Global) for name in n.names}
+        if global_names & _stored_names(node.body):
+            return False
+        
+        return True
+    
+    def _replace_reductions(self, body, target):
+        """
+        Returns a copy of the loop body with reductions replaced by
+        calls to `__pydron_reduce__`.
+        """
+        local_names = _stored_names(self.blocks[-1].body) | {a.id for a in self.blocks[-1].args.args if isinstance(a, ast.Name)}
+        
+        def uses(name):
+            if name == target:
+                return None
+            return sum(1 for stmt in body for n in ast.walk(stmt) if isinstance(n, ast.Name) and n.id == name)
+        
+        body = list(body)
+        removed = set()
+        for i, stmt in enumerate(body):
+            if isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name):
+                ops = {ast.Add: "+=", ast.Mult: "*="}
+                var = stmt.target.id
+                if type(stmt.op) in ops and uses(var) == 1:
+                    body[i] = _reduce_statement(var, stmt.value, ops[type(stmt.op)])
+                    
+            elif (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and 
+                  isinstance(stmt.targets[0], ast.Name) and _is_call(stmt.value, 2)):
+                var = stmt.targets[0].id
+                func = stmt.value.func.id
+                acc, value = stmt.value.args
+                if (func in ("min", "max") and func not in local_names and 
+                        _is_name(acc, var) and uses(var) == 2):
+                    body[i] = _reduce_statement(var, value, func)
+                    
+            elif isinstance(stmt, ast.Expr) and _is_call(stmt.value, 1):
+                # `DeMembers` turned `v.append(e)` into `a = v.append` followed by `a(e)`.
+                method = stmt.value.func.id
+                lookups = [j for j, s in enumerate(body[:i]) if _is_append_lookup(s, method)]
+                if lookups and uses(method) == 2:
+                    var = body[lookups[0]].value.value.id
+                    if uses(var) == 1:
+                        removed.add(lookups[0])
+                        body[i] = _reduce_statement(var, stmt.value.args[0], "append")
+        return [stmt for i, stmt in enumerate(body) if i not in removed]
+    
+
+def _is_name(node, identifier):
+    return isinstance(node, ast.Name) and node.id == identifier
+
+def _is_call(node, numargs):
+    """
+    Checks for a call of a name with `numargs` positional arguments and nothing else.
+    """
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and 
+            len(node.args) == numargs and not node.keywords and 
+            node.starargs is None and node.kwargs is None)
+    
+def _is_append_lookup(stmt, method):
+    """
+    Checks for `method = v.append`.
+    """
+    return (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and
+            _is_name(stmt.targets[0], method) and 
+            isinstance(stmt.value, ast.Attribute) and stmt.value.attr == "append" and
+            isinstance(stmt.value.value, ast.Name))
+
+def _reduce_statement(var, value, op):
+    return mk_assign(var, mk_call("__pydron_reduce__", [mk_name(var), value, mk_str(op)]))
+
+def _reduction(stmt):
+    """
+    Returns `(variable, value, op)` if `stmt` is `variable = __pydron_reduce__(variable, value, op)`.
+    """
+    if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and 
+            isinstance(stmt.targets[0], ast.Name) and _is_call(stmt.value, 3) and
+            stmt.value.func.id == "__pydron_reduce__"):
+        return stmt.targets[0].id, stmt.value.args[1], stmt.value.args[2].s
+    return None
+    
+
+def _stored_names(statements):
+    return {n.id for stmt in statements for n in ast.walk(stmt) 
+            if isinstance(n, ast.Name) and isinstance(n.ctx, (ast.Store, ast.Del))}
+
+def _assigned_names(stmt):
+    """
+    Names that are unconditionally assigned by `stmt`.
+    """
+    if not isinstance(stmt, ast.Assign):
+        return set()
+    names = set()
+    for target in stmt.targets:
+        elts = target.elts if isinstance(target, (ast.Tuple, ast.List)) else [target]
+        for elt in elts:
+            if not isinstance(elt, ast.Name):
+                return set()
+            names.add(elt.id)
+    return names
+
+def _carried_names(body):
+    """
+    Returns the names of the variables through which an iteration
+    of a loop with the given body depends on the previous one.
+    """
+    stored = _stored_names(body)
+    assigned = set()
+    carried = set()
+    for stmt in body:
+        reduction = _reduction(stmt)
+        if reduction:
+            # The iteration only computes its part of the reduction.
+            stmt = mk_assign(reduction[0], reduction[1])
+        
+        loaded = {n.id for n in ast.walk(stmt) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+        carried |= (loaded & stored) - assigned
+        
+        # Conditional assignments keep the value of the previous iteration
+        # if they don't execute, the same holds for augmented assignments.
+        definite = _assigned_names(stmt)
+        carried |= _stored_names([stmt]) - definite - assigned
+        assigned |= definite
+    return carried
@@ -61,7 +61,7 @@ class DeGlobal(transformer.AbstractTransformer):
             raise ValueError("Unhandled assignment to a global variable: %s." % node.id)
         
     def visit_Assign(self, node):
-        node.value = self.generic_visit(node.value)
+        node.value = self.visit(node.value)
         
         if self.inside_module():
             return node
@@ -23,6 +23,8 @@ class DeImport(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features =  {'complexexpr', 'global', 'for'}
     
+    requires_scopes = False
+    
     
     def __init__(self, id_factory):
         self.id_factory = id_factory
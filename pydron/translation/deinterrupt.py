@@ -18,6 +18,8 @@ class DeInterrupt(AbstractTransformer):
     #: List of features added to the AST.
     added_features =  {'complexexpr', 'boolop' , 'overwrite'}
     
+    requires_scopes = False
+    
     
     NONE = "0_none"
     CONTINUE = "1_continue"
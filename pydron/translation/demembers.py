@@ -18,6 +18,8 @@ class DeMembers(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features =  {'locals', 'global'}
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
         pass
     
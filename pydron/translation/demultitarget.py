@@ -16,6 +16,8 @@ class DeMultiTarget(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features = set()
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
         self.id_factory = id_factory
         
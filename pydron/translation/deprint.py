@@ -16,6 +16,8 @@ class DePrint(transformer.AbstractTransformer):
     #: List of features added to the AST.
     added_features = {'complexexpr'}
     
+    requires_scopes = False
+    
     def __init__(self, id_factory):
         pass
     
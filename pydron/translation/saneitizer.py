@@ -63,20 +63,21 @@ class Saneitizer(object):
         if not id_factory:
             id_factory = naming.UniqueIdentifierFactory()
         
-        def process_step(node, step_class):
-            scoping.ScopeAssigner().visit(node)
-            scoping.ExtendedScopeAssigner().visit(node)
-
+        for step_class in self.steps:
+            logger.debug("Applying step %s" % step_class)
+            
+            # Computing the scopes is expensive for large functions. Every
+            # step modifies the AST, so they have to be computed again, but
+            # only for the steps that actually read them.
+            if step_class.requires_scopes:
+                scoping.ScopeAssigner().visit(node)
+                scoping.ExtendedScopeAssigner().visit(node)
+            
             step = step_class(id_factory)
             node = step.visit(node)
             
-            return node
-        
-        
-        for step_class in self.steps:
-            logger.debug("Applying step %s" % step_class)
-            node = process_step(node, step_class)
-            logger.debug("After %s:\n" % step_class + astor.to_source(node))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("After %s:\n" % step_class + astor.to_source(node))
 
         node = ast.fix_missing_locations(node)
             
@@ -0,0 +1,134 @@
+# Copyright (C) 2015 Stefan C. Mueller
+
+import unittest
+import types
+import tempfile
+import shutil
+import os
+from pydron.translation import cache
+from pydron.dataflow import utils
+
+
+def make_function():
+    def f():
+        return None
+    return f
+
+def reload_function(f):
+    """
+    Returns a function with a new code object for the same source location,
+    as `reload()` would.
+    """
+    c = f.func_code
+    code = types.CodeType(c.co_argcount, c.co_nlocals, c.co_stacksize, c.co_flags,
+                          c.co_code, c.co_consts, c.co_names, c.co_varnames,
+                          c.co_filename, c.co_name, c.co_firstlineno, c.co_lnotab)
+    return types.FunctionType(code, f.func_globals)
+
+class Scheduler(object):
+    pass
+
+
+class TestTranslationCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.target = cache.TranslationCache()
+        self.schedulers = []
+        
+    def scheduler_factory(self):
+        self.schedulers.append("scheduler")
+        return "scheduler"
+    
+    def test_miss(self):
+        callee = self.target.translate(make_function(), self.scheduler_factory)
+        self.assertEqual("f", callee.func_name)
+        self.assertEqual(0, self.target.hits)
+        self.assertEqual(1, self.target.misses)
+        
+    def test_hit(self):
+        f = make_function()
+        first = self.target.translate(f, self.scheduler_factory)
+        second = self.target.translate(f, self.scheduler_factory)
+        self.assertIs(first, second)
+        self.assertEqual(1, self.target.hits)
+        self.assertEqual(1, self.target.misses)
+        self.assertEqual(1, len(self.schedulers))
+        
+    def test_same_code_different_function(self):
+        first = self.target.translate(make_function(), self.scheduler_factory)
+        second = self.target.translate(make_function(), self.scheduler_factory)
+        self.assertIs(first, second)
+        self.assertEqual(1, self.target.hits)
+        
+    def test_code_changed(self):
+        first = self.target.translate(make_function(), self.scheduler_factory)
+        f = reload_function(make_function())
+        second = self.target.translate(f, self.scheduler_factory)
+        self.assertIsNot(first, second)
+        self.assertEqual(0, self.target.hits)
+        self.assertEqual(2, self.target.misses)
+        self.assertEqual(1, self.target.invalidations)
+        self.assertEqual(1, len(self.target))
+        
+    def test_clear(self):
+        f = make_function()
+        self.target.translate(f, self.scheduler_factory)
+        self.target.translate(f, self.scheduler_factory)
+        self.target.clear()
+        self.assertEqual(0, len(self.target))
+        self.assertEqual(0, self.target.hits)
+        self.assertEqual(0, self.target.misses)
+
+
+class TestDiskCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.target = cache.DiskCache(self.directory)
+        
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        
+    def test_miss(self):
+        task = self.target.translate_function_def(make_function(), "scheduler")
+        self.assertEqual("f", task.name)
+        self.assertEqual(0, self.target.hits)
+        self.assertEqual(1, self.target.misses)
+        self.assertEqual(1, len(os.listdir(self.directory)))
+        
+    def test_hit(self):
+        first = self.target.translate_function_def(make_function(), "scheduler")
+        
+        # new instance, as if we were in a different process.
+        self.target = cache.DiskCache(self.directory)
+        second = self.target.translate_function_def(make_function(), "scheduler")
+        
+        self.assertEqual(1, self.target.hits)
+        self.assertEqual(0, self.target.misses)
+        utils.assert_graph_equal(first.graph, second.graph)
+        
+    def test_scheduler_not_stored(self):
+        self.target.translate_function_def(make_function(), Scheduler())
+        scheduler = Scheduler()
+        second = self.target.translate_function_def(make_function(), scheduler)
+        self.assertEqual(1, self.target.hits)
+        self.assertIs(scheduler, second.scheduler)
+        
+    def test_corrupt_entry(self):
+        f = make_function()
+        key = self.target.key(f)
+        with open(os.path.join(self.directory, key + ".pickle"), "wb") as fp:
+            fp.write("garbage")
+        
+        task = self.target.translate_function_def(f, "scheduler")
+        self.assertEqual("f", task.name)
+        self.assertEqual(1, self.target.misses)
+        
+    def test_translation_cache_uses_disk(self):
+        self.target.translate_function_def(make_function(), "scheduler")
+        
+        translation_cache = cache.TranslationCache(self.target)
+        callee = translation_cache.translate(make_function(), lambda:"scheduler")
+        self.assertEqual("f", callee.func_name)
+        self.assertEqual(1, translation_cache.misses)
+        self.assertEqual(1, self.target.hits)
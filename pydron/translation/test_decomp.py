@@ -59,3 +59,91 @@ class TestDeComp(unittest.TestCase):
             return set([set([y for y in x]) for x in lst])
         """
         utils.compare(src, expected, decomp.DeComp)
+    
+    def test_map(self):
+        src = """
+        def test():
+            return [f(x) for x in lst]
+        """
+        expected = """
+        def test():
+            return __pydron_map__(lst, 0, f)
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_args(self):
+        src = """
+        def test():
+            return [m.f(a, x, 1) for x in lst]
+        """
+        expected = """
+        def test():
+            return __pydron_map__(lst, 1, m.f, a, 1)
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_set(self):
+        src = """
+        def test():
+            return {f(x) for x in lst}
+        """
+        expected = """
+        def test():
+            return set(__pydron_map__(lst, 0, f))
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_same_target_twice(self):
+        src = """
+        def test():
+            return [f(x) for x in lst], [g(x) for x in lst]
+        """
+        expected = """
+        def test():
+            return __pydron_map__(lst, 0, f), __pydron_map__(lst, 0, g)
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_target_used_after(self):
+        src = """
+        def test():
+            y = [f(x) for x in lst]
+            return x
+        """
+        expected = """
+        def test():
+            y = [f(x) for x in lst]
+            return x
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_complex_arg(self):
+        src = """
+        def test():
+            return [f(g(), x) for x in lst]
+        """
+        expected = """
+        def test():
+            return [f(g(), x) for x in lst]
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_target_in_func(self):
+        src = """
+        def test():
+            return [x.f(x) for x in lst]
+        """
+        expected = """
+        def test():
+            return [x.f(x) for x in lst]
+        """
+        utils.compare(src, expected, decomp.DeComp)
+        
+    def test_map_module_level(self):
+        src = """
+        y = [f(x) for x in lst]
+        """
+        expected = """
+        y = [f(x) for x in lst]
+        """
+        utils.compare(src, expected, decomp.DeComp)
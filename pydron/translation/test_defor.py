@@ -52,3 +52,137 @@ class TestDeFor(unittest.TestCase):
             print "hello"
         """
         utils.compare(src, expected, defor.DeFor)
+
+    def test_independent(self):
+        src = """
+        def f(lst):
+            for x in lst:
+                y = x * 2
+                print y
+        """
+        expected = """
+        def f(lst):
+            for x in __pydron_unroll__(lst):
+                y = x * 2
+                print y
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_carried(self):
+        src = """
+        def f(lst):
+            y = 0
+            for x in lst:
+                y = y + x
+        """
+        expected = """
+        def f(lst):
+            y = 0
+            iterator__U0 = __pydron_iter__(lst)
+            while __pydron_hasnext__(iterator__U0):
+                x, iterator__U0 = __pydron_next__(iterator__U0)
+                y = y + x
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_augassign(self):
+        src = """
+        def f(lst):
+            y = 0
+            for x in lst:
+                y += x
+        """
+        expected = """
+        def f(lst):
+            y = 0
+            for x in __pydron_unroll__(lst):
+                y = __pydron_reduce__(y, x, '+=')
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_augassign_used(self):
+        src = """
+        def f(lst):
+            y = 0
+            for x in lst:
+                y += x
+                print y
+        """
+        expected = """
+        def f(lst):
+            y = 0
+            iterator__U0 = __pydron_iter__(lst)
+            while __pydron_hasnext__(iterator__U0):
+                x, iterator__U0 = __pydron_next__(iterator__U0)
+                y += x
+                print y
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_max(self):
+        src = """
+        def f(lst):
+            y = 0
+            for x in lst:
+                y = max(y, x * 2)
+        """
+        expected = """
+        def f(lst):
+            y = 0
+            for x in __pydron_unroll__(lst):
+                y = __pydron_reduce__(y, x * 2, 'max')
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_append(self):
+        src = """
+        def f(lst):
+            y = []
+            for x in lst:
+                attr__U0 = y.append
+                attr__U0(x * 2)
+        """
+        expected = """
+        def f(lst):
+            y = []
+            for x in __pydron_unroll__(lst):
+                y = __pydron_reduce__(y, x * 2, 'append')
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_conditional_assignment(self):
+        src = """
+        def f(lst):
+            for x in lst:
+                if x:
+                    y = x
+        """
+        expected = """
+        def f(lst):
+            iterator__U0 = __pydron_iter__(lst)
+            while __pydron_hasnext__(iterator__U0):
+                x, iterator__U0 = __pydron_next__(iterator__U0)
+                if x:
+                    y = x
+        """
+        utils.compare(src, expected, defor.DeFor)
+        
+    def test_assigned_before_conditional(self):
+        src = """
+        def f(lst):
+            for x in lst:
+                y = 0
+                if x:
+                    y = x
+                print y
+        """
+        expected = """
+        def f(lst):
+            for x in __pydron_unroll__(lst):
+                y = 0
+                if x:
+                    y = x
+                print y
+        """
+        utils.compare(src, expected, defor.DeFor)
+
@@ -59,6 +59,18 @@ class TestLocalizeGlobalVariables(unittest.TestCase):
         """
         utils.compare(src, expected, deglobal.DeGlobal)
         
+    def test_assign_global_value(self):
+        src = """
+        def test():
+            global x
+            x = y
+        """
+        expected = """
+        def test():
+            __pydron_assign_global__('x', __pydron_read_global__('y'))
+        """
+        utils.compare(src, expected, deglobal.DeGlobal)
+        
     def test_builtin(self):
         src = """
         def test():
@@ -7,11 +7,25 @@ from pydron.translation import utils, naming
 import astor
 import sys
 import StringIO as stringio
+import mock
+from pydron.translation import scoping
 
 class TestSaneitizer(unittest.TestCase):
     
     def test_print_le_table(self):
         print saneitizer.Saneitizer.feature_table()
+        
+    def test_scopes_only_for_steps_that_need_them(self):
+        src = """
+        def foo(x):
+            return [i for i in x]
+        """
+        node = ast.parse(utils.unindent(src))
+        
+        expected = len([s for s in saneitizer.Saneitizer.steps if s.requires_scopes])
+        with mock.patch.object(scoping, "ScopeAssigner", wraps=scoping.ScopeAssigner) as assigner:
+            saneitizer.Saneitizer().process(node)
+        self.assertEqual(expected, assigner.call_count)
 
 
     def testPrint(self):
@@ -98,6 +112,14 @@ class TestSaneitizer(unittest.TestCase):
         """
         self.execute(src, "2")
         
+    def testListCompMap(self):
+        src = """
+        def test():
+            print [pow(2, x) for x in [1,2,3]]
+        test() 
+        """
+        self.execute(src, "[2, 4, 8]")
+        
     def testSetComp(self):
         src = """
         def test():
@@ -256,6 +278,32 @@ class TestSaneitizer(unittest.TestCase):
         """
         self.execute(src, "hello world")
 
+    def test_independent_for(self):
+        src = """
+        def test():
+            for i in range(5):
+                j = i * 2
+                print j,
+            print j
+        test()
+        """
+        self.execute(src, "0 2 4 6 8 8")
+
+    def test_reduction_for(self):
+        src = """
+        def test():
+            total = 0
+            out = []
+            best = 0
+            for i in range(5):
+                total += i
+                out.append(i * 2)
+                best = max(best, i % 3)
+            print total, out, best
+        test()
+        """
+        self.execute(src, "10 [0, 2, 4, 6, 8] 2")
+
     def test_break(self):
         src = """
         def test():
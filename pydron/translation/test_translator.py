@@ -177,6 +177,68 @@ class TestTranslator(unittest.TestCase):
         callee = translator.translate_function(f, "scheduler", False)
         utils.assert_graph_equal(expected, callee.graph)
         
+    def test_for_unroll(self):
+        
+        def f(lst, k, x, y):
+            for x in __pydron_unroll__(lst):
+                y = x * k
+            return k
+            
+        callee = translator.translate_function(f, "scheduler", False, unroll_window=4)
+        loop = callee.graph.get_task(START_TICK + 1)
+        self.assertIsInstance(loop, tasks.UnrolledForTask)
+        self.assertEqual(4, loop.window)
+        self.assertEqual({"$iterable", "k", "x", "y"}, loop.input_ports())
+        
+    def test_for_unroll_disabled(self):
+        
+        def f(lst, k, x, y):
+            for x in __pydron_unroll__(lst):
+                y = x * k
+            return k
+            
+        callee = translator.translate_function(f, "scheduler", False)
+        loop = callee.graph.get_task(START_TICK + 2)
+        self.assertEqual(tasks.ForTask, type(loop))
+        
+    def test_for_unroll_carried(self):
+        
+        def f(lst, x, y):
+            for x in __pydron_unroll__(lst):
+                y = x * y
+            return y
+            
+        callee = translator.translate_function(f, "scheduler", False, unroll_window=4)
+        loop = callee.graph.get_task(START_TICK + 2)
+        self.assertEqual(tasks.ForTask, type(loop))
+        
+    def test_for_unroll_reduction(self):
+        
+        def f(lst, k, x, total):
+            for x in __pydron_unroll__(lst):
+                total = __pydron_reduce__(total, x * k, '+=')
+            return total
+            
+        callee = translator.translate_function(f, "scheduler", False, unroll_window=4)
+        loop = callee.graph.get_task(START_TICK + 1)
+        self.assertIsInstance(loop, tasks.UnrolledForTask)
+        self.assertEqual({"total": "+="}, loop.reductions)
+        self.assertEqual({"$iterable", "k", "x", "total"}, loop.input_ports())
+        
+    def test_for_reduction_carried(self):
+        
+        def f(lst, x, y, total):
+            for x in __pydron_unroll__(lst):
+                y = x * y
+                total = __pydron_reduce__(total, y, '+=')
+            return total
+            
+        callee = translator.translate_function(f, "scheduler", False, unroll_window=4)
+        loop = callee.graph.get_task(START_TICK + 2)
+        self.assertEqual(tasks.ForTask, type(loop))
+        body_tasks = [loop.body_graph.get_task(t) for t in loop.body_graph.get_all_ticks()]
+        self.assertIn(tasks.ReduceTask("+="), body_tasks)
+        
     def test_while(self):
         
         def f(x):
@@ -513,6 +575,39 @@ class TestTranslator(unittest.TestCase):
         callee = translator.translate_function(f, "scheduler", False)
         utils.assert_graph_equal(expected, callee.graph)
         
+    def test_call_map(self):
+        def f(a, lst):
+            return __pydron_map__(lst, 1, a, 2) #@UndefinedVariable
+        
+        expected = G(
+            C(START_TICK, "lst", 2, "iterable"),
+            C(START_TICK, "a", 2, "func"),
+            T(1, tasks.ConstTask(2), {'quick': True}),
+            C(1, "value", 2, "arg_0"),
+            T(2, tasks.MapTask(1, 1), {'syncpoint':True}),
+            C(2, "value", FINAL_TICK, "retval")
+        )
+        
+        callee = translator.translate_function(f, "scheduler", False)
+        utils.assert_graph_equal(expected, callee.graph)
+        
+    def test_call_map_guarded(self):
+        def f(lst):
+            return __pydron_map__(lst, 0, __pydron_read_global__("TestTranslator")) #@UndefinedVariable
+        
+        expected = G(
+            C(START_TICK, "lst", 3, "iterable"),
+            T(1, tasks.ConstTask("TestTranslator"), {'quick':True}),
+            C(1, "value", 2, "var"),
+            T(2, tasks.GuardTask(tasks.ReadGlobal(__name__)), {'quick': True}),
+            C(2, "value", 3, "func"),
+            T(3, tasks.MapTask(0, 0), {'syncpoint':True}),
+            C(3, "value", FINAL_TICK, "retval")
+        )
+        
+        callee = translator.translate_function(f, "scheduler", False)
+        utils.assert_graph_equal(expected, callee.graph)
+        
     def test_num(self):
         
         def f():
@@ -35,7 +35,13 @@ class AbstractTransformer(ast.NodeTransformer):
     
     #: List of features added to the AST.
     added_features = set()
-    
+
+    #: If `True` the transformer reads the scope information assigned
+    #: by :class:`scoping.ScopeAssigner` and :class:`scoping.ExtendedScopeAssigner`.
+    #: The :class:`saneitizer.Saneitizer` only (re-)computes the scopes
+    #: for transformers that need them.
+    requires_scopes = True
+
     def checked_visit(self, node):
         """
         Like :meth:`visit` but throws an exception if the input AST contains
@@ -4,11 +4,13 @@ import ast
 from pydron.translation import saneitizer, utils, naming, builtins
 from pydron.dataflow import graph, tasks
 from pydron.dataflow import utils as dataflowutils
+from pydron.dataflow import optimize as graphoptimize
 import inspect
 import enum
 import logging
 import sys
 import importlib
+import contextlib
 logger = logging.getLogger(__name__)
 
 class UnassignedLocalStrategy(enum.Enum):
@@ -33,6 +35,22 @@ class GraphFactory(object):
         # Variablenames that were assigned.
         # not all in varmap were assigned, see `unassinged_local_strategy`.
         self._assigned_vars = set()
+        
+        # Number of active :meth:`guarded` blocks.
+        self._guarded = 0
+        
+    @contextlib.contextmanager
+    def guarded(self):
+        """
+        Within this block all tasks, except constants, are wrapped in
+        :class:`tasks.GuardTask`. Their exceptions are only raised by the
+        consumers of their values.
+        """
+        self._guarded += 1
+        try:
+            yield
+        finally:
+            self._guarded -= 1
     
     def exec_task(self, task, inputs=[], autoconnect=False, quick=False, syncpoint=False, nosend_ports=None):
         """
@@ -47,6 +65,9 @@ class GraphFactory(object):
         :returns: tick
         """
         
+        if self._guarded and not isinstance(task, tasks.ConstTask):
+            task = tasks.GuardTask(task)
+        
         for subgraph in task.subgraphs():
             syncpoint |= dataflowutils.contains_sideeffects(subgraph)
         
@@ -159,15 +180,24 @@ class GraphFactory(object):
 
 class Translator(ast.NodeVisitor):
     
-    def __init__(self, id_factory, scheduler, module_name):
+    def __init__(self, id_factory, scheduler, module_name, unroll_window=None):
         """
         :param scheduler: Scheduler to be used by translated functions.
+        
+        :param unroll_window: Number of iterations of loops marked with
+          `__pydron_unroll__` that are instantiated at once. If `None` 
+          these loops run one iteration after the other.
         """
         self.id_factory = id_factory
         self.scheduler = scheduler
         self.module_name = module_name
+        self.unroll_window = unroll_window
         self.factory_stack = []
         
+        #: For each loop being translated, the reductions recognized in
+        #: its body, or `None` if the loop is not unrolled.
+        self.reductions_stack = []
+        
         
     def visit_Module(self, node):
         """
@@ -187,7 +217,7 @@ class Translator(ast.NodeVisitor):
         assert not node.decorator_list, "Not supported"
         
         # Default values become inputs to the task
-        defaults = {"default_%s" % i:self.visit(d) for i, d in enumerate(node.args.defaults)}
+        defaults = [(self.visit(d), "default_%s" % i) for i, d in enumerate(node.args.defaults)]
     
         factory = GraphFactory()
         
@@ -262,6 +292,24 @@ class Translator(ast.NodeVisitor):
             self.factory_stack[-1].assign_variable(target.elts[0].id, graph.Endpoint(tick, "value"))
             self.factory_stack[-1].assign_variable(target.elts[1].id, graph.Endpoint(tick, "iterator"))
             return 
+        
+        if (self.reductions_stack and self.reductions_stack[-1] is not None and
+            isinstance(node.value, ast.Call) and 
+            isinstance(node.value.func, ast.Name) and 
+            node.value.func.id == "__pydron_reduce__"):
+            
+            # The body only outputs the part of this iteration,
+            # the unrolled loop combines them.
+            assert isinstance(target, ast.Name)
+            op = node.value.args[2].s
+            part = self.visit(node.value.args[1])
+            if op == "append":
+                part = self.factory_stack[-1].exec_expr(tasks.ListTask(1), 
+                                                        [(part, "value_0")], 
+                                                        quick=True, syncpoint=False)
+            self.factory_stack[-1].assign_variable(target.id, part)
+            self.reductions_stack[-1][target.id] = op
+            return
 
         value = self.visit(node.value)
         
@@ -343,6 +391,13 @@ class Translator(ast.NodeVisitor):
     
     def visit_For(self, node):
         
+        iterable_node = node.iter
+        unroll = (isinstance(iterable_node, ast.Call) and 
+                  isinstance(iterable_node.func, ast.Name) and 
+                  iterable_node.func.id == "__pydron_unroll__")
+        if unroll:
+            iterable_node = iterable_node.args[0]
+        
         # Get rid of `break` but remember the AST expression that tells us when it executes
         body_statements, break_condition = _extract_break(node.body)
         
@@ -355,12 +410,14 @@ class Translator(ast.NodeVisitor):
         
         # Create the body graph. This still lacks the tail-recursive task, though.
         self.factory_stack.append(body_factory)
+        self.reductions_stack.append({} if unroll and self.unroll_window else None)
         for stmt in body_statements:
             self.visit(stmt)
         if break_condition:
             breaked = self.visit(break_condition)
         else:
             breaked = None
+        reductions = self.reductions_stack.pop()
         self.factory_stack.pop()
         body_factory.make_assigned_vars_outputs()
         body_graph = body_factory.get_graph()
@@ -395,8 +452,21 @@ class Translator(ast.NodeVisitor):
         
         # -- add the task for the complete loop to the current graph --
         
+        iterable = self.visit(iterable_node)
+        
+        if (unroll and self.unroll_window and breaked is None and 
+                tasks.is_independent_body(body_graph)):
+            fortask = tasks.UnrolledForTask(body_graph, orelse_graph, self.unroll_window, reductions=reductions)
+            self.factory_stack[-1].exec_task(fortask, inputs=
+                        [(iterable, "$iterable")],
+                        autoconnect=True)
+            return
+        
+        if reductions:
+            # The body only computes the parts of the reductions.
+            body_graph = tasks.accumulating_body(body_graph, reductions)
+        
         # Even before the loop, get an iterator from the iterable.
-        iterable = self.visit(node.iter)
         iterator = self.factory_stack[-1].exec_expr(tasks.IterTask(), inputs=[(iterable, 'iterable')], quick=True)
         
         # Finally we can add the loop task.
@@ -697,6 +767,9 @@ class Translator(ast.NodeVisitor):
         if isinstance(node.func, ast.Name) and node.func.id == "__pydron_exec__":
             return handle_builtin(3, builtins.__pydron_exec__, syncpoint=True)
         
+        if isinstance(node.func, ast.Name) and node.func.id == "__pydron_reduce__":
+            return handle_builtin(3, builtins.__pydron_reduce__, syncpoint=True)
+        
         if isinstance(node.func, ast.Name) and node.func.id == "__pydron_max__":
             return handle_builtin(2, builtins.__pydron_max__, syncpoint=False)
         
@@ -709,6 +782,26 @@ class Translator(ast.NodeVisitor):
         if isinstance(node.func, ast.Name) and node.func.id == "__pydron_next__":
             raise ValueError("__pydron_next__ can only be used with a tuple assignment.")
 
+        if isinstance(node.func, ast.Name) and node.func.id == "__pydron_map__":
+            assert len(node.args) >= 3
+            assert isinstance(node.args[1], ast.Num)
+            assert len(node.keywords) == 0
+            assert node.starargs is None
+            assert node.kwargs is None
+            numargs = len(node.args) - 3
+            task = tasks.MapTask(numargs, node.args[1].n)
+            inputs = [(self.visit(node.args[0]), "iterable")]
+            
+            # Python evaluates the function and the arguments only
+            # if there is at least one element.
+            with self.factory_stack[-1].guarded():
+                inputs.append((self.visit(node.args[2]), "func"))
+                for i in range(numargs):
+                    inputs.append((self.visit(node.args[3 + i]), "arg_%s" % i))
+            return self.factory_stack[-1].exec_expr(task,
+                                                    inputs,
+                                                    quick=False, syncpoint=True)
+
         numargs = len(node.args)
         keywords = [k.arg for k in node.keywords]
         
@@ -813,51 +906,93 @@ class Translator(ast.NodeVisitor):
 
         
 
-def translate_function(function, scheduler, saneitize=True):
+def translate_function(function, scheduler, saneitize=True, optimize=False, unroll_window=None, speculate=False):
     """
     Translates a function into a :class:`tasks.ScheduledCallable`.
+    
+    :param optimize: If `True` the passes in :mod:`optimize` are
+      run on the resulting graph.
+      
+    :param unroll_window: Number of iterations of independent `for` loops
+      that are instantiated at once. `None` disables unrolling.
+      
+    :param speculate: If `True` both branches of `if` statements without 
+      side-effects are evaluated before the condition is known
+      (see :func:`optimize.speculate_branches`).
+    """
+    funcdeftask = translate_function_def(function, scheduler, saneitize, optimize, unroll_window, speculate)
+    return make_scheduled_callable(function, funcdeftask)
+
+
+def function_source(function):
     """
+    Returns the source code of the given function.
+    """
+    source = inspect.getsourcelines(function)
+    return "".join(source[0])
+
+
+def function_module_name(function):
+    """
+    Returns the name of the module in which `function` is defined.
     
-    def main_workaround(module_name):
-        """
-        If the function is inside __main__ we have problem
-        since the workers will have a different module called
-        __main__.
-        So we make a best-effort attemt to find if __main__
-        is also reachable as a module.
-        """
-        if module_name != "__main__":
-            return module_name # we are fine.
-        
-        # See if we can find a sys.path that matches the location of __main__
-        main_file = getattr(sys.modules["__main__"], "__file__",  "")
-        candidates = {path for path in sys.path if main_file.startswith(path)}
-        candidates = sorted(candidates, key=len)
-        for candidate in candidates:
-            
-            # Try to create the absolute module name from the filename only.
-            module_name = main_file[len(candidate):]
-            if module_name.endswith(".py"):
-                module_name = module_name[:-3]
-            if module_name.endswith(".pyc"):
-                module_name = module_name[:-4]
-            module_name = module_name.replace("/", ".")
-            module_name = module_name.replace("\\", ".")
-            while module_name.startswith("."):
-                module_name = module_name[1:]
-                
-            # Check if it actually works.
-            try:
-                module = importlib.import_module(module_name)
-                return module.__name__
-            except ImportError:
-                pass
+    If the function is inside __main__ we have problem
+    since the workers will have a different module called
+    __main__.
+    So we make a best-effort attemt to find if __main__
+    is also reachable as a module.
+    """
+    module_name = getattr(function, "__module__", None)
+    if not module_name:
+        raise ValueError("Cannot translate %r: The module in which it is defined is unknown." % function)
+    
+    if module_name != "__main__":
+        return module_name # we are fine.
+    
+    # See if we can find a sys.path that matches the location of __main__
+    main_file = getattr(sys.modules["__main__"], "__file__",  "")
+    candidates = {path for path in sys.path if main_file.startswith(path)}
+    candidates = sorted(candidates, key=len)
+    for candidate in candidates:
+        
+        # Try to create the absolute module name from the filename only.
+        module_name = main_file[len(candidate):]
+        if module_name.endswith(".py"):
+            module_name = module_name[:-3]
+        if module_name.endswith(".pyc"):
+            module_name = module_name[:-4]
+        module_name = module_name.replace("/", ".")
+        module_name = module_name.replace("\\", ".")
+        while module_name.startswith("."):
+            module_name = module_name[1:]
             
-        # we were unlucky.
-        raise ValueError("The functions in the __main__ module cannot be translated.")
+        # Check if it actually works.
+        try:
+            module = importlib.import_module(module_name)
+            return module.__name__
+        except ImportError:
+            pass
+        
+    # we were unlucky.
+    raise ValueError("The functions in the __main__ module cannot be translated.")
+
+
+def translate_function_def(function, scheduler, saneitize=True, optimize=False, unroll_window=None, speculate=False):
+    """
+    Translates a function into a :class:`tasks.FunctionDefTask`.
     
-    source = inspect.getsourcelines(function)
-    source = "".join(source[0])
+    This is the expensive part of :func:`translate_function`. The
+    returned task only depends on the source code of the function, 
+    the module it is defined in, and the scheduler.
+    
+    :param optimize: If `True` the passes in :mod:`optimize` are
+      run on the resulting graph.
+      
+    :param unroll_window: See :func:`translate_function`.
+    
+    :param speculate: See :func:`translate_function`.
+    """
+    source = function_source(function)
     
     logger.info("Translating: \n%s" % source)
     
@@ -873,7 +1008,7 @@ def translate_function(function, scheduler, saneitize=True):
     
     if len(funcdef.args.defaults) != 0:
         # TODO add support
-        raise ValueError("Cannot translate %f: @schedule does not support functions with default arguments")
+        raise ValueError("Cannot translate %r: @schedule does not support functions with default arguments" % function)
 
     id_factory = naming.UniqueIdentifierFactory()
 
@@ -881,15 +1016,13 @@ def translate_function(function, scheduler, saneitize=True):
         makesane = saneitizer.Saneitizer()
         node = makesane.process(node, id_factory)
         
-    module_name = getattr(function, "__module__", None)
-    if not module_name:
-        raise ValueError("Cannot translate %f: The module in which it is defined is unknown.")
-    module_name = main_workaround(module_name)
+    module_name = function_module_name(function)
     
-    import astor
-    logger.info("Preprocessed source:\n%s" % astor.to_source(node))
+    if logger.isEnabledFor(logging.INFO):
+        import astor
+        logger.info("Preprocessed source:\n%s" % astor.to_source(node))
 
-    translator = Translator(id_factory, scheduler, module_name)
+    translator = Translator(id_factory, scheduler, module_name, unroll_window)
     graph = translator.visit(node)
     
     def find_FunctionDefTask(graph):
@@ -901,6 +1034,23 @@ def translate_function(function, scheduler, saneitize=True):
     
     funcdeftask = find_FunctionDefTask(graph)
     
+    if optimize:
+        before = graphoptimize.count_tasks(funcdeftask.graph)
+        graphoptimize.optimize(funcdeftask.graph)
+        after = graphoptimize.count_tasks(funcdeftask.graph)
+        logger.info("Optimized %s: %s tasks before, %s after." % (function.__name__, before, after))
+        
+    if speculate:
+        graphoptimize.speculate_branches(funcdeftask.graph)
+    
+    return funcdeftask
+
+
+def make_scheduled_callable(function, funcdeftask):
+    """
+    Creates the :class:`tasks.ScheduledCallable` for `function` from
+    the task returned by :func:`translate_function_def`.
+    """
     defaults = function.__defaults__
     if not defaults:
         defaults = tuple()
@@ -1,6 +1,41 @@
 from __future__ import print_function
 __author__ = 'Roman Bolzern'
 
+import math
+import operator
+
+#: Builtins that don't have side-effects. Those that iterate over an
+#: argument, such as `sum` or `tuple`, are not in here as they
+#: exhaust iterators passed to them.
+_builtins = {abs, bin, bool, chr, cmp, complex, divmod, float,
+             hash, hex, int, isinstance, issubclass, len, long,
+             oct, ord, pow, range, repr, round, str,
+             unichr, unicode, xrange}
+
+#: All functions from `math`.
+_math = {f for f in vars(math).itervalues() if callable(f)}
+
+#: Functions from `operator` except for those that change
+#: their arguments, such as `setitem` or `iadd`.
+_operator = {getattr(operator, name) for name in 
+             ("abs", "add", "and_", "concat", "contains", "countOf", "div",
+              "eq", "floordiv", "ge", "getitem", "getslice", "gt", "index",
+              "indexOf", "inv", "invert", "is_", "is_not", "le", "lshift",
+              "lt", "mod", "mul", "ne", "neg", "not_", "or_", "pos", "pow",
+              "repeat", "rshift", "sub", "truediv", "truth", "xor")}
+
+def _numpy_ufuncs():
+    try:
+        import numpy
+    except ImportError:
+        return set()
+    return {f for f in vars(numpy).itervalues() if isinstance(f, numpy.ufunc)}
+
 #: Set of callables that are assumed to be functional even without having a
 #: `@functional` decorator.
-functional_whitelist = {len, print}
+functional_whitelist = {len, print} | _builtins | _math | _operator
+
+#: Set of callables that are functional unless the call passes an `out`
+#: keyword argument or more positional arguments than the callable's
+#: `nin` attribute. These write their result into the given output.
+out_argument_whitelist = _numpy_ufuncs()
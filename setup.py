@@ -20,7 +20,6 @@ setup(
     packages = find_packages(),
     install_requires = ['astor>=0.4', 
                         'enum34>=1.0.4', 
-                        'frozendict>=0.4', 
                         'sortedcontainers>=0.9.5', 
                         'anycall>=0.2.3', 
                         'remoot>=2.1.2',